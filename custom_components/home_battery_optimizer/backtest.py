@@ -0,0 +1,260 @@
+"""
+Offline backtest: replay historical day-ahead prices through the planner and a simple battery model.
+
+    python -m custom_components.home_battery_optimizer.backtest prices.csv [--engine dp] [--workers 4]
+
+Prices are read from CSV (columns start[, end], price/value) or JSON (a list of
+{"start", "end", "value"} items, the Nordpool raw format) and streamed day by day.
+Each day is planned at 00:00 with that day's prices and replanned at the publish hour
+with the rest of the day plus tomorrow, as the live integration sees them.
+Months are simulated as independent shards on a process pool; every shard starts
+from the configured SoC.
+"""
+import argparse
+import csv
+import json
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from .const import PLANNER_HEURISTIC
+from .dp_optimizer import DEFAULT_CAPACITY_KWH
+from .planner import PlanInputs, plan
+from .price_series import PriceSeries, _to_timestamp
+from .schedule_store import ACTION_CHARGE, ACTION_DISCHARGE, SlotCalendar
+
+DEFAULT_PUBLISH_HOUR = 13  # Nordpool publicerar morgondagens priser runt 13:00
+
+DEFAULT_PARAMS = {
+    "soc": 50.0,
+    "charge_rate": 25.0,
+    "discharge_rate": 25.0,
+    "min_battery_soc": 0.0,
+    "max_battery_soc": 100.0,
+    "min_profit": 10.0,
+    "battery_capacity": DEFAULT_CAPACITY_KWH,
+    "planner_engine": PLANNER_HEURISTIC,
+    "publish_hour": DEFAULT_PUBLISH_HOUR,
+}
+
+_TOTALS = ("days", "slots", "cost", "charged_kwh", "discharged_kwh", "cycles", "savings")
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            price = row.get("price", row.get("value"))
+            if price in (None, ""):
+                continue
+            yield _to_timestamp(row["start"]), _to_timestamp(row.get("end") or None), float(price)
+
+
+def _read_json(path):
+    with open(path) as f:
+        items = json.load(f)
+    if isinstance(items, dict):
+        items = items.get("prices") or items.get("raw_today", []) + items.get("raw_tomorrow", [])
+    for item in items:
+        price = item.get("value", item.get("price"))
+        if price is None:
+            continue
+        yield _to_timestamp(item["start"]), _to_timestamp(item.get("end")), float(price)
+
+
+def read_prices(path):
+    """Yield (start_ts, end_ts, price) in time order. A missing end is taken from the next start."""
+    rows = _read_json(path) if path.endswith(".json") else _read_csv(path)
+    pending = None
+    for start, end, price in rows:
+        if pending is not None:
+            p_start, p_end, p_price = pending
+            yield p_start, p_end if p_end is not None else start, p_price
+        pending = (start, end, price)
+    if pending is not None:
+        p_start, p_end, p_price = pending
+        yield p_start, p_end if p_end is not None else p_start + 3600, p_price
+
+
+def iter_days(rows):
+    """Group price rows into (date_iso, bounds, prices) per local calendar day."""
+    day = None
+    bounds = array("d")
+    prices = array("d")
+    for start, end, price in rows:
+        date = datetime.fromtimestamp(start).date().isoformat()
+        if date != day:
+            if day is not None:
+                yield day, bounds, prices
+            day = date
+            bounds = array("d", [start])
+            prices = array("d")
+        elif end <= bounds[-1]:
+            # Dubblerad/överlappande rad (t.ex. vid sommartid): hoppa över
+            continue
+        bounds.append(end)
+        prices.append(price)
+    if day is not None:
+        yield day, bounds, prices
+
+
+class BatteryModel:
+    """Ideal battery: moves rate * slot length per active slot, clipped to the SoC limits."""
+
+    def __init__(self, capacity_kwh, soc, min_soc, max_soc, charge_rate, discharge_rate):
+        self.capacity_kwh = capacity_kwh
+        self.soc = soc
+        self.min_soc = min_soc
+        self.max_soc = max_soc
+        self.charge_rate = charge_rate
+        self.discharge_rate = discharge_rate
+        self.cost = 0.0
+        self.charged_kwh = 0.0
+        self.discharged_kwh = 0.0
+
+    def apply(self, action, price, slot_hours):
+        kwh_per_percent = self.capacity_kwh / 100
+        if action == ACTION_CHARGE and self.soc < self.max_soc:
+            moved = min(self.charge_rate * slot_hours, self.max_soc - self.soc)
+            self.soc += moved
+            self.charged_kwh += moved * kwh_per_percent
+            self.cost += price * moved * kwh_per_percent
+        elif action == ACTION_DISCHARGE and self.soc > self.min_soc:
+            moved = min(self.discharge_rate * slot_hours, self.soc - self.min_soc)
+            self.soc -= moved
+            self.discharged_kwh += moved * kwh_per_percent
+            self.cost -= price * moved * kwh_per_percent
+
+    @property
+    def cycles(self):
+        """Equivalent full cycles (discharged energy / capacity)."""
+        return self.discharged_kwh / self.capacity_kwh if self.capacity_kwh else 0.0
+
+
+def _series(today, tomorrow=None):
+    # Dagarna kan vara arrays eller memoryviews (delat minne i sweep), kopiera till nya arrays
+    _, bounds, prices = today
+    if tomorrow is not None and tomorrow[1][0] == bounds[-1]:
+        bounds = array("d", bounds[:-1])
+        bounds.extend(tomorrow[1])
+        prices = array("d", prices)
+        prices.extend(tomorrow[2])
+    return PriceSeries(SlotCalendar(array("d", bounds)), array("d", prices))
+
+
+def _inputs(params, price_data, soc, current_slot):
+    return PlanInputs(
+        price_data=price_data,
+        soc=soc,
+        current_slot=current_slot,
+        charge_rate=params["charge_rate"],
+        discharge_rate=params["discharge_rate"],
+        min_soc=params["min_battery_soc"],
+        max_soc=params["max_battery_soc"],
+        min_profit=params["min_profit"],
+        engine=params["planner_engine"],
+        capacity_kwh=params["battery_capacity"],
+    )
+
+
+def _execute(battery, schedule, start, stop):
+    calendar = schedule.calendar
+    for i in range(start, stop):
+        battery.apply(schedule.action[i], schedule.price[i], (calendar.end_ts(i) - calendar.start_ts(i)) / 3600)
+
+
+def backtest_days(days, params=None, lookahead=None):
+    """
+    Simulate consecutive days [(date_iso, bounds, prices), ...]; lookahead is the day after
+    the last one (only used as tomorrow's prices). Returns a result dict.
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    battery = BatteryModel(
+        params["battery_capacity"], params["soc"], params["min_battery_soc"], params["max_battery_soc"],
+        params["charge_rate"], params["discharge_rate"],
+    )
+    start_soc = battery.soc
+    slots = 0
+    price_sum = 0.0
+    for idx, today in enumerate(days):
+        tomorrow = days[idx + 1] if idx + 1 < len(days) else lookahead
+        bounds = today[1]
+        n = len(today[2])
+        publish_ts = datetime.fromtimestamp(bounds[0]).replace(hour=params["publish_hour"]).timestamp()
+        publish_slot = min(n, bisect_left(bounds, publish_ts))
+        # 00:00: bara dagens priser är kända
+        schedule, _ = plan(_inputs(params, _series(today), battery.soc, 0))
+        _execute(battery, schedule, 0, publish_slot)
+        # Publiceringstimmen: planera om med resten av dagen + morgondagen
+        schedule, _ = plan(_inputs(params, _series(today, tomorrow), battery.soc, publish_slot))
+        _execute(battery, schedule, publish_slot, n)
+        slots += n
+        price_sum += sum(today[2])
+    # Värdera SoC-skillnaden till snittpriset så att en full/tom slutställning inte ser ut som vinst
+    avg_price = price_sum / slots if slots else 0.0
+    soc_value = (battery.soc - start_soc) * battery.capacity_kwh / 100 * avg_price
+    return {
+        "first_day": days[0][0] if days else None,
+        "last_day": days[-1][0] if days else None,
+        "days": len(days),
+        "slots": slots,
+        "cost": round(battery.cost, 2),
+        "charged_kwh": round(battery.charged_kwh, 3),
+        "discharged_kwh": round(battery.discharged_kwh, 3),
+        "cycles": round(battery.cycles, 3),
+        "start_soc": round(start_soc, 2),
+        "end_soc": round(battery.soc, 2),
+        "savings": round(soc_value - battery.cost, 2),
+    }
+
+
+def iter_month_shards(days):
+    """Yield (month_days, lookahead_day) per calendar month."""
+    shard = []
+    for day in days:
+        if shard and day[0][:7] != shard[0][0][:7]:
+            yield shard, day
+            shard = []
+        shard.append(day)
+    if shard:
+        yield shard, None
+
+
+def merge_results(results):
+    """Sum month results into one report (months kept under "months")."""
+    results = sorted(results, key=lambda r: r["first_day"] or "")
+    total = {key: round(sum(r[key] for r in results), 3) for key in _TOTALS}
+    total["first_day"] = results[0]["first_day"] if results else None
+    total["last_day"] = results[-1]["last_day"] if results else None
+    total["months"] = results
+    return total
+
+
+def run_backtest(path, params=None, workers=None):
+    """Backtest a price file, one month shard per task. workers=1 runs in-process."""
+    shards = iter_month_shards(iter_days(read_prices(path)))
+    if workers == 1:
+        return merge_results([backtest_days(days, params, lookahead) for days, lookahead in shards])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Skicka varje månad så fort den är inläst
+        futures = [pool.submit(backtest_days, days, params, lookahead) for days, lookahead in shards]
+        return merge_results([future.result() for future in futures])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the battery planner on historical prices.")
+    parser.add_argument("path", help="CSV (start[,end],price) or JSON price file")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", dest="planner_engine", default=DEFAULT_PARAMS["planner_engine"])
+    parser.add_argument("--capacity", dest="battery_capacity", type=float, default=DEFAULT_PARAMS["battery_capacity"])
+    for key in ("soc", "charge_rate", "discharge_rate", "min_battery_soc", "max_battery_soc", "min_profit"):
+        parser.add_argument("--" + key.replace("_", "-"), dest=key, type=float, default=DEFAULT_PARAMS[key])
+    parser.add_argument("--publish-hour", dest="publish_hour", type=int, default=DEFAULT_PUBLISH_HOUR)
+    args = vars(parser.parse_args(argv))
+    path = args.pop("path")
+    workers = args.pop("workers")
+    print(json.dumps(run_backtest(path, args, workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,8 @@ from homeassistant import config_entries
 from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
 
-from .const import DOMAIN
+from .const import ATTRIBUTES_FULL, ATTRIBUTES_MODES, DEFAULT_UPDATE_DEBOUNCE, DOMAIN, PLANNER_HEURISTIC, PLANNERS
+from .self_use_controller import DEFAULT_ACTIVATE_AFTER, DEFAULT_DEACTIVATE_AFTER
 
 class HomeBatteryOptimizerConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 3
@@ -48,6 +49,25 @@ class HomeBatteryOptimizerOptionsFlow(config_entries.OptionsFlow):
             vol.Required("solar_entity", default=self.config_entry.data.get("solar_entity", "")): cv.string,
             vol.Required("consumption_entity", default=self.config_entry.data.get("consumption_entity", "")): cv.string,
             vol.Required("battery_power_entity", default=self.config_entry.data.get("battery_power_entity", "")): cv.string,
+            # Planeringsmotor: stepwise-heuristik eller exakt DP-optimering
+            vol.Optional("planner_engine", default=self.config_entry.options.get("planner_engine", PLANNER_HEURISTIC)): vol.In(PLANNERS),
+            vol.Optional("battery_capacity", default=self.config_entry.options.get("battery_capacity", 10.0)): vol.Coerce(float),
+            # Sensorattribut: kompakt kolumnformat och/eller utan passerade slots
+            vol.Optional("attributes_mode", default=self.config_entry.options.get("attributes_mode", ATTRIBUTES_FULL)): vol.In(ATTRIBUTES_MODES),
+            vol.Optional("trim_passed_slots", default=self.config_entry.options.get("trim_passed_slots", False)): cv.boolean,
+            # Sekunder som tätt liggande sensoruppdateringar slås ihop till en ombyggnad
+            vol.Optional("update_debounce_seconds", default=self.config_entry.options.get("update_debounce_seconds", DEFAULT_UPDATE_DEBOUNCE)): vol.All(vol.Coerce(float), vol.Range(min=0, max=300)),
+            # Planera bara om från aktuell slot; passerade slots behålls som de var
+            vol.Optional("incremental_replan", default=self.config_entry.options.get("incremental_replan", False)): cv.boolean,
+            # Self use: sekunder villkoret måste hålla innan self use slås på resp. av
+            vol.Optional("self_use_activate_seconds", default=self.config_entry.options.get("self_use_activate_seconds", DEFAULT_ACTIVATE_AFTER)): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+            vol.Optional("self_use_deactivate_seconds", default=self.config_entry.options.get("self_use_deactivate_seconds", DEFAULT_DEACTIVATE_AFTER)): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+            # Låt inlärd förbrukning/sol per timme styra hur mycket som laddas och laddas ur
+            vol.Optional("load_profile_planning", default=self.config_entry.options.get("load_profile_planning", False)): cv.boolean,
+            # Planera med inlärd laddnings-/urladdningshastighet per SoC-band istället för konstant rate
+            vol.Optional("learned_rates", default=self.config_entry.options.get("learned_rates", False)): cv.boolean,
+            # Planera tillsammans med andra entries i flottläge som har samma prisentitet
+            vol.Optional("fleet_mode", default=self.config_entry.options.get("fleet_mode", False)): cv.boolean,
         })
 
         return self.async_show_form(
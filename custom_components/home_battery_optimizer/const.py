@@ -1 +1,15 @@
-DOMAIN = "home_battery_optimizer"
\ No newline at end of file
+DOMAIN = "home_battery_optimizer"
+
+# Planeringsmotorer (väljs per config entry via options)
+PLANNER_HEURISTIC = "heuristic"
+PLANNER_DP = "dp"
+PLANNERS = [PLANNER_HEURISTIC, PLANNER_DP]
+
+# Format på sensorns data-attribut: en dict per rad (full) eller en lista per kolumn (compact)
+ATTRIBUTES_FULL = "full"
+ATTRIBUTES_COMPACT = "compact"
+ATTRIBUTES_MODES = [ATTRIBUTES_FULL, ATTRIBUTES_COMPACT]
+
+# Uppdateringsschemaläggaren: debounce-fönster (sekunder) och minsta SoC-ändring (%) som triggar ombyggnad
+DEFAULT_UPDATE_DEBOUNCE = 5.0
+SOC_DEADBAND = 0.5
@@ -1,16 +1,53 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
 
+from homeassistant.core import callback
+from homeassistant.helpers import entity_registry as er
+
+from .const import ATTRIBUTES_FULL, DEFAULT_UPDATE_DEBOUNCE, PLANNER_HEURISTIC, SOC_DEADBAND
+from .dp_optimizer import DEFAULT_CAPACITY_KWH
+from .instrumentation import (
+    STAGE_LISTENERS,
+    STAGE_PRICE_PARSE,
+    STAGE_SCHEDULE_BUILD,
+    STAGE_SELF_USE,
+    STAGE_SOC_READ,
+    STAGE_TOTAL,
+    Instrumentation,
+)
+from .plan_cache import PlanCache
+from .planner import PlanInputs, frozen_fingerprint, plan, plan_incremental
+from .price_series import PriceSeriesCache
+from .update_scheduler import UpdateScheduler
+from .schedule_store import (
+    ACTION_CHARGE,
+    ScheduleStore,
+)
+from .profile_learner import CONSUMPTION, SOLAR, ProfileLearner, ProfileStore
+from .options_buffer import OptionsBuffer
+from .simulate import price_override, simulate
+from .subscriptions import EntitySubscriptions
+from .self_use_controller import DEFAULT_ACTIVATE_AFTER, DEFAULT_DEACTIVATE_AFTER, SelfUseController
+from .snapshot import ScheduleSnapshot
+from .telemetry import CHARGE, DISCHARGE, RateModel, RateStore
+
 DOMAIN = "home_battery_optimizer"
 
 _LOGGER = logging.getLogger(__name__)
 
+# Inställningar som number-/switch-entiteterna ändrar; samma namn i options och på coordinatorn
+SETTABLE_OPTIONS = (
+    "charge_rate", "discharge_rate", "max_battery_soc", "min_battery_soc", "min_profit",
+    "charging_on", "discharging_on", "self_usage_on",
+)
+
 class HomeBatteryOptimizerCoordinator:
-    def __init__(self, hass, config, config_entry=None):
+    def __init__(self, hass, config, config_entry=None, price_service=None):
         self.hass = hass
         self.config = config
         self.config_entry = config_entry  # Spara entry för persistence
-        self.schedule = []
+        self.schedule = ScheduleStore.empty()
         self.soc = None
         self.current_power = None
         self.target_soc = None
@@ -28,11 +65,14 @@ class HomeBatteryOptimizerCoordinator:
         self.max_battery_soc = float(config.get("max_battery_soc", 100))
         self.min_battery_soc = float(config.get("min_battery_soc", 0))
         self.min_profit = float(config.get("min_profit", 10))
-        self._self_usage_last_change = None
-        self._self_usage_condition_met = False
-        self._self_usage_last_check = None
-        self._self_usage_max_battery_power = 0
-        self._self_usage_delay_seconds = 120  # 2 minuter
+        self.battery_capacity = float(config.get("battery_capacity", DEFAULT_CAPACITY_KWH))
+        self.planner_engine = config.get("planner_engine", PLANNER_HEURISTIC)
+        self.planner_report = {}
+        self.attributes_mode = config.get("attributes_mode", ATTRIBUTES_FULL)
+        self.trim_passed_slots = bool(config.get("trim_passed_slots", False))
+        # Receding horizon: passerade slots fryses och bara framtiden planeras om
+        self.incremental_replan = bool(config.get("incremental_replan", False))
+        self._self_use_active = False
         self._device_info = {
             "identifiers": {(DOMAIN, "home_battery_optimizer")},
             "name": "Home Battery Optimizer",
@@ -41,7 +81,50 @@ class HomeBatteryOptimizerCoordinator:
         }
         self.charge_periods = []  # Lista av dictar med kommande charge-perioder
         self.discharge_periods = []  # Lista av dictar med kommande discharge-perioder
-        self._entity_update_callbacks = set()
+        # Entiteterna skrivs bara när deras eget värde ändrats
+        self.subscriptions = EntitySubscriptions()
+        self.plan_cache = PlanCache()
+        self.plan_generation = 0
+        self.plans_discarded = 0
+        self.instrumentation = Instrumentation()  # Tider per steg i uppdateringskedjan
+        self._price_cache = PriceSeriesCache()
+        self.price_service = price_service  # Delad prisparsning mellan entries (None = egen cache)
+        self.fleet = None  # Fleet när entryt planeras tillsammans med andra batterier
+        # Senaste pris + schema sparas på disk; ett återställt schema är stale tills live-data kommit
+        self.snapshot = ScheduleSnapshot(hass, config_entry.entry_id) if hass is not None and config_entry is not None else None
+        self.stale = False
+        self.restored_at = None
+        # Inlärda förbruknings-/solprofiler per timme i veckan; används av planeraren om load_profile_planning är på
+        self.profiles = ProfileLearner()
+        self.profile_store = ProfileStore(hass, config_entry.entry_id) if hass is not None and config_entry is not None else None
+        self.load_profile_planning = bool(config.get("load_profile_planning", False))
+        self._profile_signals = {
+            config.get("consumption_entity"): CONSUMPTION,
+            config.get("solar_entity"): SOLAR,
+        }
+        self._profile_signals.pop(None, None)
+        # Inlärda effektiva laddnings-/urladdningshastigheter per SoC-band, från batterieffekt och SoC
+        self.telemetry = RateModel()
+        self.telemetry_store = RateStore(hass, config_entry.entry_id) if hass is not None and config_entry is not None else None
+        self.learned_rates = bool(config.get("learned_rates", False))
+        # Self use styrs direkt av sol-/förbruknings-/effekt-events, med tidsbaserad hysteres
+        self.self_use_controller = SelfUseController(
+            self,
+            activate_after=float(config.get("self_use_activate_seconds", DEFAULT_ACTIVATE_AFTER)),
+            deactivate_after=float(config.get("self_use_deactivate_seconds", DEFAULT_DEACTIVATE_AFTER)),
+        )
+        # Alla uppdateringar (events, timer, setters) går via schemaläggaren: en körning åt gången
+        self.update_scheduler = UpdateScheduler(
+            self._async_rebuild,
+            debounce_seconds=float(config.get("update_debounce_seconds", DEFAULT_UPDATE_DEBOUNCE)),
+            deadbands={
+                config.get("battery_entity"): SOC_DEADBAND,
+                config.get("target_soc_entity"): SOC_DEADBAND,
+            },
+            hass=hass,
+        )
+        # Options skrivs samlat efter en skur av ändringar, följt av en enda omplanering
+        self.options_buffer = OptionsBuffer(hass, config_entry, on_flush=self.async_update_sensors)
 
     @property
     def device_info(self):
@@ -100,36 +183,26 @@ class HomeBatteryOptimizerCoordinator:
 
     def update_price_data(self):
         price_entity_id = self.config.get("nordpool_entity")
-        price_data = []
+        price_data = None
         if price_entity_id:
             price_state = self.hass.states.get(price_entity_id)
             if price_state and hasattr(price_state, "attributes"):
-                raw_today = price_state.attributes.get("raw_today", [])
-                raw_tomorrow = price_state.attributes.get("raw_tomorrow", [])
                 # Start from today 00:00
                 base_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                all_hours = list(raw_today) + list(raw_tomorrow)
-                for i, item in enumerate(all_hours):
-                    start_dt = base_time + timedelta(hours=i)
-                    end_dt = base_time + timedelta(hours=i+1)
-                    price_data.append({
-                        "start": start_dt.isoformat(),
-                        "end": end_dt.isoformat(),
-                        "value": float(item["value"])
-                    })
+                # Parsas bara om när raw_today/raw_tomorrow faktiskt ändrats (en gång för alla entries med tjänsten)
+                if self.price_service is not None:
+                    price_data = self.price_service.get(price_entity_id, base_time)
+                else:
+                    price_data = self._price_cache.get(price_state.attributes, base_time)
         self.price_data = price_data
         return price_data
 
     def get_available_hours(self):
         if not self.price_data:
             return []
-        now = datetime.now()
-        available = []
-        for i, _ in self.price_data.items():
-            hour_dt = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(hours=i)
-            if hour_dt >= now:
-                available.append(i)
-        return available
+        now_ts = datetime.now().timestamp()
+        bounds = self.price_data.calendar.bounds
+        return [i for i in range(len(self.price_data)) if bounds[i] >= now_ts]
 
     def limit_charge_windows(self, schedule, max_windows=3):
         # Only allow up to max_windows charge periods in the schedule
@@ -144,69 +217,6 @@ class HomeBatteryOptimizerCoordinator:
                 schedule[i]["action"] = "idle"
         return schedule
 
-    def find_charge_windows(self):
-        """
-        Find charge windows based on falling price, min_profit, and peak detection.
-        Ensure that no window overlaps another; each starts after the previous ends.
-        """
-        price_data = self.price_data or []
-        min_profit = getattr(self, "min_profit", 10)
-        windows = []
-        i = 0
-        n = len(price_data)
-        window_counter = 1
-        _LOGGER.debug(f"find_charge_windows: min_profit={min_profit}, n={n}")
-        while i < n - 1:
-            # 1. Find first falling price sequence (local minimum)
-            start_idx = i
-            ref_idx = i
-            ref_price = price_data[i]["value"]
-            while i + 1 < n and price_data[i+1]["value"] < ref_price:
-                i += 1
-                ref_price = price_data[i]["value"]
-                ref_idx = i
-            min_idx = ref_idx
-            min_price = ref_price
-            # 2. Look for price increase that meets min_profit
-            found = False
-            j = min_idx + 1
-            while j < n:
-                if price_data[j]["value"] >= min_price + min_profit:
-                    found = True
-                    break
-                if price_data[j]["value"] < min_price:
-                    min_price = price_data[j]["value"]
-                    min_idx = j
-                j += 1
-            if not found:
-                _LOGGER.debug(f"No more windows found after i={i}, min_price={min_price}")
-                break  # No more windows
-            # 3. Find peak after threshold met
-            peak_idx = j
-            peak_price = price_data[j]["value"]
-            k = j + 1
-            while k < n and price_data[k]["value"] > peak_price:
-                peak_idx = k
-                peak_price = price_data[k]["value"]
-                k += 1
-            # 4. Store window (no overlap: next window starts after this one ends)
-            window = {
-                "window": window_counter,  # Ändra från f"window_{window_counter}" till int
-                "start": price_data[start_idx]["start"],
-                "end": price_data[peak_idx]["end"],
-                "min_price": min_price,
-                "max_price": peak_price,
-                "start_idx": start_idx,
-                "end_idx": peak_idx
-            }
-            _LOGGER.debug(f"Window found: {window}")
-            windows.append(window)
-            window_counter += 1
-            i = peak_idx + 1  # Move to first hour after this window (no overlap)
-        self.charge_windows = windows
-        _LOGGER.debug(f"Total windows found: {len(windows)}")
-        return windows
-
     def build_full_schedule(self, force_all_unpassed=False):
         """
         Huvudmetod som bygger hela ladd- och urladdningsschemat enligt stepwise-logik:
@@ -215,245 +225,270 @@ class HomeBatteryOptimizerCoordinator:
         3. Initiera schedule med prisdata (hela dygnet, även historik)
         4. Markera alla timmar där end < now som passed=True (om force_all_unpassed=False)
         5. Endast framtida timmar (passed=False) får ändras av window/charge/discharge-logik
-        6. Allt lagras i self.schedule.
+        6. Allt lagras i self.schedule (ScheduleStore, en array per kolumn).
         """
-        soc = self.soc if self.soc is not None else 0
-        charge_rate = self.charge_rate
-        discharge_rate = self.discharge_rate
-        max_soc = self.max_battery_soc
-        min_soc = self.min_battery_soc
-        min_profit = self.min_profit
-        price_data = self.price_data or []
-        # Kontroll: Bygg bara schema om både SoC och prisdata är giltiga
-        if soc is None or not price_data or len(price_data) < 1:
-            _LOGGER.warning("[HBO] Skipping schedule build: SoC or price data not available yet (build_full_schedule).")
-            self.schedule = []
+        inputs = self._schedule_inputs(force_all_unpassed)
+        if inputs is None:
             return
-        self.schedule = []
-        now = datetime.now()
-        # Initiera schedule med passed-attribut
-        for entry in price_data:
-            end_dt = datetime.fromisoformat(entry["end"])
-            passed = False
-            if not force_all_unpassed:
-                passed = end_dt < now
-            self.schedule.append({
-                "start": entry["start"],
-                "end": entry["end"],
-                "price": entry["value"],
-                "action": "idle",
-                "charge": 0,
-                "discharge": 0,
-                "window": None,
-                "estimated_soc": None,
-                "passed": passed
-            })
-        # Window-skapande och laddlogik utgår nu från första timmen, och logik körs för ALLA timmar
-        window_counter = 1
-        idx = 0
-        prev_discharge_end = 0
-        prev_soc = soc
-        n = len(self.schedule)
-        while idx < n:
-            # a) Hitta första möjliga start efter prev_discharge_end (även passed)
-            available_idxs = [i for i in range(prev_discharge_end, n)]
-            if not available_idxs:
-                break
-            start_idx = available_idxs[0]
-            # b) Hitta window: fallande pris till minimum, sedan ökning >= min_profit
-            i = start_idx
-            # Hitta lokal minimum
-            while i+1 < n and self.schedule[i+1]["price"] < self.schedule[i]["price"]:
-                i += 1
-            min_idx = i
-            min_price = self.schedule[min_idx]["price"]
-            # Hitta första index där priset ökar minst min_profit
-            found = False
-            j = min_idx + 1
-            while j < n:
-                if self.schedule[j]["price"] >= min_price + min_profit:
-                    found = True
-                    break
-                if self.schedule[j]["price"] < min_price:
-                    min_price = self.schedule[j]["price"]
-                    min_idx = j
-                j += 1
-            if not found:
-                break
-            # Hitta peak (slut på window)
-            peak_idx = j
-            peak_price = self.schedule[peak_idx]["price"]
-            k = j + 1
-            while k < n and self.schedule[k]["price"] > peak_price:
-                peak_idx = k
-                peak_price = self.schedule[k]["price"]
-                k += 1
-            window_start = start_idx
-            window_end = peak_idx
-            # c) Planera laddning i window (alla timmar)
-            soc_needed = max(0, max_soc - prev_soc)
-            hours_needed = int((soc_needed + charge_rate - 1) // charge_rate)
-            if soc_needed < 5:
-                hours_needed = 0
-            window_prices = [(i, self.schedule[i]["price"]) for i in range(window_start, window_end+1)]
-            sorted_hours = sorted(window_prices, key=lambda x: x[1])
-            charge_idxs = sorted([i for i, _ in sorted_hours[:hours_needed]])
-            current_soc = prev_soc
-            charge_prices = []
-            for i in range(window_start, window_end+1):
-                if i in charge_idxs and current_soc < max_soc - 5:
-                    self.schedule[i]["charge"] = 1
-                    self.schedule[i]["action"] = "charge"
-                    charge_prices.append(self.schedule[i]["price"])
-                    current_soc = min(current_soc + charge_rate, max_soc)
+        # En ny plan gör alla pågående executor-planer inaktuella
+        self.plan_generation += 1
+        result = self.fleet.plan_for(self, inputs) if self.fleet_active else None
+        if result is None:
+            # Samma indata (inom SoC-kvantet) ger samma schema: återanvänd från cachen
+            cache_key, job = self._plan_job(inputs)
+            result = self.plan_cache.get(cache_key)
+            if result is None:
+                result = job[0](*job[1:])
+                self.plan_cache.put(cache_key, result)
+        self.schedule, self.planner_report = result
+        return self.schedule
+
+    async def async_build_schedule(self, force_all_unpassed=False):
+        """
+        Same as build_full_schedule, but plans in the executor so the event loop never blocks.
+        Each run gets a generation number; a result whose generation was superseded while
+        it ran is discarded instead of overwriting the newer schedule.
+        """
+        inputs = self._schedule_inputs(force_all_unpassed)
+        if inputs is None:
+            return None
+        self.plan_generation += 1
+        generation = self.plan_generation
+        result = await self.fleet.async_plan_for(self, inputs) if self.fleet_active else None
+        if result is None:
+            cache_key, job = self._plan_job(inputs)
+            result = self.plan_cache.get(cache_key)
+            if result is None:
+                if self.hass is None:
+                    result = self.instrumentation.run(*job)
                 else:
-                    self.schedule[i]["charge"] = 0
-                self.schedule[i]["window"] = window_counter
-                self.schedule[i]["estimated_soc"] = round(current_soc, 2)
-            avg_charge_price = sum(charge_prices) / len(charge_prices) if charge_prices else 0
-            # d) Bygg discharge för window (alla timmar)
-            discharge_soc = self.schedule[window_end]["estimated_soc"] if self.schedule[window_end]["estimated_soc"] is not None else current_soc
-            soc_needed_discharge = max(discharge_soc - min_soc, 0)
-            hours_needed_discharge = int((soc_needed_discharge + discharge_rate - 1) // discharge_rate)
-            if hours_needed_discharge < 1:
-                prev_discharge_end = window_end + 1
-                prev_soc = current_soc
-                window_counter += 1
-                continue
-            lookup = max(0, hours_needed_discharge - 1)
-            idxs = [i for i in range(max(0, window_end - lookup), min(n, window_end + lookup + 1))]
-            prices = [(i, self.schedule[i]["price"]) for i in idxs]
-            last_price = self.schedule[window_end]["price"]
-            max_price = max(prices, key=lambda x: x[1])[1] if prices else last_price
-            while max_price > last_price:
-                max_idx = max(prices, key=lambda x: x[1])[0]
-                window_end = max_idx
-                discharge_soc = self.schedule[window_end]["estimated_soc"] if self.schedule[window_end]["estimated_soc"] is not None else current_soc
-                soc_needed_discharge = max(discharge_soc - min_soc, 0)
-                hours_needed_discharge = int((soc_needed_discharge + discharge_rate - 1) // discharge_rate)
-                if hours_needed_discharge < 1:
-                    break
-                lookup = max(0, hours_needed_discharge - 1)
-                idxs = [i for i in range(max(0, window_end - lookup), min(n, window_end + lookup + 1))]
-                prices = [(i, self.schedule[i]["price"]) for i in idxs]
-                last_price = self.schedule[window_end]["price"]
-                max_price = max(prices, key=lambda x: x[1])[1] if prices else last_price
-            discharge_candidates = [(i, price) for i, price in prices if price >= avg_charge_price + min_profit]
-            discharge_candidates.sort(key=lambda x: x[1], reverse=True)
-            discharge_idxs = sorted([i for i, _ in discharge_candidates[:hours_needed_discharge]])
-            current_soc = discharge_soc
-            # NY LOGIK: Fyll i alla timmar mellan första och sista discharge-timmen
-            if discharge_idxs:
-                discharge_start = discharge_idxs[0]
-                discharge_end = discharge_idxs[-1]
-                for i in range(discharge_start, discharge_end + 1):
-                    self.schedule[i]["discharge"] = 1
-                    self.schedule[i]["action"] = "discharge"
-                    self.schedule[i]["window"] = window_counter
-                    self.schedule[i]["charge"] = 0  # Ta bort eventuell laddning
-                    self.schedule[i]["estimated_soc"] = round(current_soc, 2)
-                    current_soc = max(current_soc - discharge_rate, min_soc)
-                # Fyll i tomma window-index mellan prev_discharge_end och discharge_end
-                for i in range(prev_discharge_end, discharge_end + 1):
-                    if self.schedule[i]["window"] is None:
-                        self.schedule[i]["window"] = window_counter
-            # Om du vill nollställa charge på övriga timmar i window efter discharge_start, kan du lägga till det här
-            if discharge_idxs:
-                prev_discharge_end = discharge_end + 1
-                prev_soc = current_soc
-            else:
-                prev_discharge_end = window_end + 1
-                prev_soc = current_soc
-            window_counter += 1
-        # Efter att hela schemat är byggt: fyll i alla None-värden för estimated_soc
-        last_soc = None
-        for entry in self.schedule:
-            if entry["estimated_soc"] is not None:
-                last_soc = entry["estimated_soc"]
-            else:
-                entry["estimated_soc"] = last_soc
-        # Avbryt pågående och framtida charge/discharge i schemat om respektive switch är OFF, men lämna passerade timmar orörda.
-        for idx, entry in enumerate(self.schedule):
-            # Om timmen är passerad, låt den vara
-            if entry["passed"]:
-                continue
-            # Om charging är avstängd, nollställ charge och action för framtida timmar
-            if not self.charging_on and entry["charge"] == 1:
-                entry["charge"] = 0
-                if entry["action"] == "charge":
-                    entry["action"] = "idle"
-            # Om discharging är avstängd, nollställ discharge och action för framtida timmar
-            if not self.discharging_on and entry["discharge"] == 1:
-                entry["discharge"] = 0
-                if entry["action"] == "discharge":
-                    entry["action"] = "idle"
+                    result = await self.instrumentation.async_run_in_executor(self.hass, *job)
+                # Resultatet är korrekt för sina indata, så det får cachas även om det är inaktuellt
+                self.plan_cache.put(cache_key, result)
+        if generation != self.plan_generation:
+            self.plans_discarded += 1
+            _LOGGER.debug("Discarding plan generation %s (current %s)", generation, self.plan_generation)
+            return None
+        self.schedule, self.planner_report = result
         return self.schedule
 
+    def _plan_job(self, inputs):
+        """(cache key, (function, *args)) for planning inputs: in full, or incrementally on the current schedule."""
+        if not self.incremental_replan:
+            return inputs.fingerprint(), (plan, inputs)
+        previous = self.schedule
+        # De frysta slotsen ingår i nyckeln: samma framtid efter olika historik är olika scheman
+        return inputs.fingerprint() + (frozen_fingerprint(previous, inputs),), (plan_incremental, inputs, previous)
+
+    async def async_simulate(self, scenarios, prices=None):
+        """
+        What-if plans for a batch of parameter sets on the current (or given) prices, from the
+        current SoC and settings. Nothing is stored: schedule, options and plan cache are untouched.
+        """
+        now_ts = datetime.now().timestamp()
+        price_data = self.price_data if prices is None else price_override(self.price_data, prices, now_ts)
+        if not price_data:
+            raise ValueError("no price data to simulate on")
+        base = self.plan_inputs(price_data.calendar.passed_count(now_ts))._replace(price_data=price_data)
+        if self.hass is None:
+            return simulate(base, scenarios)
+        return await self.hass.async_add_executor_job(simulate, base, scenarios)
+
+    @property
+    def fleet_active(self):
+        """True when this entry is planned jointly with at least one other battery."""
+        return self.fleet is not None and len(self.fleet) > 1
+
+    async def async_restore(self):
+        """Load the last saved prices and schedule. Returns True if a still-current snapshot was restored."""
+        if self.snapshot is None:
+            return False
+        restored = await self.snapshot.async_load()
+        if restored is None:
+            return False
+        price_data, schedule, planner_report, saved_at = restored
+        self.price_data = price_data
+        if schedule is not None:
+            self.schedule = schedule
+            self.planner_report = planner_report
+            self.update_charge_discharge_periods()
+        self.stale = True
+        self.restored_at = datetime.fromtimestamp(saved_at).isoformat() if saved_at else None
+        _LOGGER.debug("Restored snapshot from %s (%s slots)", saved_at, len(price_data))
+        return True
+
+    async def async_load_profiles(self):
+        """Load the learned consumption/solar profiles saved before the restart."""
+        if self.profile_store is None:
+            return False
+        return await self.profile_store.async_load_into(self.profiles)
+
+    @callback
+    def async_observe_load(self, event):
+        """Feed a consumption/solar state change to the profile learner (no replan)."""
+        signal = self._profile_signals.get(event.data.get("entity_id"))
+        new_state = event.data.get("new_state")
+        if signal is None or new_state is None:
+            return
+        try:
+            value = float(new_state.state)
+        except (TypeError, ValueError):
+            return
+        self.profiles.observe(signal, new_state.last_updated.timestamp(), value)
+        if self.profile_store is not None:
+            self.profile_store.async_schedule_save(self.profiles)
+
+    async def async_load_telemetry(self):
+        """Load the battery telemetry intervals saved before the restart."""
+        if self.telemetry_store is None:
+            return False
+        return await self.telemetry_store.async_load_into(self.telemetry)
+
+    @callback
+    def async_observe_battery(self, event):
+        """Feed a SoC or battery power state change to the rate model (no replan)."""
+        entity_id = event.data.get("entity_id")
+        new_state = event.data.get("new_state")
+        if new_state is None or entity_id not in (self.config.get("battery_entity"), self.config.get("battery_power_entity")):
+            return
+        try:
+            value = float(new_state.state)
+        except (TypeError, ValueError):
+            return
+        ts = new_state.last_updated.timestamp()
+        if entity_id == self.config.get("battery_entity"):
+            self.telemetry.observe(ts, soc=value)
+        else:
+            self.telemetry.observe(ts, power=value)
+        if self.telemetry_store is not None:
+            self.telemetry_store.async_schedule_save(self.telemetry)
+
+    def _schedule_inputs(self, force_all_unpassed):
+        """PlanInputs snapshot for now, or None (and an empty schedule) without SoC/price data."""
+        price_data = self.price_data
+        # Kontroll: Bygg bara schema om både SoC och prisdata är giltiga; okänd SoC planeras inte som 0
+        if self.soc is None or not price_data or len(price_data) < 1:
+            _LOGGER.debug(
+                "Skipping schedule build: SoC or price data not available yet (soc=%s, price slots=%s)",
+                self.soc, len(price_data) if price_data else 0,
+            )
+            self.schedule = ScheduleStore.empty()
+            return None
+        calendar = price_data.calendar
+        current_slot = 0 if force_all_unpassed else calendar.passed_count(datetime.now().timestamp())
+        return self.plan_inputs(current_slot)
+
+    def plan_inputs(self, current_slot=0):
+        """
+        Immutable snapshot of everything the planner needs.
+        price_data is shared, not copied: a PriceSeries is never mutated, only replaced.
+        """
+        return PlanInputs(
+            price_data=self.price_data,
+            soc=self.soc if self.soc is not None else 0,
+            current_slot=current_slot,
+            charge_rate=self.charge_rate,
+            discharge_rate=self.discharge_rate,
+            min_soc=self.min_battery_soc,
+            max_soc=self.max_battery_soc,
+            min_profit=self.min_profit,
+            charging_on=self.charging_on,
+            discharging_on=self.discharging_on,
+            engine=self.planner_engine,
+            capacity_kwh=self.battery_capacity,
+            net_load=self.profiles.net_load(self.price_data.calendar) if self.load_profile_planning and self.price_data else None,
+            charge_curve=self.telemetry.curve(CHARGE, self.charge_rate) if self.learned_rates else None,
+            discharge_curve=self.telemetry.curve(DISCHARGE, self.discharge_rate) if self.learned_rates else None,
+        )
+
+    def _slot_steps(self):
+        """Charge/discharge i procent per slot, utifrån %/timme och slotlängden."""
+        return self.plan_inputs().slot_steps()
+
     def update_charge_discharge_periods(self):
         """Hitta och spara alla kommande charge- och discharge-perioder från schemat."""
         self.charge_periods = []
         self.discharge_periods = []
         if not self.schedule:
             return
-        current_time = datetime.now()
-        # Hitta alla block av charge/discharge
-        def find_periods(action_name):
-            periods = []
-            start_idx = None
-            for idx, item in enumerate(self.schedule):
-                if item.get("action") == action_name and not item.get("past"):
-                    if start_idx is None:
-                        start_idx = idx
-                else:
-                    if start_idx is not None:
-                        stop_idx = idx - 1
-                        periods.append({
-                            "start_idx": start_idx,
-                            "stop_idx": stop_idx,
-                            "start_time": self._get_time_for_index(start_idx),
-                            "stop_time": self._get_time_for_index(stop_idx + 1),
-                            "number_of_hours": stop_idx - start_idx + 1
-                        })
-                        start_idx = None
-            # Om perioden går till slutet
-            if start_idx is not None:
-                stop_idx = len(self.schedule) - 1
-                periods.append({
-                    "start_idx": start_idx,
-                    "stop_idx": stop_idx,
-                    "start_time": self._get_time_for_index(start_idx),
-                    "stop_time": self._get_time_for_index(stop_idx + 1),
-                    "number_of_hours": stop_idx - start_idx + 1
-                })
-            return periods
-        self.charge_periods = find_periods("charge")
-        self.discharge_periods = find_periods("discharge")
+        bounds = self.schedule.calendar.bounds
+        # Perioderna är förberäknade i tidsindexet (en gång per schemaversion)
+        for action, start_idx, stop_idx in self.schedule.time_index.periods:
+            period = {
+                "start_idx": start_idx,
+                "stop_idx": stop_idx,
+                "start_time": self._get_time_for_index(start_idx),
+                "stop_time": self._get_time_for_index(stop_idx + 1),
+                "number_of_slots": stop_idx - start_idx + 1,
+                "number_of_hours": (bounds[stop_idx + 1] - bounds[start_idx]) / 3600
+            }
+            if action == ACTION_CHARGE:
+                self.charge_periods.append(period)
+            else:
+                self.discharge_periods.append(period)
 
     def _get_time_for_index(self, idx):
-        # Returnerar datetime för idx i schemat (timvis schema)
-        today = datetime.now().replace(minute=0, second=0, microsecond=0)
-        return today + timedelta(hours=idx)
+        # Returnerar datetime för idx i schemat (slot-gräns från kalendern, oavsett upplösning)
+        bounds = self.schedule.calendar.bounds
+        if 0 <= idx < len(bounds):
+            return datetime.fromtimestamp(bounds[idx])
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return today + timedelta(seconds=self.schedule.calendar.slot_seconds * idx)
 
     async def async_update_sensors(self):
-        """Update SoC, price data, schedule, and notify listeners."""
-        soc_update_needed = self.update_soc()
-        self.update_price_data()
-        _LOGGER.warning(f"[HBO DEBUG] soc={self.soc}, price_data_len={len(self.price_data) if self.price_data else 0}")
-        # Kontroll: Bygg bara schema om både SoC och prisdata är giltiga
-        if self.soc is None or not self.price_data or len(self.price_data) < 1:
-            _LOGGER.warning("[HBO] Skipping schedule build: SoC or price data not available yet.")
-            return
-        # Bygg alltid nytt schema enligt stepwise-logik
-        self.build_full_schedule()
-        _LOGGER.warning(f"[HBO DEBUG] schedule_len={len(self.schedule)}; first={self.schedule[0] if self.schedule else None}")
-        # Self use-logik körs separat
-        await self.self_use_automation()
-        self.update_charge_discharge_periods()
-        if hasattr(self, 'async_update_listeners'):
-            await self.async_update_listeners()
+        """Update SoC, price data, schedule, and notify listeners (single-flight via update_scheduler)."""
+        await self.update_scheduler.async_run()
+
+    async def _async_rebuild(self):
+        timing = self.instrumentation
+        with timing.stage(STAGE_TOTAL):
+            with timing.stage(STAGE_SOC_READ):
+                self.update_soc()
+            with timing.stage(STAGE_PRICE_PARSE):
+                self.update_price_data()
+            _LOGGER.debug("soc=%s, price_data_len=%s", self.soc, len(self.price_data) if self.price_data else 0)
+            # Kontroll: Bygg bara schema om både SoC och prisdata är giltiga
+            if self.soc is None or not self.price_data or len(self.price_data) < 1:
+                _LOGGER.debug("Skipping schedule build: SoC or price data not available yet.")
+                return
+            # Bygg alltid nytt schema enligt stepwise-logik
+            with timing.stage(STAGE_SCHEDULE_BUILD):
+                if await self.async_build_schedule() is not None:
+                    self.stale = False
+                    if self.snapshot is not None:
+                        self.snapshot.async_schedule_save(self)
+                self.update_charge_discharge_periods()
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("schedule_len=%s; first=%s", len(self.schedule), self.schedule[0] if self.schedule else None)
+            # Self use-logik körs separat
+            with timing.stage(STAGE_SELF_USE):
+                await self.self_use_automation()
+            with timing.stage(STAGE_LISTENERS):
+                self.async_update_listeners()
         # Skicka notifikation till Home Assistant UI
         await self._send_schedule_notification()
 
+    def entity_ids(self):
+        """Entity ids registered for this config entry (sensor, switches, numbers)."""
+        if self.hass is None or self.config_entry is None:
+            return []
+        registry = er.async_get(self.hass)
+        return [entry.entity_id for entry in er.async_entries_for_config_entry(registry, self.config_entry.entry_id)]
+
+    async def async_refresh_entities(self):
+        """Refresh only this entry's entities, concurrently."""
+        entity_ids = self.entity_ids()
+        results = await asyncio.gather(
+            *(
+                self.hass.services.async_call("homeassistant", "update_entity", {"entity_id": entity_id})
+                for entity_id in entity_ids
+            ),
+            return_exceptions=True,
+        )
+        for entity_id, result in zip(entity_ids, results):
+            if isinstance(result, Exception):
+                _LOGGER.error("Could not refresh %s: %s", entity_id, result)
+
     async def _send_schedule_notification(self):
         """Skicka en notifikation med hela schemat till Home Assistant UI."""
         return  # Notifiering inaktiverad
@@ -466,8 +501,8 @@ class HomeBatteryOptimizerCoordinator:
         # Lägg till felsökningsinfo
         debug_info = f"\n\n**[DEBUG] min_profit:** {getattr(self, 'min_profit', None)}\n"
         debug_info += f"**[DEBUG] SoC:** {getattr(self, 'soc', None)}\n"
-        debug_info += f"**[DEBUG] Price data:** {[e['value'] for e in self.price_data]}\n"
-        debug_info += f"**[DEBUG] Windows:** {getattr(self, 'charge_windows', None)}\n"
+        debug_info += f"**[DEBUG] Price data:** {list(self.price_data.values)}\n"
+        debug_info += f"**[DEBUG] Windows:** {self.schedule.windows}\n"
         debug_info += f"**[DEBUG] Now:** {datetime.now().isoformat()}\n"
         message = f"**Batterischema uppdaterat**\n\n{table}{debug_info}"
         try:
@@ -482,420 +517,67 @@ class HomeBatteryOptimizerCoordinator:
                 blocking=True
             )
         except Exception as e:
-            _LOGGER.error(f"Kunde inte skicka notifikation: {e}")
+            _LOGGER.error("Kunde inte skicka notifikation: %s", e)
 
-    def add_update_callback(self, callback):
-        self._entity_update_callbacks.add(callback)
+    @callback
+    def async_update_listeners(self):
+        """Write state for this entry's entities whose own value changed."""
+        return self.subscriptions.async_notify()
 
-    def remove_update_callback(self, callback):
-        self._entity_update_callbacks.discard(callback)
-
-    async def async_update_listeners(self):
-        """Notify all registered entity update callbacks."""
-        for callback in list(self._entity_update_callbacks):
-            if callable(callback):
-                try:
-                    result = callback()
-                    if hasattr(result, "__await__"):
-                        await result
-                except Exception as e:
-                    _LOGGER.error(f"Error in entity update callback: {e}")
-
-    def build_charge_schedule_window1(self):
-        """
-        Bygg laddschema för endast window 1:
-        - Använd aktuell SOC, charge_rate och max_battery_soc
-        - Sortera priserna i window 1 och välj billigaste timmarna
-        - Sätt charge=1 för dessa, annars 0
-        - Implementera dödzon: starta ej ny sektion om <5% från max
-        - Skriv estimated_soc
+    @callback
+    def async_set_option(self, key, value):
         """
-        if not self.price_data or not hasattr(self, "charge_windows") or not self.charge_windows:
-            return []
-        window = self.charge_windows[0]
-        start_idx = window["start_idx"]
-        end_idx = window["end_idx"]
-        soc = self.soc if self.soc is not None else 0
-        max_soc = self.max_battery_soc
-        charge_rate = self.charge_rate
-        n_hours = end_idx - start_idx + 1
-        # Hur många timmar behövs?
-        soc_needed = max(0, max_soc - soc)
-        hours_needed = int((soc_needed + charge_rate - 1) // charge_rate)
-        # Dödzon: om soc_needed < 5% -> ingen laddning
-        if soc_needed < 5:
-            hours_needed = 0
-        # Hämta priser och index för window 1
-        window_prices = [
-            (i, float(self.price_data[i]["value"]))
-            for i in range(start_idx, end_idx + 1)
-        ]
-        # Sortera på pris, ta billigaste timmarna
-        sorted_hours = sorted(window_prices, key=lambda x: x[1])
-        charge_idxs = sorted([i for i, _ in sorted_hours[:hours_needed]])
-        # Bygg charge_raw och estimated_soc
-        charge_raw = []
-        estimated_soc = []
-        current_soc = soc
-        now = datetime.now()
-        for i in range(len(self.price_data)):
-            entry = self.price_data[i]
-            # Endast tillåt laddning i window 1 och om timmen inte har passerat
-            in_window1 = start_idx <= i <= end_idx
-            end_dt = datetime.fromisoformat(entry["end"])
-            is_future = end_dt > now
-            charge = 1 if i in charge_idxs and in_window1 else 0
-            # Dödzon: om vi är inom 5% från max, ingen laddning
-            if current_soc >= max_soc - 5:
-                charge = 0
-            if charge:
-                current_soc = min(current_soc + charge_rate, max_soc)
-            charge_raw.append({
-                "start": entry["start"],
-                "end": entry["end"],
-                "charge": charge
-            })
-            estimated_soc.append({
-                "start": entry["start"],
-                "end": entry["end"],
-                "soc": round(current_soc, 2)
-            })
-        self.charge_raw_window1 = charge_raw
-        self.estimated_soc_window1 = estimated_soc
-        return charge_raw
-
-    def build_charge_schedule_window2(self):
-        """
-        Bygg laddschema för window 2 (om det finns):
-        - Utgå från estimated_soc efter window 1
-        - Endast timmar i window 2 som inte redan använts i window 1 får användas
-        - Samma logik som window 1
-        - Skriv charge_raw_window2 och estimated_soc_window2
-        """
-        if not self.price_data or not hasattr(self, "charge_windows") or len(self.charge_windows) < 2:
-            self.charge_raw_window2 = None
-            self.estimated_soc_window2 = None
-            return []
-        window1 = self.charge_windows[0]
-        window2 = self.charge_windows[1]
-        start_idx2 = window2["start_idx"]
-        end_idx2 = window2["end_idx"]
-        # estimated_soc efter window 1
-        estimated_soc1 = getattr(self, "estimated_soc_window1", None)
-        if not estimated_soc1:
-            self.charge_raw_window2 = None
-            self.estimated_soc_window2 = None
-            return []
-        # Hitta sista SoC från window 1 (eller aktuell SoC om window 1 är i framtiden)
-        soc_after_w1 = None
-        for entry in reversed(estimated_soc1):
-            end_dt = datetime.fromisoformat(entry["end"])
-            if end_dt <= datetime.now():
-                soc_after_w1 = entry["soc"]
-                break
-        if soc_after_w1 is None:
-            soc_after_w1 = estimated_soc1[window1["end_idx"]]["soc"]
-        soc = soc_after_w1
-        max_soc = self.max_battery_soc
-        charge_rate = self.charge_rate
-        soc_needed = max(0, max_soc - soc)
-        hours_needed = int((soc_needed + charge_rate - 1) // charge_rate)
-        if soc_needed < 5:
-            hours_needed = 0
-        # Endast tillåt timmar i window 2 som INTE är i window 1
-        used_idxs = set(range(window1["start_idx"], window1["end_idx"]+1))
-        window2_idxs = [i for i in range(start_idx2, end_idx2+1) if i not in used_idxs]
-        window_prices = [(i, float(self.price_data[i]["value"])) for i in window2_idxs]
-        sorted_hours = sorted(window_prices, key=lambda x: x[1])
-        charge_idxs = sorted([i for i, _ in sorted_hours[:hours_needed]])
-        charge_raw = []
-        estimated_soc = []
-        current_soc = soc
-        now = datetime.now()
-        for i in range(len(self.price_data)):
-            entry = self.price_data[i]
-            in_window2 = i in window2_idxs
-            # end_dt = datetime.fromisoformat(entry["end"])
-            # is_future = end_dt > now
-            charge = 1 if i in charge_idxs and in_window2 else 0
-            if current_soc >= max_soc - 5:
-                charge = 0
-            if charge:
-                current_soc = min(current_soc + charge_rate, max_soc)
-            charge_raw.append({
-                "start": entry["start"],
-                "end": entry["end"],
-                "charge": charge
-            })
-            estimated_soc.append({
-                "start": entry["start"],
-                "end": entry["end"],
-                "soc": round(current_soc, 2)
-            })
-        self.charge_raw_window2 = charge_raw
-        self.estimated_soc_window2 = estimated_soc
-        return charge_raw
-
-    def build_charge_schedule_windows(self):
+        Apply a setting (number/switch) now. Persisting it and the replan are batched: several
+        changes in a row give one options write and one rebuild once they have settled.
         """
-        Build charge schedule for all charge windows:
-        - For each window: start from estimated SoC after previous window (or SoC for window 1)
-        - Only use hours in the current window that are not already used in previous windows
-        - Annotate each schedule entry with per-window charge plan and estimated SoC
-        - All results are stored in self.schedule, not as dynamic attributes
-        """
-        if not self.price_data or not hasattr(self, "charge_windows") or not self.charge_windows:
-            return []
-        used_idxs = set()
-        prev_soc = self.soc if self.soc is not None else 0
-        for n, window in enumerate(self.charge_windows[:4], start=1):
-            start_idx = window["start_idx"]
-            end_idx = window["end_idx"]
-            max_soc = self.max_battery_soc
-            charge_rate = self.charge_rate
-            soc_needed = max(0, max_soc - prev_soc)
-            hours_needed = int((soc_needed + charge_rate - 1) // charge_rate)
-            if soc_needed < 5:
-                hours_needed = 0
-            window_idxs = [i for i in range(start_idx, end_idx+1) if i not in used_idxs]
-            window_prices = [(i, float(self.price_data[i]["value"])) for i in window_idxs]
-            sorted_hours = sorted(window_prices, key=lambda x: x[1])
-            charge_idxs = sorted([i for i, _ in sorted_hours[:hours_needed]])
-            current_soc = prev_soc
-            charge_prices = []
-            for i in range(len(self.price_data)):
-                entry = self.price_data[i]
-                in_window = i in window_idxs
-                charge = 1 if i in charge_idxs and in_window else 0
-                if current_soc >= max_soc - 5:
-                    charge = 0
-                if charge:
-                    current_soc = min(current_soc + charge_rate, max_soc)
-                    if in_window:
-                        charge_prices.append(float(entry["value"]))
-                # Annotate schedule entry if it exists
-                if i < len(self.schedule):
-                    self.schedule[i][f"charge_window_{n}"] = charge
-                    self.schedule[i][f"estimated_soc_window_{n}"] = round(current_soc, 2)
-            avg_price = sum(charge_prices) / len(charge_prices) if charge_prices else None
-            window["avg_charge_price"] = avg_price
-            # For next window: use last SoC in window
-            for i in reversed(range(start_idx, end_idx+1)):
-                if i < len(self.schedule):
-                    prev_soc = self.schedule[i][f"estimated_soc_window_{n}"]
-                    break
-            used_idxs.update(window_idxs)
-        return True
+        if key not in SETTABLE_OPTIONS:
+            raise ValueError(f"{key} is not a settable option")
+        self.config[key] = value
+        setattr(self, key, value)
+        self.options_buffer.async_set(key, value)
+        self.async_update_listeners()
 
-    def build_discharge_schedule_windows(self):
+    def needs_reload(self, entry):
         """
-        Förbättrad discharge-logik:
-        - Discharge startar vid slutet av en charge window och väljer bästa timmar runt detta index
-        - Endast timmar där priset är minst (avg_charge_price + min_profit) används
-        - Annoterar self.schedule med discharge=1 för dessa timmar, övriga får discharge=0
-        - estimated_soc uppdateras för varje discharge-timme
-        - Allt sker per window och är generaliserat
+        True when the entry's data/options differ from what this coordinator was set up with in
+        anything but the settable options. Those are applied live and written back by the
+        options buffer, so its own writes never trigger a reload.
         """
-        if not self.price_data or not hasattr(self, "charge_windows") or not self.charge_windows:
-            return []
-        now = datetime.now()
-        min_profit = getattr(self, "min_profit", 10)
-        num_windows = len(self.charge_windows)
-        for n in range(1, num_windows + 1):
-            window = self.charge_windows[n-1]
-            start_idx = window["start_idx"]
-            end_idx = window["end_idx"]
-            # Start discharge vid sista timmen i window
-            start_discharge_idx = end_idx
-            # Hämta SoC från sista charge-timmen i window (eller self.soc om tiden passerat)
-            soc = self.schedule[start_discharge_idx][f"estimated_soc_window_{n}"] if start_discharge_idx < len(self.schedule) and f"estimated_soc_window_{n}" in self.schedule[start_discharge_idx] else self.soc or 0
-            min_soc = self.min_battery_soc
-            discharge_rate = self.discharge_rate
-            soc_needed = max(soc - min_soc, 0)
-            hours_needed = int((soc_needed + discharge_rate - 1) // discharge_rate)
-            if hours_needed < 1:
-                continue
-            # "time discharge lookup" = hours_needed - 1
-            lookup = max(0, hours_needed - 1)
-            # Titta på timmarna runt sista window
-            idxs = list(range(max(0, start_discharge_idx - lookup), min(len(self.price_data), start_discharge_idx + lookup + 1)))
-            # Jämför priset på sista timmen i window med övriga
-            prices = [(i, float(self.price_data[i]["value"])) for i in idxs]
-            last_price = float(self.price_data[start_discharge_idx]["value"]) if start_discharge_idx < len(self.price_data) else 0
-            max_price = max(prices, key=lambda x: x[1])[1] if prices else last_price
-            # Om någon annan timme har högre pris, flytta window-slut till den timmen och upprepa
-            if max_price > last_price:
-                max_idx = max(prices, key=lambda x: x[1])[0]
-                end_idx = max_idx
-                start_discharge_idx = end_idx
-                soc = self.schedule[start_discharge_idx][f"estimated_soc_window_{n}"] if start_discharge_idx < len(self.schedule) and f"estimated_soc_window_{n}" in self.schedule[start_discharge_idx] else self.soc or 0
-                soc_needed = max(soc - min_soc, 0)
-                hours_needed = int((soc_needed + discharge_rate - 1) // discharge_rate)
-                if hours_needed < 1:
-                    continue
-                lookup = max(0, hours_needed - 1)
-                idxs = list(range(max(0, start_discharge_idx - lookup), min(len(self.price_data), start_discharge_idx + lookup + 1)))
-                prices = [(i, float(self.price_data[i]["value"])) for i in idxs]
-            # Välj de timmar med högst pris, men endast om de uppnår min_profit
-            avg_charge_price = window.get("avg_charge_price", 0)
-            discharge_candidates = [(i, price) for i, price in prices if price >= avg_charge_price + min_profit]
-            discharge_candidates.sort(key=lambda x: x[1], reverse=True)
-            discharge_idxs = sorted([i for i, _ in discharge_candidates[:hours_needed]])
-            # Markera i self.schedule
-            current_soc = soc
-            for i in range(len(self.price_data)):
-                entry = self.price_data[i]
-                in_window = i in discharge_idxs
-                end_dt = datetime.fromisoformat(entry["end"])
-                is_future = end_dt > now
-                discharge = 1 if in_window and is_future and current_soc > min_soc else 0
-                if discharge:
-                    current_soc = max(current_soc - discharge_rate, min_soc)
-                if i < len(self.schedule):
-                    self.schedule[i][f"discharge_window_{n}"] = discharge
-                    self.schedule[i][f"estimated_soc_discharge_window_{n}"] = round(current_soc, 2)
-            # Sätt charge=0 för alla timmar som är tomma i window n efter discharge start
-            if discharge_idxs:
-                discharge_start_idx = discharge_idxs[0]
-                for j in range(discharge_start_idx, len(self.schedule)):
-                    if f"charge_window_{n}" in self.schedule[j]:
-                        self.schedule[j][f"charge_window_{n}"] = 0
-        return True
+        config = {**entry.data, **entry.options}
+        return any(
+            config.get(key) != self.config.get(key)
+            for key in config.keys() | self.config.keys()
+            if key not in SETTABLE_OPTIONS
+        )
 
     async def async_set_charging(self, value: bool):
-        self.charging_on = value
-        # Spara till entry.options (persistent lagring)
-        entry = self.config_entry
-        if entry is not None:
-            new_options = dict(entry.options)
-            new_options['charging_on'] = value
-            self.hass.config_entries.async_update_entry(entry, options=new_options)
-        _LOGGER.debug(f"Set charging_on to {value}")
-        await self.async_update_sensors()
+        self.async_set_option("charging_on", bool(value))
+        _LOGGER.debug("Set charging_on to %s", value)
 
     async def async_set_discharging(self, value: bool):
-        self.discharging_on = value
-        # Spara till entry.options (persistent lagring)
-        entry = self.config_entry
-        if entry is not None:
-            new_options = dict(entry.options)
-            new_options['discharging_on'] = value
-            self.hass.config_entries.async_update_entry(entry, options=new_options)
-        _LOGGER.debug(f"Set discharging_on to {value}")
-        await self.async_update_sensors()
+        self.async_set_option("discharging_on", bool(value))
+        _LOGGER.debug("Set discharging_on to %s", value)
 
     async def async_set_self_usage(self, value: bool):
-        self.self_usage_on = value
-        # Spara till entry.options (persistent lagring)
-        entry = self.config_entry
-        if entry is not None:
-            new_options = dict(entry.options)
-            new_options['self_usage_on'] = value
-            self.hass.config_entries.async_update_entry(entry, options=new_options)
-        _LOGGER.debug(f"Self usage set to {self.self_usage_on}")
-        await self.async_update_sensors()
+        self.async_set_option("self_usage_on", bool(value))
+        _LOGGER.debug("Self usage set to %s", self.self_usage_on)
+        # Self use behöver ingen omplanering för att slås av/på
+        self.self_use_controller.async_evaluate()
 
     async def async_toggle_self_usage(self):
-        self.self_usage_on = not self.self_usage_on
-        _LOGGER.debug(f"Self usage toggled to {self.self_usage_on}")
-        await self.async_update_sensors()
+        await self.async_set_self_usage(not self.self_usage_on)
 
     async def self_use_automation(self):
         """
         Self use får endast vara aktivt när vi är i idle enligt schemat.
-        Om self use-switchen är OFF är automationen helt avstängd.
-        Om nästa schemalagda action efter nu är charge eller discharge (oavsett ordning), använd Alt 2-logik:
-        self use är aktiv om solel > 20W i 2 mätningar i rad.
-        Annars: default (solel > konsumtion i 2 mätningar).
+        Körs efter varje ombyggnad så att ett nytt schema slår igenom direkt; däremellan
+        styrs self use av SelfUseController på sol-, förbruknings- och batterieffekt-events.
         """
-        # Om self use-switchen är OFF, stäng av self use och returnera
-        if not self.self_usage_on:
-            if getattr(self, '_self_use_active', False):
-                self._self_use_active = False
-                self.async_write_ha_state_all()
-            return
-        # Kontrollera att vi är i idle enligt schemat
-        now = datetime.now()
-        in_idle = False
-        current_idx = None
-        for idx, entry in enumerate(self.schedule):
-            start = entry.get("start")
-            end = entry.get("end")
-            if start and end:
-                try:
-                    start_dt = datetime.fromisoformat(start)
-                    end_dt = datetime.fromisoformat(end)
-                    if start_dt <= now < end_dt and entry.get("action") == "idle":
-                        in_idle = True
-                        current_idx = idx
-                        break
-                except Exception:
-                    continue
-        if not in_idle:
-            if getattr(self, '_self_use_active', False):
-                self._self_use_active = False
-                self.async_write_ha_state_all()
-            return
-        # Dynamiskt: Finns charge eller discharge först efter nu?
-        next_action = None
-        next_action_idx = None
-        if current_idx is not None:
-            for idx in range(current_idx+1, len(self.schedule)):
-                action = self.schedule[idx].get("action")
-                if action in ("charge", "discharge"):
-                    next_action = action
-                    next_action_idx = idx
-                    break
-        use_alt2 = next_action in ("charge", "discharge")
-        # Hämta sol och konsumtion
-        solar_entity = self.config.get("solar_entity")
-        consumption_entity = self.config.get("consumption_entity")
-        solar = self.hass.states.get(solar_entity)
-        consumption = self.hass.states.get(consumption_entity)
-        try:
-            solar_val = float(solar.state) if solar and solar.state not in (None, "", "unknown", "unavailable") else 0
-        except Exception:
-            solar_val = 0
-        try:
-            consumption_val = float(consumption.state) if consumption and consumption.state not in (None, "", "unknown", "unavailable") else 0
-        except Exception:
-            consumption_val = 0
-        # Historik för 2 senaste mätningar
-        if not hasattr(self, '_self_use_history'):
-            self._self_use_history = []
-        # --- Alternativ 2: sol > 20W i 2 mätningar ---
-        if use_alt2:
-            self._self_use_history.append(solar_val > 20)
-        else:
-            self._self_use_history.append(solar_val > consumption_val)
-        if len(self._self_use_history) > 2:
-            self._self_use_history.pop(0)
-        # Aktivera self use om 2 i rad är True
-        if self._self_use_history == [True, True]:
-            if not getattr(self, '_self_use_active', False):
-                self._self_use_active = True
-                self.async_write_ha_state_all()
-            return
-        # Avaktivera self use om 2 i rad är False och SoC < 97% av max
-        soc = self.soc if self.soc is not None else 0
-        max_soc = self.max_battery_soc if hasattr(self, 'max_battery_soc') else 100
-        if self._self_use_history == [False, False] and soc < 0.97 * max_soc:
-            if getattr(self, '_self_use_active', False):
-                self._self_use_active = False
-                self.async_write_ha_state_all()
-        # --- END dynamisk self use-logik ---
-        return
+        self.self_use_controller.async_evaluate()
 
+    @callback
     def async_write_ha_state_all(self):
-        # Uppdatera alla entiteter (framförallt sensorn) så att self use-status syns live
-        for callback in list(self._entity_update_callbacks):
-            if callable(callback):
-                try:
-                    result = callback()
-                    if hasattr(result, "__await__"):
-                        import asyncio
-                        asyncio.create_task(result)
-                except Exception as e:
-                    _LOGGER.error(f"Error in entity update callback: {e}")
+        # Self use-status syns live: bara entiteter vars värde ändrats skrivs (framförallt sensorn)
+        self.async_update_listeners()
 
     __all__ = ["HomeBatteryOptimizerCoordinator"]
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""Exact charge/idle/discharge planning by dynamic programming over a discretized SoC grid."""
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy saknas: ren Python-loop (långsammare men samma resultat)
+    np = None
+
+from .schedule_store import (
+    ACTION_CHARGE,
+    ACTION_DISCHARGE,
+    ACTION_IDLE,
+    ScheduleStore,
+)
+
+DEFAULT_SOC_RESOLUTION = 1.0  # procentenheter per gridsteg
+DEFAULT_CAPACITY_KWH = 10.0
+
+_INF = float("inf")
+
+
+class SocGrid:
+    """
+    SoC grid 0..100% for the value function, with the transitions allowed by min/max SoC and
+    per-slot rates. Steps are exact (not rounded to the grid), clamped the same way as
+    schedule_cost; the value between grid points is interpolated.
+    """
+
+    def __init__(self, charge_step, discharge_step, min_soc, max_soc, resolution=DEFAULT_SOC_RESOLUTION,
+                 capacity_kwh=DEFAULT_CAPACITY_KWH, allow_charge=True, allow_discharge=True):
+        self.resolution = resolution
+        self.size = int(round(100 / resolution)) + 1
+        self.min_soc = min_soc
+        self.max_soc = max_soc
+        self.charge_step = charge_step if allow_charge and charge_step > 0 else 0.0
+        self.discharge_step = discharge_step if allow_discharge and discharge_step > 0 else 0.0
+        self.kwh_per_percent = capacity_kwh / 100
+        # Mål (bråkdelsindex i griden) och flyttad energi (kWh) per starttillstånd; -1 = otillåtet
+        self.charge_to = []
+        self.charge_kwh = []
+        self.discharge_to = []
+        self.discharge_kwh = []
+        for s in range(self.size):
+            for action, targets, energies in (
+                (ACTION_CHARGE, self.charge_to, self.charge_kwh),
+                (ACTION_DISCHARGE, self.discharge_to, self.discharge_kwh),
+            ):
+                step = self.transition(self.soc(s), action)
+                targets.append(-1 if step is None else self.position(step[0]))
+                energies.append(0.0 if step is None else step[1])
+
+    def transition(self, soc, action):
+        """(SoC after the slot, kWh moved) for action from soc, or None when the action is not allowed."""
+        if action == ACTION_CHARGE:
+            if not self.charge_step or soc >= self.max_soc:
+                return None
+            moved = min(self.charge_step, self.max_soc - soc)
+            return soc + moved, moved * self.kwh_per_percent
+        if action == ACTION_DISCHARGE:
+            if not self.discharge_step or soc <= self.min_soc:
+                return None
+            moved = min(self.discharge_step, soc - self.min_soc)
+            return soc - moved, moved * self.kwh_per_percent
+        return soc, 0.0
+
+    def position(self, soc):
+        """Fractional grid index of soc."""
+        return min(self.size - 1, max(0.0, soc / self.resolution))
+
+    def soc(self, idx):
+        return idx * self.resolution
+
+
+def _interpolate(value, position):
+    lo = int(position)
+    if lo >= len(value) - 1:
+        return value[-1]
+    return value[lo] + (value[lo + 1] - value[lo]) * (position - lo)
+
+
+def _solve_numpy(prices, grid, min_profit, terminal_price):
+    size = grid.size
+    states = np.arange(size)
+    charge_to = np.asarray(grid.charge_to, dtype=float)
+    discharge_to = np.asarray(grid.discharge_to, dtype=float)
+    charge_ok = charge_to >= 0
+    discharge_ok = discharge_to >= 0
+    charge_kwh = np.asarray(grid.charge_kwh)
+    discharge_kwh = np.asarray(grid.discharge_kwh)
+    charge_pos = np.where(charge_ok, charge_to, 0)
+    discharge_pos = np.where(discharge_ok, discharge_to, 0)
+    value = -terminal_price * states * grid.resolution * grid.kwh_per_percent
+    values = [None] * len(prices) + [value.tolist()]
+    for t in range(len(prices) - 1, -1, -1):
+        price = prices[t]
+        costs = np.empty((3, size))
+        costs[ACTION_IDLE] = value
+        costs[ACTION_CHARGE] = np.where(charge_ok, price * charge_kwh + np.interp(charge_pos, states, value), _INF)
+        costs[ACTION_DISCHARGE] = np.where(
+            discharge_ok, np.interp(discharge_pos, states, value) - (price - min_profit) * discharge_kwh, _INF,
+        )
+        value = costs.min(axis=0)
+        values[t] = value.tolist()
+    return values
+
+
+def _solve_python(prices, grid, min_profit, terminal_price):
+    size = grid.size
+    value = [-terminal_price * grid.soc(s) * grid.kwh_per_percent for s in range(size)]
+    values = [None] * len(prices) + [value]
+    for t in range(len(prices) - 1, -1, -1):
+        price = prices[t]
+        new_value = [0.0] * size
+        for s in range(size):
+            best = value[s]
+            c = grid.charge_to[s]
+            if c >= 0:
+                best = min(best, price * grid.charge_kwh[s] + _interpolate(value, c))
+            d = grid.discharge_to[s]
+            if d >= 0:
+                best = min(best, _interpolate(value, d) - (price - min_profit) * grid.discharge_kwh[s])
+            new_value[s] = best
+        values[t] = new_value
+        value = new_value
+    return values
+
+
+def solve(prices, soc, grid, min_profit=0.0, terminal_price=None):
+    """
+    Return (actions, soc_after) for each price slot, minimizing energy cost.
+    Discharging earns price - min_profit per kWh, so a cycle only happens when the
+    spread beats min_profit. Energy left at the end is valued at terminal_price
+    (default: lowest price in the horizon). The actions are followed from the exact
+    SoC with exact steps, so soc_after is what schedule_cost will see.
+    """
+    prices = list(prices)
+    if not prices:
+        return [], []
+    if terminal_price is None:
+        terminal_price = min(prices)
+    solver = _solve_numpy if np is not None else _solve_python
+    values = solver(prices, grid, min_profit, terminal_price)
+    actions = []
+    soc_after = []
+    for t, price in enumerate(prices):
+        next_value = values[t + 1]
+        best_action, best_soc = ACTION_IDLE, soc
+        best = _interpolate(next_value, grid.position(soc))
+        for action in (ACTION_CHARGE, ACTION_DISCHARGE):
+            step = grid.transition(soc, action)
+            if step is None:
+                continue
+            new_soc, kwh = step
+            gain = price * kwh if action == ACTION_CHARGE else -(price - min_profit) * kwh
+            cost = gain + _interpolate(next_value, grid.position(new_soc))
+            if cost < best:
+                best, best_action, best_soc = cost, action, new_soc
+        soc = best_soc
+        actions.append(best_action)
+        soc_after.append(soc)
+    return actions, soc_after
+
+
+def plan_dp(calendar, prices, soc, current_slot, charge_step, discharge_step, min_soc, max_soc, min_profit,
+            capacity_kwh=DEFAULT_CAPACITY_KWH, charging_on=True, discharging_on=True,
+            resolution=DEFAULT_SOC_RESOLUTION):
+    """Build a ScheduleStore with the DP-optimal plan from current_slot onwards."""
+    schedule = ScheduleStore(calendar, prices)
+    grid = SocGrid(charge_step, discharge_step, min_soc, max_soc, resolution, capacity_kwh,
+                   allow_charge=charging_on, allow_discharge=discharging_on)
+    actions, soc_after = solve(schedule.price[current_slot:], soc, grid, min_profit)
+    for i in range(current_slot):
+        schedule.passed[i] = 1
+    moved = array("d", bytes(8 * len(schedule)))
+    prev_soc = soc
+    window_id = 0
+    cycle_has_discharge = False
+    first_last = {}
+    for offset, action in enumerate(actions):
+        i = current_slot + offset
+        schedule.action[i] = action
+        schedule.estimated_soc[i] = round(soc_after[offset], 2)
+        moved[i] = soc_after[offset] - prev_soc
+        prev_soc = soc_after[offset]
+        if action == ACTION_CHARGE:
+            schedule.charge[i] = 1
+            # Ny cykel (window) när laddning startar efter en urladdning
+            if cycle_has_discharge or window_id == 0:
+                window_id += 1
+                cycle_has_discharge = False
+        elif action == ACTION_DISCHARGE:
+            schedule.discharge[i] = 1
+            window_id = window_id or 1
+            cycle_has_discharge = True
+        else:
+            continue
+        first, _ = first_last.get(window_id, (i, i))
+        first_last[window_id] = (first, i)
+    for window_id, (first, last) in first_last.items():
+        for i in range(first, last + 1):
+            schedule.window[i] = window_id
+    schedule.summarize_windows(moved, capacity_kwh / 100)
+    return schedule
+
+
+def schedule_cost(schedule, soc, current_slot, charge_step, discharge_step, min_soc, max_soc,
+                  capacity_kwh=DEFAULT_CAPACITY_KWH, terminal_price=None):
+    """
+    Net energy cost of following the schedule's actions from current_slot with the given SoC.
+    The SoC change over the horizon is valued at terminal_price, as in solve().
+    """
+    kwh_per_percent = capacity_kwh / 100
+    if terminal_price is None:
+        terminal_price = min(schedule.price[current_slot:], default=0.0)
+    start_soc = soc
+    cost = 0.0
+    for i in range(current_slot, len(schedule)):
+        action = schedule.action[i]
+        if action == ACTION_CHARGE and soc < max_soc:
+            moved = min(charge_step, max_soc - soc)
+            soc += moved
+            cost += schedule.price[i] * moved * kwh_per_percent
+        elif action == ACTION_DISCHARGE and soc > min_soc:
+            moved = min(discharge_step, soc - min_soc)
+            soc -= moved
+            cost -= schedule.price[i] * moved * kwh_per_percent
+    cost -= terminal_price * (soc - start_soc) * kwh_per_percent
+    return round(cost, 2)
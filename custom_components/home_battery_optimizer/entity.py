@@ -21,9 +21,7 @@ class HBOEntity(Entity):
             self._attr_unique_id = f"{config_entry.entry_id}_schedule"
             self._attr_name = "Battery Schedule"
             self.entity_description = None
-        # Register update callback for state refresh
-        if hasattr(self.coordinator, "add_update_callback"):
-            self.coordinator.add_update_callback(self.async_write_ha_state)
+        # Registreras mot coordinatorn i async_added_to_hass (en gång per entitet)
         # DO NOT set entity_id manually!
 
     @property
@@ -111,14 +109,12 @@ class HBOEntity(Entity):
             return self.entity_description.force_update
         return False
 
+    def subscription_value(self):
+        """What this entity exposes; its state is only written when this changes."""
+        return self.state
+
     async def async_added_to_hass(self):
-        # Register for coordinator updates if available
-        if hasattr(self.coordinator, 'async_update_listeners'):
-            if not hasattr(self.coordinator, '_entity_update_callbacks'):
-                self.coordinator._entity_update_callbacks = set()
-            self.coordinator._entity_update_callbacks.add(self.async_write_ha_state)
-
-    async def async_will_remove_from_hass(self):
-        # Unregister from coordinator updates
-        if hasattr(self.coordinator, '_entity_update_callbacks'):
-            self.coordinator._entity_update_callbacks.discard(self.async_write_ha_state)
+        # En registrering per entitet; tas bort automatiskt när entiteten tas bort
+        subscriptions = getattr(self.coordinator, 'subscriptions', None)
+        if subscriptions is not None:
+            self.async_on_remove(subscriptions.async_add(self, self.subscription_value, self.async_write_ha_state))
@@ -0,0 +1,207 @@
+"""
+Fleet mode: several batteries behind the same meter and price entity planned together.
+
+The members are combined into one virtual battery (capacities and kW rates add up,
+SoC and limits are capacity-weighted), planned in one pass, and the joint schedule is
+split back: every member follows the fleet's action in each slot at its own rate and
+within its own limits, so the fleet's energy per slot is shared in proportion to each
+member's power.
+"""
+import logging
+from array import array
+
+from .dp_optimizer import schedule_cost
+from .plan_cache import PlanCache
+from .planner import plan
+from .schedule_store import ACTION_CHARGE, ACTION_DISCHARGE, ACTION_IDLE, ScheduleStore
+
+FLEETS = "_fleets"  # Nyckel i hass.data[DOMAIN]: {price_entity: Fleet}
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def aggregate_inputs(members):
+    """One PlanInputs for the virtual battery made of all members (same prices and slot)."""
+    first = members[0]
+    capacity = sum(m.capacity_kwh for m in members) or 1.0
+
+    def weighted(field):
+        return sum(getattr(m, field) * m.capacity_kwh for m in members) / capacity
+
+    def weighted_curve(curve_field, rate_field):
+        # Inlärd %/h per SoC-band av den egna kapaciteten -> %/h av flottans kapacitet; medlemmar
+        # utan kurva bidrar med sin konstanta rate i alla band
+        curves = [getattr(m, curve_field) for m in members]
+        learned = [curve for curve in curves if curve]
+        if not learned or any(len(curve) != len(learned[0]) for curve in learned):
+            return None
+        bands = []
+        for band in range(len(learned[0])):
+            total = sum((curve[band] if curve else getattr(m, rate_field)) * m.capacity_kwh for m, curve in zip(members, curves))
+            bands.append(total / capacity)
+        return tuple(bands)
+
+    def summed_net_load():
+        # kWh per slot adderas över husen; planeraren räknar om till procent av flottans kapacitet
+        loads = [m.net_load for m in members if m.net_load is not None]
+        if not loads or any(len(load) != len(loads[0]) for load in loads):
+            return None
+        return tuple(round(sum(values), 3) for values in zip(*loads))
+
+    return first._replace(
+        soc=weighted("soc"),
+        # %/h av den egna kapaciteten -> kW -> %/h av flottans kapacitet
+        charge_rate=weighted("charge_rate"),
+        discharge_rate=weighted("discharge_rate"),
+        min_soc=weighted("min_soc"),
+        max_soc=weighted("max_soc"),
+        min_profit=max(m.min_profit for m in members),
+        charging_on=any(m.charging_on for m in members),
+        discharging_on=any(m.discharging_on for m in members),
+        capacity_kwh=capacity,
+        net_load=summed_net_load(),
+        charge_curve=weighted_curve("charge_curve", "charge_rate"),
+        discharge_curve=weighted_curve("discharge_curve", "discharge_rate"),
+    )
+
+
+def split_schedule(fleet_schedule, inputs):
+    """The member's share of a fleet schedule: same actions, own SoC trajectory and switches."""
+    schedule = ScheduleStore(fleet_schedule.calendar, fleet_schedule.price)
+    charge_step, discharge_step = inputs.slot_steps()
+    n = len(schedule)
+    moved = array("d", bytes(8 * n))
+    soc = inputs.soc
+    for i in range(n):
+        schedule.window[i] = fleet_schedule.window[i]
+        if i < inputs.current_slot:
+            schedule.passed[i] = 1
+            schedule.action[i] = fleet_schedule.action[i]
+            schedule.charge[i] = fleet_schedule.charge[i]
+            schedule.discharge[i] = fleet_schedule.discharge[i]
+            schedule.estimated_soc[i] = round(soc, 2)
+            continue
+        action = fleet_schedule.action[i]
+        if action == ACTION_CHARGE and inputs.charging_on and soc < inputs.max_soc:
+            new_soc = min(soc + charge_step, inputs.max_soc)
+            schedule.charge[i] = 1
+        elif action == ACTION_DISCHARGE and inputs.discharging_on and soc > inputs.min_soc:
+            new_soc = max(soc - discharge_step, inputs.min_soc)
+            schedule.discharge[i] = 1
+        else:
+            action = ACTION_IDLE
+            new_soc = soc
+        schedule.action[i] = action
+        moved[i] = new_soc - soc
+        soc = new_soc
+        schedule.estimated_soc[i] = round(soc, 2)
+    schedule.summarize_windows(moved, inputs.capacity_kwh / 100)
+    return schedule
+
+
+def plan_fleet(members):
+    """Plan the members jointly; returns one (schedule, report) per member, in order."""
+    fleet_inputs = aggregate_inputs(members)
+    fleet_schedule, fleet_report = plan(fleet_inputs)
+    fleet_summary = {
+        "members": len(members),
+        "capacity_kwh": fleet_inputs.capacity_kwh,
+        "cost": fleet_report["cost"],
+    }
+    results = []
+    for inputs in members:
+        schedule = split_schedule(fleet_schedule, inputs)
+        charge_step, discharge_step = inputs.slot_steps()
+        cost = schedule_cost(
+            schedule, inputs.soc, inputs.current_slot, charge_step, discharge_step,
+            inputs.min_soc, inputs.max_soc, inputs.capacity_kwh,
+        )
+        results.append((schedule, {"engine": fleet_report["engine"], "cost": cost, "fleet": fleet_summary}))
+    return results
+
+
+class Fleet:
+    """Coordinators in fleet mode sharing one price entity; their plans are made in one joint pass."""
+
+    def __init__(self):
+        self.members = []
+        self.plan_cache = PlanCache()
+        self.plans = 0
+        self._requested = set()  # Medlemmar med en begärd ombyggnad efter en ny gemensam plan
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, coordinator):
+        if coordinator not in self.members:
+            self.members.append(coordinator)
+        coordinator.fleet = self
+
+    def remove(self, coordinator):
+        if coordinator in self.members:
+            self.members.remove(coordinator)
+        coordinator.fleet = None
+        self._requested.discard(coordinator)
+        self.plan_cache.clear()
+
+    def _member_inputs(self, inputs):
+        # Alla planeras på samma prisserie och slot; medlemmar utan SoC väntar tills de har data
+        members = []
+        for member in self.members:
+            if member.soc is None:
+                continue
+            members.append((member, member.plan_inputs(inputs.current_slot)._replace(price_data=inputs.price_data)))
+        return members
+
+    def _lookup(self, inputs):
+        members = self._member_inputs(inputs)
+        key = tuple((id(member), member_inputs.fingerprint()) for member, member_inputs in members)
+        return members, key, self.plan_cache.get(key)
+
+    def _store(self, members, key, results):
+        results = {id(member): result for (member, _), result in zip(members, results)}
+        self.plan_cache.put(key, results)
+        self.plans += 1
+        return results
+
+    def plan_for(self, coordinator, inputs):
+        """(schedule, report) for coordinator from the joint plan (planned inline)."""
+        members, key, results = self._lookup(inputs)
+        if not members:
+            return None
+        if results is None:
+            results = self._store(members, key, plan_fleet([m for _, m in members]))
+        return results.get(id(coordinator))
+
+    async def async_plan_for(self, coordinator, inputs):
+        """Same as plan_for, planning in the executor; a new joint plan is pushed to the other members once."""
+        # En körning som en annan medlem begärt sprider inte vidare, annars kan ombyggnaderna
+        # fortsätta i ring så länge någons SoC hinner ändras
+        requested = coordinator in self._requested
+        self._requested.discard(coordinator)
+        members, key, results = self._lookup(inputs)
+        if not members:
+            return None
+        if results is not None:
+            return results.get(id(coordinator))
+        job = [m for _, m in members]
+        hass = coordinator.hass
+        timing = coordinator.instrumentation
+        if hass is None:
+            planned = timing.run(plan_fleet, job)
+        else:
+            planned = await timing.async_run_in_executor(hass, plan_fleet, job)
+        results = self._store(members, key, planned)
+        if not requested:
+            for member, _ in members:
+                if member is coordinator or member.hass is None or member in self._requested:
+                    continue
+                # Övriga medlemmar hämtar sin andel ur cachen vid nästa (debouncade) körning
+                _LOGGER.debug("Fleet plan changed, updating %s", member.config.get("battery_entity"))
+                self._requested.add(member)
+                member.update_scheduler.async_request()
+        return results.get(id(coordinator))
+
+    @property
+    def stats(self):
+        return {"members": len(self.members), "plans": self.plans, "plan_cache": self.plan_cache.stats}
@@ -0,0 +1,128 @@
+"""Low-overhead timing of the update path: per-stage rolling latency histograms."""
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+import time
+
+# Steg i uppdateringskedjan (coordinator._async_rebuild + sensorattribut)
+STAGE_SOC_READ = "soc_read"
+STAGE_PRICE_PARSE = "price_parse"
+STAGE_SCHEDULE_BUILD = "schedule_build"  # Väggtid inklusive kö i executorn
+STAGE_PLAN = "plan"  # Själva planeringen, mätt i executor-tråden
+STAGE_EXECUTOR_WAIT = "executor_wait"  # Tid i executorns kö innan planeringen startar
+STAGE_SELF_USE = "self_use"
+STAGE_LISTENERS = "listeners"
+STAGE_ATTRIBUTES = "attributes"
+STAGE_TOTAL = "total"
+STAGES = (
+    STAGE_SOC_READ,
+    STAGE_PRICE_PARSE,
+    STAGE_SCHEDULE_BUILD,
+    STAGE_PLAN,
+    STAGE_EXECUTOR_WAIT,
+    STAGE_SELF_USE,
+    STAGE_LISTENERS,
+    STAGE_ATTRIBUTES,
+    STAGE_TOTAL,
+)
+
+DEFAULT_WINDOW = 200  # Antal senaste mätningar per steg
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # Övre gränser; sista hinken är > 1000 ms
+
+
+class LatencyHistogram:
+    """Rolling window of durations (ms) with bucket counts and percentiles."""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.total_count = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, ms):
+        if len(self._samples) == self._samples.maxlen:
+            self._buckets[bisect_left(BUCKETS_MS, self._samples[0])] -= 1
+        self._samples.append(ms)
+        self._buckets[bisect_left(BUCKETS_MS, ms)] += 1
+        self.total_count += 1
+
+    def percentile(self, p):
+        """Nearest-rank percentile over the window, None when empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, -(-len(ordered) * p // 100))  # ceil
+        return ordered[int(rank) - 1]
+
+    @property
+    def buckets(self):
+        labels = [f"<={limit}ms" for limit in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return dict(zip(labels, self._buckets))
+
+    def summary(self):
+        if not self._samples:
+            return {"count": 0, "p50": None, "p95": None, "max": None, "last": None}
+        return {
+            "count": self.total_count,
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "max": round(max(self._samples), 3),
+            "last": round(self._samples[-1], 3),
+        }
+
+
+class Instrumentation:
+    """One LatencyHistogram per stage, filled by the stage() context manager."""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.histograms = {stage: LatencyHistogram(window) for stage in STAGES}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def run(self, func, *args):
+        """Call func inline, recording its run time as the plan stage."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.record(STAGE_PLAN, (time.perf_counter() - start) * 1000)
+
+    async def async_run_in_executor(self, hass, func, *args):
+        """
+        Run func in the executor. The queue wait and the run time inside the worker thread are
+        recorded separately (executor_wait, plan), so a busy executor does not inflate plan.
+        """
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return started, func(*args), None, time.perf_counter()
+            except Exception as err:  # Tiden registreras ändå; felet kastas om i event-loopen
+                return started, None, err, time.perf_counter()
+
+        # Histogrammen är inte trådsäkra, så tiderna registreras här och inte i executor-tråden
+        started, result, error, finished = await hass.async_add_executor_job(job)
+        self.record(STAGE_EXECUTOR_WAIT, (started - submitted) * 1000)
+        self.record(STAGE_PLAN, (finished - started) * 1000)
+        if error is not None:
+            raise error
+        return result
+
+    def record(self, name, ms):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram(self.histograms[STAGE_TOTAL]._samples.maxlen)
+        histogram.add(ms)
+
+    def summary(self):
+        """{stage: {count, p50, p95, max, last}} for every stage that has samples."""
+        return {name: histogram.summary() for name, histogram in self.histograms.items() if len(histogram)}
@@ -0,0 +1,219 @@
+import voluptuous as vol
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.event import async_track_time_interval, async_track_state_change_event
+from datetime import timedelta, datetime
+
+try:
+    from homeassistant.core import SupportsResponse
+except ImportError:  # Äldre Home Assistant: servicen kan inte returnera data
+    SupportsResponse = None
+
+from .const import PLANNERS
+from .coordinator import HomeBatteryOptimizerCoordinator
+from .fleet import FLEETS, Fleet
+from .price_service import PRICE_SERVICE, PriceService
+from .profile_learner import ProfileStore
+from .snapshot import ScheduleSnapshot
+from .telemetry import RateStore
+
+DOMAIN = "home_battery_optimizer"
+
+# En parameteruppsättning för simulate; utelämnade nycklar tas från entryts nuvarande inställningar
+SIMULATE_SCENARIO_SCHEMA = vol.Schema({
+    vol.Optional("soc"): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+    vol.Optional("charge_rate"): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+    vol.Optional("discharge_rate"): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+    vol.Optional("min_battery_soc"): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+    vol.Optional("max_battery_soc"): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+    vol.Optional("min_profit"): vol.Coerce(float),
+    vol.Optional("battery_capacity"): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+    vol.Optional("planner_engine"): vol.In(PLANNERS),
+    vol.Optional("charging_on"): cv.boolean,
+    vol.Optional("discharging_on"): cv.boolean,
+})
+
+SIMULATE_SCHEMA = vol.Schema({
+    vol.Required("scenarios"): vol.All(cv.ensure_list, [SIMULATE_SCENARIO_SCHEMA]),
+    vol.Optional("prices"): vol.All(cv.ensure_list, [vol.Coerce(float)], vol.Length(min=1)),
+    vol.Optional("entry_id"): cv.string,
+})
+
+async def async_setup(hass, config):
+    return True
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Set up a config entry for Home Battery Optimizer."""
+    hass.data.setdefault(DOMAIN, {})
+    # Kombinera entry.data och entry.options (options har företräde)
+    config = dict(entry.data)
+    config.update(entry.options)
+    # Prisentiteten parsas en gång per ändring, gemensamt för alla entries
+    price_service = hass.data[DOMAIN].get(PRICE_SERVICE)
+    if price_service is None:
+        price_service = hass.data[DOMAIN][PRICE_SERVICE] = PriceService(hass)
+    coordinator = HomeBatteryOptimizerCoordinator(hass, config, entry, price_service=price_service)  # Skicka med entry
+    # Starta från senast sparade pris och schema (stale tills live-data kommit), annars bygg första gången med alla passed=False
+    if not await coordinator.async_restore():
+        coordinator.build_full_schedule(force_all_unpassed=True)
+    await coordinator.async_load_profiles()
+    await coordinator.async_load_telemetry()
+    hass.data[DOMAIN][entry.entry_id] = coordinator
+
+    # Store unsubscribe callbacks for listeners
+    if "_unsub_listeners" not in hass.data[DOMAIN]:
+        hass.data[DOMAIN]["_unsub_listeners"] = {}
+    # Vid unload skrivs ändringar som väntar i options-bufferten direkt (utan omplanering)
+    unsub_list = [coordinator.update_scheduler.async_cancel, coordinator.options_buffer.async_write]
+    hass.data[DOMAIN]["_unsub_listeners"][entry.entry_id] = unsub_list
+
+    # Ändringar i options-dialogen (t.ex. planeringsmotor) kräver omladdning av entryt
+    unsub_list.append(entry.add_update_listener(async_options_updated))
+
+    # Flottläge: batterier bakom samma prisentitet planeras tillsammans
+    if config.get("fleet_mode") and config.get("nordpool_entity"):
+        fleet = hass.data[DOMAIN].setdefault(FLEETS, {}).setdefault(config["nordpool_entity"], Fleet())
+        fleet.add(coordinator)
+        unsub_list.append(lambda: fleet.remove(coordinator))
+
+    # Forward setup to sensor, switch, number and button platforms
+    await hass.config_entries.async_forward_entry_setups(entry, ["sensor", "switch", "number", "button"])
+
+    # --- Service handlers ---
+    async def handle_force_update_schedule(call):
+        """Force update the battery schedule and this integration's entities."""
+        for coordinator in list(hass.data[DOMAIN].values()):
+            if isinstance(coordinator, HomeBatteryOptimizerCoordinator):
+                await coordinator.async_update_sensors()
+                await coordinator.async_refresh_entities()
+
+    async def handle_force_charge(call):
+        """Force turn on the charging switch."""
+        entity_id = f"switch.battery_charging"
+        await hass.services.async_call("switch", "turn_on", {"entity_id": entity_id})
+
+    async def handle_force_discharge(call):
+        """Force turn on the discharging switch."""
+        entity_id = f"switch.battery_discharging"
+        await hass.services.async_call("switch", "turn_on", {"entity_id": entity_id})
+
+    async def handle_simulate(call):
+        """What-if plans for a batch of parameter sets, returned as response data."""
+        entry_id = call.data.get("entry_id")
+        coordinators = [
+            coordinator for key, coordinator in hass.data[DOMAIN].items()
+            if isinstance(coordinator, HomeBatteryOptimizerCoordinator) and entry_id in (None, key)
+        ]
+        if not coordinators:
+            raise HomeAssistantError(f"No Home Battery Optimizer entry {entry_id or ''}".strip())
+        try:
+            results = await coordinators[0].async_simulate(call.data["scenarios"], call.data.get("prices"))
+        except ValueError as e:
+            raise HomeAssistantError(str(e)) from e
+        return {"results": results}
+
+    # Register services
+    hass.services.async_register(DOMAIN, "force_update_schedule", handle_force_update_schedule)
+    hass.services.async_register(DOMAIN, "force_charge", handle_force_charge)
+    hass.services.async_register(DOMAIN, "force_discharge", handle_force_discharge)
+    if SupportsResponse is not None:
+        hass.services.async_register(
+            DOMAIN, "simulate", handle_simulate, schema=SIMULATE_SCHEMA, supports_response=SupportsResponse.ONLY,
+        )
+
+    # --- Schemalägg automatisk uppdatering ---
+    async def scheduled_update(now):
+        coordinator = hass.data[DOMAIN][entry.entry_id]
+        await coordinator.async_update_sensors()
+
+    # Starta första körningen kl 00:00
+    now = datetime.now()
+    first_run = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if now > first_run:
+        # Om vi redan passerat midnatt idag, ta nästa dag
+        first_run = first_run + timedelta(days=1)
+    delay = (first_run - now)
+    async def start_periodic_updates(_):
+        coordinator = hass.data[DOMAIN][entry.entry_id]
+        await coordinator.async_update_sensors()
+        # Kör sedan var 15:e minut
+        async_track_time_interval(hass, scheduled_update, timedelta(minutes=15))
+    hass.loop.call_later(delay.total_seconds(), lambda: hass.async_create_task(start_periodic_updates(None)))
+
+    # Switcharna pollas inte längre: coordinatorn uppdaterar entryts egna entiteter när dess tillstånd ändras
+
+    # --- Listen for state changes on battery, price, and SoC-related entities ---
+    battery_entity = entry.data.get("battery_entity")
+    price_entity = entry.data.get("nordpool_entity")
+    soc_entities = [
+        entry.data.get("battery_entity"),
+        entry.data.get("target_soc_entity"),
+    ]
+    # Add more SoC-related entities if needed
+    def _is_soc_related(entity_id):
+        return entity_id in soc_entities and entity_id is not None
+
+    @callback
+    def _state_change_listener(event):
+        # Defensive: Only run if entry_id is still present
+        if entry.entry_id not in hass.data[DOMAIN]:
+            return
+        entry_coordinator = hass.data[DOMAIN][entry.entry_id]
+        # SoC till rate-modellen, oavsett deadband
+        entry_coordinator.async_observe_battery(event)
+        # Deadband + debounce: en skur av events ger en ombyggnad
+        entry_coordinator.update_scheduler.async_handle_event(event)
+    if battery_entity:
+        unsub = async_track_state_change_event(hass, [battery_entity], _state_change_listener)
+        unsub_list.append(unsub)
+    if price_entity:
+        # En gemensam listener per prisentitet i pristjänsten, som fördelar eventet till alla entries
+        unsub = price_service.async_listen(price_entity, _state_change_listener)
+        unsub_list.append(unsub)
+    # Listen for SoC-related entity changes (e.g. target_soc)
+    for soc_entity in soc_entities:
+        if soc_entity and soc_entity not in (battery_entity, price_entity):
+            unsub = async_track_state_change_event(hass, [soc_entity], _state_change_listener)
+            unsub_list.append(unsub)
+
+    # Sol, förbrukning och batterieffekt: profilinlärning och self use, utan att trigga omplanering
+    load_entities = [
+        entity for entity in (config.get("consumption_entity"), config.get("solar_entity"), config.get("battery_power_entity"))
+        if entity
+    ]
+
+    @callback
+    def _load_change_listener(event):
+        coordinator.async_observe_load(event)
+        coordinator.async_observe_battery(event)
+        coordinator.self_use_controller.async_handle_event(event)
+    coordinator.self_use_controller.async_read_states()
+    unsub_list.append(coordinator.self_use_controller.async_cancel)
+    if load_entities:
+        unsub_list.append(async_track_state_change_event(hass, load_entities, _load_change_listener))
+
+    return True
+
+async def async_options_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the entry when the options flow changed its setup; writes from number/switch setters are skipped."""
+    coordinator = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if coordinator is None or not coordinator.needs_reload(entry):
+        return
+    await hass.config_entries.async_reload(entry.entry_id)
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Unload a config entry."""
+    # Unsubscribe listeners if present
+    unsub_list = hass.data.get(DOMAIN, {}).get("_unsub_listeners", {}).pop(entry.entry_id, [])
+    for unsub in unsub_list:
+        unsub()
+    hass.data[DOMAIN].pop(entry.entry_id, None)
+    return True
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the saved schedule snapshot, load profiles and battery telemetry when the entry is deleted."""
+    await ScheduleSnapshot(hass, entry.entry_id).async_remove()
+    await ProfileStore(hass, entry.entry_id).async_remove()
+    await RateStore(hass, entry.entry_id).async_remove()
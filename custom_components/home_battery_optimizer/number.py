@@ -74,37 +74,5 @@ class BatteryOptimizerNumber(HBOEntity, NumberEntity):
         return 1
 
     async def async_set_native_value(self, value):
-        key = self._key
-        # 1. Uppdatera self.config
-        self.coordinator.config[key] = value
-        # 2. Spara till entry.options (persistent lagring)
-        hass = self.coordinator.hass
-        entry = self.config_entry
-        # Skapa ny options-dict med uppdaterat värde
-        new_options = dict(entry.options)
-        new_options[key] = value
-        hass.config_entries.async_update_entry(entry, options=new_options)
-        # 3. Uppdatera coordinator-attribut
-        if key == "charge_rate":
-            self.coordinator.charge_rate = value
-            if hasattr(self.coordinator, 'async_update_sensors'):
-                await self.coordinator.async_update_sensors()
-        elif key == "discharge_rate":
-            self.coordinator.discharge_rate = value
-            if hasattr(self.coordinator, 'async_update_sensors'):
-                await self.coordinator.async_update_sensors()
-        elif key == "max_battery_soc":
-            self.coordinator.max_battery_soc = value
-            if hasattr(self.coordinator, 'async_update_sensors'):
-                await self.coordinator.async_update_sensors()
-        elif key == "min_battery_soc":
-            self.coordinator.min_battery_soc = value
-            if hasattr(self.coordinator, 'async_update_sensors'):
-                await self.coordinator.async_update_sensors()
-        elif key == "min_profit":
-            self.coordinator.min_profit = value
-            if hasattr(self.coordinator, 'async_update_sensors'):
-                await self.coordinator.async_update_sensors()
-        self.async_write_ha_state()
-        if hasattr(self.coordinator, 'async_update_listeners'):
-            await self.coordinator.async_update_listeners()
\ No newline at end of file
+        # Värdet gäller direkt; options sparas och schemat planeras om när ändringarna lagt sig
+        self.coordinator.async_set_option(self._key, value)
@@ -0,0 +1,85 @@
+"""
+Write-behind buffer for the config entry's options.
+
+Setters (number entities, switches) apply their value to the coordinator immediately and
+merge it into the buffer. Once the changes have settled for the debounce interval, the
+buffer writes all of them with a single async_update_entry and starts a single replan.
+A continuous burst (a dragged slider) is flushed at the latest after MAX_DELAY seconds.
+"""
+import asyncio
+import logging
+
+from homeassistant.core import callback
+
+DEFAULT_FLUSH_DELAY = 2.0  # Sekunder utan nya ändringar innan options skrivs
+MAX_DELAY = 10.0  # Längsta tid en ändring får ligga oskriven
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class OptionsBuffer:
+    """Merges option changes and flushes them, plus one replan, per settled batch."""
+
+    def __init__(self, hass, entry, on_flush=None, delay=DEFAULT_FLUSH_DELAY, max_delay=MAX_DELAY):
+        self._hass = hass
+        self._entry = entry
+        self._on_flush = on_flush  # Async funktion som körs efter varje flush (omplanering)
+        self.delay = delay
+        self.max_delay = max_delay
+        self.pending = {}
+        self._timer = None
+        self._first_change = None
+        self.changes = 0
+        self.flushes = 0
+        self.writes = 0
+
+    @property
+    def stats(self):
+        return {"changes": self.changes, "flushes": self.flushes, "writes": self.writes, "pending": len(self.pending)}
+
+    @callback
+    def async_set(self, key, value):
+        """Merge one change and (re)start the debounce timer."""
+        self.changes += 1
+        self.pending[key] = value
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._first_change is None:
+            self._first_change = now
+        if self._timer is not None:
+            self._timer.cancel()
+        # Vänta tills ändringarna lagt sig, men aldrig längre än max_delay från första ändringen
+        delay = min(self.delay, max(0.0, self._first_change + self.max_delay - now))
+        self._timer = loop.call_later(delay, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        self.async_write()
+        if self._on_flush is None:
+            return
+        if self._hass is not None:
+            self._hass.async_create_task(self._on_flush())
+        else:
+            asyncio.ensure_future(self._on_flush())
+
+    @callback
+    def async_write(self):
+        """Write the pending changes to entry.options now (one storage write); no replan."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._first_change = None
+        if not self.pending:
+            return False
+        pending, self.pending = self.pending, {}
+        self.flushes += 1
+        entry = self._entry
+        if self._hass is None or entry is None:
+            return False
+        new_options = {**entry.options, **pending}
+        if new_options == dict(entry.options):
+            return False
+        self._hass.config_entries.async_update_entry(entry, options=new_options)
+        self.writes += 1
+        _LOGGER.debug("Wrote %s option change(s): %s", len(pending), sorted(pending))
+        return True
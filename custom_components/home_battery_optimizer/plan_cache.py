@@ -0,0 +1,61 @@
+"""Bounded LRU cache for planned schedules, keyed on an input fingerprint."""
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 32
+SOC_QUANTUM = 0.5  # SoC-skillnader under detta räknas som samma indata
+
+
+def quantize_soc(soc, quantum=SOC_QUANTUM):
+    """Round SoC to the nearest quantum so tiny sensor jitter maps to the same key."""
+    if soc is None:
+        return None
+    return round(round(soc / quantum) * quantum, 3)
+
+
+def price_fingerprint(price_data):
+    """Cheap hash of a price series (values and slot calendar)."""
+    if not price_data:
+        return None
+    return price_data.digest
+
+
+class PlanCache:
+    """Least-recently-used store of planning results with hit/miss counters."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached result for key (and mark it recent), or None."""
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+        }
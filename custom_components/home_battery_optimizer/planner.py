@@ -0,0 +1,390 @@
+"""Pure planning: an immutable input snapshot in, a schedule and cost report out (no hass access)."""
+from array import array
+from typing import NamedTuple
+
+from .const import PLANNER_DP, PLANNER_HEURISTIC
+from .dp_optimizer import DEFAULT_CAPACITY_KWH, plan_dp, schedule_cost
+from .plan_cache import price_fingerprint, quantize_soc
+from .price_series import PriceSeries
+from .schedule_store import (
+    ACTION_CHARGE,
+    ACTION_DISCHARGE,
+    ACTION_IDLE,
+    NO_SOC,
+    ScheduleStore,
+    SlotCalendar,
+)
+from .time_utils import slots_needed
+
+
+class RateCurve:
+    """Percent per slot as a function of SoC: a learned curve (%/hour per SoC band) or one constant step."""
+
+    __slots__ = ("steps", "_width")
+
+    def __init__(self, step, curve=None, slot_hours=1.0):
+        self.steps = tuple(rate * slot_hours for rate in curve) if curve else (step,)
+        self._width = 100 / len(self.steps)
+
+    def at(self, soc):
+        steps = self.steps
+        if len(steps) == 1:
+            return steps[0]
+        return steps[min(len(steps) - 1, max(0, int(soc // self._width)))]
+
+    def slots(self, soc, delta, sign=1):
+        """Slots needed to move delta percent from soc in direction sign (1% tolerance, as slots_needed)."""
+        if len(self.steps) == 1:
+            return slots_needed(delta, self.steps[0])
+        count = 0
+        moved = 0.0
+        while moved <= delta - 1:
+            step = self.at(soc + sign * moved)
+            if step <= 0:
+                break
+            moved += step
+            count += 1
+        return count
+
+
+class PlanInputs(NamedTuple):
+    """Everything a plan depends on, captured at one point in time."""
+
+    price_data: object  # PriceSeries
+    soc: float
+    current_slot: int = 0
+    charge_rate: float = 25.0  # %/timme
+    discharge_rate: float = 25.0  # %/timme
+    min_soc: float = 0.0
+    max_soc: float = 100.0
+    min_profit: float = 10.0
+    charging_on: bool = True
+    discharging_on: bool = True
+    engine: str = PLANNER_HEURISTIC
+    capacity_kwh: float = DEFAULT_CAPACITY_KWH
+    net_load: tuple = None  # Förväntad förbrukning - sol (kWh) per slot, från profile_learner
+    charge_curve: tuple = None  # Inlärd laddning i %/timme per SoC-band, från telemetry
+    discharge_curve: tuple = None  # Inlärd urladdning i %/timme per SoC-band
+
+    def slot_steps(self):
+        """Charge/discharge in percent per slot, from %/hour and the slot length."""
+        calendar = self.price_data.calendar if self.price_data else None
+        slot_hours = calendar.slot_hours if calendar is not None else 1.0
+        return self.charge_rate * slot_hours, self.discharge_rate * slot_hours
+
+    def rate_curves(self):
+        """RateCurve for charge and discharge: the learned curves if any, else the constant slot steps."""
+        calendar = self.price_data.calendar if self.price_data else None
+        slot_hours = calendar.slot_hours if calendar is not None else 1.0
+        charge_step, discharge_step = self.slot_steps()
+        return (
+            RateCurve(charge_step, self.charge_curve, slot_hours),
+            RateCurve(discharge_step, self.discharge_curve, slot_hours),
+        )
+
+    def fingerprint(self):
+        """Key for the plan cache: the inputs with SoC quantized and prices hashed."""
+        return (price_fingerprint(self.price_data), quantize_soc(self.soc)) + tuple(self[2:])
+
+
+def plan(inputs):
+    """Return (schedule, report) for the inputs using the selected engine."""
+    # Rates är i %/timme, skala till %/slot (15-minuterspriser = 1/4)
+    charge_step, discharge_step = inputs.slot_steps()
+    schedule = build_heuristic_schedule(inputs, charge_step, discharge_step)
+    cost_args = (inputs.soc, inputs.current_slot, charge_step, discharge_step, inputs.min_soc, inputs.max_soc, inputs.capacity_kwh)
+    heuristic_cost = schedule_cost(schedule, *cost_args)
+    report = {"engine": PLANNER_HEURISTIC, "cost": heuristic_cost}
+    if inputs.engine == PLANNER_DP:
+        # Exakt DP-plan; heuristiken körs ändå för att kunna rapportera skillnaden
+        schedule = plan_dp(
+            inputs.price_data.calendar, inputs.price_data.values, inputs.soc, inputs.current_slot,
+            charge_step, discharge_step, inputs.min_soc, inputs.max_soc, inputs.min_profit,
+            capacity_kwh=inputs.capacity_kwh,
+            charging_on=inputs.charging_on,
+            discharging_on=inputs.discharging_on,
+        )
+        dp_cost = schedule_cost(schedule, *cost_args)
+        report = {
+            "engine": PLANNER_DP,
+            "cost": dp_cost,
+            "heuristic_cost": heuristic_cost,
+            "savings_vs_heuristic": round(heuristic_cost - dp_cost, 2),
+        }
+    return schedule, report
+
+
+def can_freeze(previous, inputs):
+    """True if previous was planned on the same slots and prices up to current_slot (tomorrow may have been added)."""
+    current = inputs.current_slot
+    if not previous or previous.moved is None or current <= 0 or len(previous) < current:
+        return False
+    bounds = inputs.price_data.calendar.bounds
+    if len(bounds) <= current or previous.calendar.bounds[:current + 1] != bounds[:current + 1]:
+        return False
+    return previous.price[:current] == inputs.price_data.values[:current]
+
+
+def frozen_fingerprint(previous, inputs):
+    """Cache-key part for the frozen slots of an incremental plan (None when it will plan in full)."""
+    if not can_freeze(previous, inputs):
+        return None
+    current = inputs.current_slot
+    return hash((
+        previous.action[:current].tobytes(),
+        previous.window[:current].tobytes(),
+        previous.estimated_soc[:current].tobytes(),
+        previous.moved[:current].tobytes(),
+    ))
+
+
+def plan_incremental(inputs, previous):
+    """
+    Receding horizon: slots before current_slot are history and are copied from the previous
+    schedule unchanged; current_slot onwards is planned again in full, from the current SoC.
+    Later windows are not copied from the previous schedule: the heuristic is cheap, and
+    windows whose prices and entry SoC are unchanged come out with the same boundaries anyway.
+    When tomorrow's prices have been added since, the horizon simply extends. Falls back to a
+    full plan when the previous schedule does not match the calendar.
+    """
+    if not can_freeze(previous, inputs):
+        return plan(inputs)
+    current = inputs.current_slot
+    price_data = inputs.price_data
+    calendar = price_data.calendar
+    future = PriceSeries(SlotCalendar(calendar.bounds[current:]), price_data.values[current:])
+    net_load = inputs.net_load[current:] if inputs.net_load is not None else None
+    future_schedule, report = plan(inputs._replace(price_data=future, current_slot=0, net_load=net_load))
+    schedule = ScheduleStore(calendar, price_data.values)
+    moved = array("d", previous.moved[:current])
+    moved.extend(future_schedule.moved)
+    for column in ("action", "charge", "discharge", "window", "estimated_soc"):
+        target = getattr(schedule, column)
+        target[:current] = getattr(previous, column)[:current]
+        target[current:] = getattr(future_schedule, column)
+    for i in range(current):
+        schedule.passed[i] = 1
+    # Window som pågår över current_slot behåller sitt id (och sin start); nya windows numreras efter historiken
+    last_window = max(previous.window[:current])
+    ongoing = (
+        last_window
+        and previous.window[current - 1] == last_window
+        and len(previous) > current
+        and previous.window[current] == last_window
+        and future_schedule.window[0]
+    )
+    offset = last_window - 1 if ongoing else last_window
+    windows = schedule.window
+    for i in range(current, len(schedule)):
+        if windows[i]:
+            windows[i] += offset
+    schedule.summarize_windows(moved, inputs.capacity_kwh / 100)
+    return schedule, dict(report, frozen_slots=current)
+
+
+def build_heuristic_schedule(inputs, charge_step, discharge_step):
+    """Stepwise-heuristiken: lokalt minimum -> topp -> billigaste timmarna i varje window."""
+    max_soc = inputs.max_soc
+    min_soc = inputs.min_soc
+    min_profit = inputs.min_profit
+    current_slot = inputs.current_slot
+    soc = inputs.soc
+    schedule = ScheduleStore(inputs.price_data.calendar, inputs.price_data.values)
+    n = len(schedule)
+    prices = schedule.price
+    actions = schedule.action
+    charge = schedule.charge
+    discharge = schedule.discharge
+    windows = schedule.window
+    estimated_soc = schedule.estimated_soc
+    passed = schedule.passed
+    # Range-min/max över priserna, byggs en gång per prisvektor
+    index = inputs.price_data.index
+    # Förväntat solöverskott och husets last (procent av kapaciteten), som prefixsummor
+    surplus_sum = load_sum = None
+    if inputs.net_load is not None and len(inputs.net_load) == n:
+        percent_per_kwh = 100 / inputs.capacity_kwh
+        surplus_sum = array("d", [0.0])
+        load_sum = array("d", [0.0])
+        for kwh in inputs.net_load:
+            surplus_sum.append(surplus_sum[-1] + max(0.0, -kwh) * percent_per_kwh)
+            load_sum.append(load_sum[-1] + max(0.0, kwh) * percent_per_kwh)
+
+    def discharge_slots(end, soc_at_end):
+        # Urladdning behövs bara för det huset förväntas använda kring toppen
+        soc_needed = max(soc_at_end - min_soc, 0)
+        hours = discharge_curve.slots(soc_at_end, soc_needed, -1)
+        if load_sum is not None and hours >= 1:
+            lookup = max(0, hours - 1)
+            lo = max(0, end - lookup)
+            hi = min(n - 1, end + lookup)
+            hours = discharge_curve.slots(soc_at_end, min(soc_needed, load_sum[hi + 1] - load_sum[lo]), -1)
+        return hours
+
+    # Laddnings-/urladdningssteg per slot beroende på SoC (konstant utan inlärd kurva)
+    charge_curve, discharge_curve = inputs.rate_curves()
+    charge_at = charge_curve.at
+    discharge_at = discharge_curve.at
+
+    # SoC-förändring per slot, används till window-sammanfattningen
+    moved = array("d", bytes(8 * n))
+    # Initiera passed-kolumnen från kalendern (passerade slots ligger alltid först)
+    for i in range(current_slot):
+        passed[i] = 1
+    # Window-skapande och laddlogik utgår nu från första timmen, och logik körs för ALLA timmar
+    window_counter = 1
+    idx = 0
+    prev_discharge_end = 0
+    prev_soc = soc
+    stalled_states = set()
+    while idx < n:
+        # a) Första möjliga start efter prev_discharge_end (även passed)
+        if prev_discharge_end >= n:
+            break
+        start_idx = prev_discharge_end
+        # b) Hitta window: fallande pris till minimum, sedan ökning >= min_profit
+        i = start_idx
+        # Hitta lokal minimum
+        while i+1 < n and prices[i+1] < prices[i]:
+            i += 1
+        min_idx = i
+        min_price = prices[min_idx]
+        # Hitta första index där priset ökar minst min_profit
+        found = False
+        j = min_idx + 1
+        while j < n:
+            if prices[j] >= min_price + min_profit:
+                found = True
+                break
+            if prices[j] < min_price:
+                min_price = prices[j]
+                min_idx = j
+            j += 1
+        if not found:
+            break
+        # Hitta peak (slut på window)
+        peak_idx = j
+        peak_price = prices[peak_idx]
+        k = j + 1
+        while k < n and prices[k] > peak_price:
+            peak_idx = k
+            peak_price = prices[k]
+            k += 1
+        window_start = start_idx
+        window_end = peak_idx
+        # c) Planera laddning i window (alla timmar)
+        soc_needed = max(0, max_soc - prev_soc)
+        if surplus_sum is not None:
+            # Solöverskott i window laddar gratis, köp bara resten från nätet
+            soc_needed = max(0, soc_needed - (surplus_sum[window_end + 1] - surplus_sum[window_start]))
+        hours_needed = charge_curve.slots(prev_soc, soc_needed)
+        if soc_needed < 5:
+            hours_needed = 0
+        charge_idxs = set(index.k_smallest(window_start, window_end, hours_needed))
+        current_soc = prev_soc
+        charge_prices = []
+        for i in range(window_start, window_end+1):
+            if i in charge_idxs and current_soc < max_soc - 5:
+                charge[i] = 1
+                actions[i] = ACTION_CHARGE
+                charge_prices.append(prices[i])
+                new_soc = min(current_soc + charge_at(current_soc), max_soc)
+                moved[i] = new_soc - current_soc
+                current_soc = new_soc
+            else:
+                charge[i] = 0
+            windows[i] = window_counter
+            estimated_soc[i] = round(current_soc, 2)
+        avg_charge_price = sum(charge_prices) / len(charge_prices) if charge_prices else 0
+        # d) Bygg discharge för window (alla timmar)
+        discharge_soc = schedule.soc_at(window_end)
+        if discharge_soc is None:
+            discharge_soc = current_soc
+        hours_needed_discharge = discharge_slots(window_end, discharge_soc)
+        if hours_needed_discharge < 1:
+            prev_discharge_end = window_end + 1
+            prev_soc = current_soc
+            window_counter += 1
+            continue
+        lookup = max(0, hours_needed_discharge - 1)
+        lo = max(0, window_end - lookup)
+        hi = min(n - 1, window_end + lookup)
+        max_idx = index.argmax(lo, hi)
+        # Flytta window-slut till dyraste timmen runt slutet tills slutet själv är dyrast
+        while prices[max_idx] > prices[window_end]:
+            window_end = max_idx
+            discharge_soc = schedule.soc_at(window_end)
+            if discharge_soc is None:
+                discharge_soc = current_soc
+            hours_needed_discharge = discharge_slots(window_end, discharge_soc)
+            if hours_needed_discharge < 1:
+                break
+            lookup = max(0, hours_needed_discharge - 1)
+            lo = max(0, window_end - lookup)
+            hi = min(n - 1, window_end + lookup)
+            max_idx = index.argmax(lo, hi)
+        # Dyraste timmarna först; de som klarar min_profit är alltid ett prefix av den ordningen
+        discharge_idxs = sorted(
+            i for i in index.k_largest(lo, hi, hours_needed_discharge)
+            if prices[i] >= avg_charge_price + min_profit
+        )
+        current_soc = discharge_soc
+        # NY LOGIK: Fyll i alla timmar mellan första och sista discharge-timmen
+        if discharge_idxs:
+            discharge_start = discharge_idxs[0]
+            discharge_end = discharge_idxs[-1]
+            for i in range(discharge_start, discharge_end + 1):
+                discharge[i] = 1
+                actions[i] = ACTION_DISCHARGE
+                windows[i] = window_counter
+                charge[i] = 0  # Ta bort eventuell laddning
+                estimated_soc[i] = round(current_soc, 2)
+                new_soc = max(current_soc - discharge_at(current_soc), min_soc)
+                moved[i] = new_soc - current_soc
+                current_soc = new_soc
+            # Fyll i tomma window-index mellan prev_discharge_end och discharge_end
+            for i in range(prev_discharge_end, discharge_end + 1):
+                if not windows[i]:
+                    windows[i] = window_counter
+        # Om du vill nollställa charge på övriga timmar i window efter discharge_start, kan du lägga till det här
+        if discharge_idxs:
+            prev_discharge_end = discharge_end + 1
+            prev_soc = current_soc
+        else:
+            prev_discharge_end = window_end + 1
+            prev_soc = current_soc
+        # Discharge-sökningen kan hamna före window-start. Att gå bakåt blir oftast klart, så tvinga
+        # bara framsteg när samma läge återkommer (då hade loopen aldrig tagit slut)
+        if prev_discharge_end <= start_idx:
+            state = hash((
+                prev_discharge_end, prev_soc, actions.tobytes(), charge.tobytes(),
+                estimated_soc.tobytes(), bytes(bool(w) for w in windows),
+            ))
+            if state in stalled_states:
+                prev_discharge_end = max(window_end, start_idx) + 1
+            stalled_states.add(state)
+        window_counter += 1
+    # Efter att hela schemat är byggt: fyll i alla tomma värden för estimated_soc
+    last_soc = NO_SOC
+    for i in range(n):
+        if estimated_soc[i] == estimated_soc[i]:
+            last_soc = estimated_soc[i]
+        else:
+            estimated_soc[i] = last_soc
+    # Avbryt pågående och framtida charge/discharge i schemat om respektive switch är OFF, men lämna passerade timmar orörda.
+    for i in range(n):
+        # Om timmen är passerad, låt den vara
+        if passed[i]:
+            continue
+        # Om charging är avstängd, nollställ charge och action för framtida timmar
+        if not inputs.charging_on and charge[i] == 1:
+            charge[i] = 0
+            if actions[i] == ACTION_CHARGE:
+                actions[i] = ACTION_IDLE
+        # Om discharging är avstängd, nollställ discharge och action för framtida timmar
+        if not inputs.discharging_on and discharge[i] == 1:
+            discharge[i] = 0
+            if actions[i] == ACTION_DISCHARGE:
+                actions[i] = ACTION_IDLE
+    schedule.summarize_windows(moved, inputs.capacity_kwh / 100)
+    return schedule
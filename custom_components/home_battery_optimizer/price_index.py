@@ -0,0 +1,97 @@
+"""Range queries over one price vector: O(1) range min/max and k-smallest/k-largest selection."""
+from array import array
+import heapq
+
+
+class PriceIndex:
+    """
+    Sparse tables of argmin/argmax per power-of-two span, built once per price vector
+    (O(n log n)). Ties resolve to the lowest index, like max()/min()/sorted() on the
+    index-ordered list the planner used before.
+    """
+
+    __slots__ = ("values", "_min", "_max", "_log")
+
+    def __init__(self, values):
+        self.values = values
+        n = len(values)
+        # _log[m] = floor(log2(m))
+        self._log = array("b", [0]) * (n + 1)
+        for m in range(2, n + 1):
+            self._log[m] = self._log[m >> 1] + 1
+        self._min = [array("l", range(n))]
+        self._max = [array("l", range(n))]
+        span = 1
+        while 2 * span <= n:
+            prev_min = self._min[-1]
+            prev_max = self._max[-1]
+            level_min = array("l", [0]) * (n - 2 * span + 1)
+            level_max = array("l", [0]) * (n - 2 * span + 1)
+            for i in range(n - 2 * span + 1):
+                a = prev_min[i]
+                b = prev_min[i + span]
+                level_min[i] = a if values[a] <= values[b] else b
+                a = prev_max[i]
+                b = prev_max[i + span]
+                level_max[i] = a if values[a] >= values[b] else b
+            self._min.append(level_min)
+            self._max.append(level_max)
+            span *= 2
+
+    def __len__(self):
+        return len(self.values)
+
+    def argmin(self, lo, hi):
+        """Index of the lowest price in [lo, hi] (inclusive)."""
+        level = self._log[hi - lo + 1]
+        table = self._min[level]
+        a = table[lo]
+        b = table[hi - (1 << level) + 1]
+        return a if self.values[a] <= self.values[b] else b
+
+    def argmax(self, lo, hi):
+        """Index of the highest price in [lo, hi] (inclusive)."""
+        level = self._log[hi - lo + 1]
+        table = self._max[level]
+        a = table[lo]
+        b = table[hi - (1 << level) + 1]
+        return a if self.values[a] >= self.values[b] else b
+
+    def k_smallest(self, lo, hi, k):
+        """Indices of the k cheapest slots in [lo, hi], cheapest first (O(k log k))."""
+        values = self.values
+        result = []
+        if k <= 0 or lo > hi:
+            return result
+        i = self.argmin(lo, hi)
+        heap = [(values[i], i, lo, hi)]
+        while heap and len(result) < k:
+            _, i, a, b = heapq.heappop(heap)
+            result.append(i)
+            # Dela intervallet runt valt index, nästa kandidat är minimum i respektive del
+            if a < i:
+                j = self.argmin(a, i - 1)
+                heapq.heappush(heap, (values[j], j, a, i - 1))
+            if i < b:
+                j = self.argmin(i + 1, b)
+                heapq.heappush(heap, (values[j], j, i + 1, b))
+        return result
+
+    def k_largest(self, lo, hi, k):
+        """Indices of the k most expensive slots in [lo, hi], most expensive first (O(k log k))."""
+        values = self.values
+        result = []
+        if k <= 0 or lo > hi:
+            return result
+        i = self.argmax(lo, hi)
+        heap = [(-values[i], i, lo, hi)]
+        while heap and len(result) < k:
+            _, i, a, b = heapq.heappop(heap)
+            result.append(i)
+            if a < i:
+                j = self.argmax(a, i - 1)
+                heapq.heappush(heap, (-values[j], j, a, i - 1))
+            if i < b:
+                j = self.argmax(i + 1, b)
+                heapq.heappush(heap, (-values[j], j, i + 1, b))
+        return result
@@ -0,0 +1,123 @@
+"""Parsed Nordpool price series held as numeric arrays."""
+from array import array
+from datetime import datetime
+
+from .price_index import PriceIndex
+from .schedule_store import SlotCalendar
+
+
+class PriceSeries:
+    """Prices per slot as a float array over an epoch-based SlotCalendar."""
+
+    __slots__ = ("calendar", "values", "_digest", "_index")
+
+    def __init__(self, calendar, values):
+        self.calendar = calendar
+        self.values = values if isinstance(values, array) else array("d", values)
+        self._digest = None
+        self._index = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def __bool__(self):
+        return len(self.values) > 0
+
+    def __getitem__(self, idx):
+        # Bakåtkompatibel dict-vy ({"start", "end", "value"}) för äldre kod
+        return {
+            "start": self.calendar.start_iso(idx),
+            "end": self.calendar.end_iso(idx),
+            "value": self.values[idx],
+        }
+
+    @property
+    def digest(self):
+        """Cheap content hash over the raw bytes of prices and slot boundaries."""
+        if self._digest is None:
+            self._digest = hash((self.values.tobytes(), self.calendar.bounds.tobytes()))
+        return self._digest
+
+    @property
+    def index(self):
+        """PriceIndex for range min/max queries, built on first use."""
+        if self._index is None:
+            self._index = PriceIndex(self.values)
+        return self._index
+
+
+SLOT_MINUTES = (5, 10, 15, 30, 60)
+
+
+def _to_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def infer_slot_seconds(slots_per_day):
+    """Guess the price resolution from the number of slots in one day (24, 96, ...)."""
+    if not slots_per_day:
+        return 3600.0
+    minutes = 24 * 60 / slots_per_day
+    # DST-dagar har 23/25 (92/100) slots, snappa till närmaste vanliga upplösning
+    return 60.0 * min(SLOT_MINUTES, key=lambda m: abs(m - minutes))
+
+
+def parse_nordpool(raw_today, raw_tomorrow, base_time):
+    """
+    Parse raw_today + raw_tomorrow into a PriceSeries.
+    Slot boundaries come from the items' own start/end when present (any resolution);
+    otherwise slots are laid out from base_time with a length inferred from raw_today.
+    """
+    items = list(raw_today or []) + list(raw_tomorrow or [])
+    values = array("d", [float(item["value"]) for item in items])
+    if items and items[0].get("start") is not None:
+        bounds = array("d", [_to_timestamp(item["start"]) for item in items])
+        last_end = _to_timestamp(items[-1].get("end"))
+        if last_end is None:
+            last_end = bounds[-1] + (bounds[-1] - bounds[-2] if len(bounds) > 1 else 3600.0)
+        bounds.append(last_end)
+        return PriceSeries(SlotCalendar(bounds), values)
+    slot_seconds = infer_slot_seconds(len(raw_today or raw_tomorrow or ()))
+    calendar = SlotCalendar.uniform(base_time.timestamp(), slot_seconds, len(values))
+    return PriceSeries(calendar, values)
+
+
+def raw_source_key(raw_today, raw_tomorrow):
+    """Content key for the raw attributes that is cheaper than a full parse."""
+    return hash((
+        tuple((item.get("start"), item.get("value")) for item in raw_today or ()),
+        tuple((item.get("start"), item.get("value")) for item in raw_tomorrow or ()),
+    ))
+
+
+class PriceSeriesCache:
+    """Keep the last parsed series and reuse it while the source is unchanged."""
+
+    def __init__(self):
+        self._attributes = None
+        self._key = None
+        self.series = None
+        self.parses = 0
+        self.reuses = 0
+
+    def get(self, attributes, base_time):
+        """Return a PriceSeries for the given price-state attributes."""
+        # Snabbast: samma attribut-objekt som förra gången (identitet)
+        if attributes is self._attributes and self.series is not None and self._key[0] == base_time:
+            self.reuses += 1
+            return self.series
+        raw_today = attributes.get("raw_today", [])
+        raw_tomorrow = attributes.get("raw_tomorrow", [])
+        key = (base_time, raw_source_key(raw_today, raw_tomorrow))
+        self._attributes = attributes
+        if key == self._key and self.series is not None:
+            self.reuses += 1
+            return self.series
+        self._key = key
+        self.series = parse_nordpool(raw_today, raw_tomorrow, base_time)
+        self.parses += 1
+        return self.series
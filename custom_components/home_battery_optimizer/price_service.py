@@ -0,0 +1,65 @@
+"""Domain-wide price service: each price entity is parsed once and fanned out to every entry using it."""
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_state_change_event
+
+from .price_series import PriceSeriesCache
+
+PRICE_SERVICE = "_price_service"  # Nyckel i hass.data[DOMAIN]
+
+
+class PriceService:
+    """One PriceSeriesCache and one state listener per price entity, shared by all config entries."""
+
+    def __init__(self, hass):
+        self.hass = hass
+        self._caches = {}
+        self._listeners = {}
+        self._unsubs = {}
+
+    def get(self, entity_id, base_time):
+        """PriceSeries for the entity's current attributes; parsed once for all entries."""
+        state = self.hass.states.get(entity_id)
+        if state is None or not hasattr(state, "attributes"):
+            return None
+        cache = self._caches.get(entity_id)
+        if cache is None:
+            cache = self._caches[entity_id] = PriceSeriesCache()
+        return cache.get(state.attributes, base_time)
+
+    @callback
+    def async_listen(self, entity_id, listener):
+        """Call listener(event) on state changes of entity_id. Returns an unsubscribe callback."""
+        listeners = self._listeners.setdefault(entity_id, [])
+        if not listeners:
+            # Första prenumeranten: en enda state-listener för alla entries
+            self._unsubs[entity_id] = async_track_state_change_event(self.hass, [entity_id], self._async_state_changed)
+        listeners.append(listener)
+
+        @callback
+        def remove():
+            if listener not in listeners:
+                return
+            listeners.remove(listener)
+            if not listeners:
+                self._unsubs.pop(entity_id)()
+                self._listeners.pop(entity_id, None)
+                self._caches.pop(entity_id, None)
+
+        return remove
+
+    @callback
+    def _async_state_changed(self, event):
+        for listener in list(self._listeners.get(event.data["entity_id"], ())):
+            listener(event)
+
+    @property
+    def stats(self):
+        """{entity_id: {subscribers, parses, reuses}}."""
+        return {
+            entity_id: {
+                "subscribers": len(self._listeners.get(entity_id, ())),
+                "parses": cache.parses,
+                "reuses": cache.reuses,
+            }
+            for entity_id, cache in self._caches.items()
+        }
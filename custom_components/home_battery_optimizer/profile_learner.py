@@ -0,0 +1,198 @@
+"""
+Streaming hour-of-week profiles of household consumption and solar production.
+
+Each state event is folded into the running hour's time-weighted mean in O(1); when the
+hour ends its mean updates that hour-of-week with an exponentially weighted average.
+Memory is fixed (168 values per signal). The planner gets the expected net load
+(consumption - solar, kWh) per price slot.
+"""
+from array import array
+import logging
+
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+
+HOURS_PER_WEEK = 168
+DEFAULT_ALPHA = 0.3  # Vikt för senaste veckan; varje timme-i-veckan uppdateras en gång per vecka
+MAX_GAP_SECONDS = 3600  # Ett värde räknas som giltigt högst så här länge utan ny mätning
+NET_LOAD_QUANTUM = 0.1  # kWh; avrundning så att små profiländringar inte slår ut plancachen
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 300
+
+CONSUMPTION = "consumption"
+SOLAR = "solar"
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def local_hour(ts):
+    """(hour of the week, start timestamp) of the hour containing ts, in Home Assistant's time zone."""
+    moment = dt_util.as_local(dt_util.utc_from_timestamp(ts))
+    # Timmen börjar vid lokal hel timme, även i zoner med halvtimmesförskjutning
+    start = ts - (moment.minute * 60 + moment.second + moment.microsecond / 1e6)
+    return moment.weekday() * 24 + moment.hour, start
+
+
+def hour_of_week(ts):
+    return local_hour(ts)[0]
+
+
+class HourOfWeekProfile:
+    """EWMA per hour of the week (W), fed with (timestamp, value) samples."""
+
+    __slots__ = ("alpha", "mean", "samples", "_hour", "_hour_end", "_last_ts", "_last_value", "_held_until", "_area", "_seconds")
+
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.mean = array("d", [0.0]) * HOURS_PER_WEEK
+        self.samples = array("l", [0]) * HOURS_PER_WEEK  # Antal avslutade timmar per timme-i-veckan
+        self._hour = None
+        self._hour_end = None
+        self._last_ts = None
+        self._last_value = None
+        self._held_until = None
+        self._area = 0.0  # Integral av värdet (W*s) under pågående timme
+        self._seconds = 0.0
+
+    def observe(self, ts, value):
+        """Add a sample; the previous value is held until ts (capped at MAX_GAP_SECONDS)."""
+        if self._last_ts is not None and ts < self._last_ts:
+            return
+        self._advance(ts)
+        self._last_ts = ts
+        self._last_value = value
+        self._held_until = ts + MAX_GAP_SECONDS
+        if self._hour is None:
+            self._start_hour(ts)
+
+    def _start_hour(self, ts):
+        self._hour, start = local_hour(ts)
+        self._hour_end = start + 3600
+        self._area = 0.0
+        self._seconds = 0.0
+
+    def _advance(self, ts):
+        # Integrera senaste värdet fram till ts, timme för timme
+        while self._last_ts is not None and self._last_ts < ts:
+            stop = min(ts, self._hour_end, self._held_until)
+            if stop > self._last_ts:
+                self._area += self._last_value * (stop - self._last_ts)
+                self._seconds += stop - self._last_ts
+            if ts < self._hour_end:
+                break
+            self._close_hour()
+            if ts - self._hour_end >= MAX_GAP_SECONDS:
+                # Långt avbrott: börja om vid ts istället för att gå igenom varje tom timme
+                self._last_ts = ts
+                self._start_hour(ts)
+                break
+            self._last_ts = self._hour_end
+            self._start_hour(self._hour_end)
+
+    def _close_hour(self):
+        if self._seconds <= 0:
+            return
+        hour_mean = self._area / self._seconds
+        h = self._hour
+        if self.samples[h]:
+            self.mean[h] += self.alpha * (hour_mean - self.mean[h])
+        else:
+            self.mean[h] = hour_mean
+        self.samples[h] += 1
+
+    def expected(self, ts):
+        """Expected mean (W) for the hour containing ts, None when never observed."""
+        h = hour_of_week(ts)
+        return self.mean[h] if self.samples[h] else None
+
+    def as_dict(self):
+        return {"mean": [round(v, 1) for v in self.mean], "samples": list(self.samples)}
+
+    def load(self, data):
+        if len(data.get("mean", ())) != HOURS_PER_WEEK or len(data.get("samples", ())) != HOURS_PER_WEEK:
+            raise ValueError("profile must have 168 hours")
+        self.mean = array("d", data["mean"])
+        self.samples = array("l", data["samples"])
+
+
+class ProfileLearner:
+    """Consumption and solar profiles for one battery site."""
+
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.profiles = {CONSUMPTION: HourOfWeekProfile(alpha), SOLAR: HourOfWeekProfile(alpha)}
+        self.events = 0
+
+    def observe(self, signal, ts, value):
+        self.profiles[signal].observe(ts, value)
+        self.events += 1
+
+    @property
+    def hours_learned(self):
+        """Hours of the week with a consumption estimate."""
+        return sum(1 for count in self.profiles[CONSUMPTION].samples if count)
+
+    def net_load(self, calendar):
+        """
+        Expected consumption - solar in kWh per slot (negative = surplus), rounded to
+        NET_LOAD_QUANTUM. Hours never observed count as 0. None until any hour is learned.
+        """
+        if not self.hours_learned:
+            return None
+        consumption = self.profiles[CONSUMPTION]
+        solar = self.profiles[SOLAR]
+        result = []
+        for i in range(len(calendar)):
+            start = calendar.start_ts(i)
+            hours = (calendar.end_ts(i) - start) / 3600
+            watts = (consumption.expected(start) or 0.0) - (solar.expected(start) or 0.0)
+            result.append(round(watts * hours / 1000 / NET_LOAD_QUANTUM) * NET_LOAD_QUANTUM)
+        return tuple(round(v, 3) for v in result)
+
+    def as_dict(self):
+        return {signal: profile.as_dict() for signal, profile in self.profiles.items()}
+
+    def load(self, data):
+        for signal, profile in self.profiles.items():
+            if signal in data:
+                profile.load(data[signal])
+
+    @property
+    def stats(self):
+        return {"events": self.events, "hours_learned": self.hours_learned}
+
+
+class ProfileStore:
+    """Store-backed persistence of the learned profiles for one config entry."""
+
+    def __init__(self, hass, entry_id):
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.profiles.{entry_id}")
+        self._save_pending = False
+
+    async def async_load_into(self, learner):
+        data = await self._store.async_load()
+        if not data:
+            return False
+        try:
+            learner.load(data)
+        except (TypeError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable load profiles: %s", e)
+            return False
+        return True
+
+    def async_schedule_save(self, learner):
+        # async_delay_save startar om timern vid varje anrop; med en sensor som uppdateras var
+        # femte sekund skulle sparningen aldrig hinna köras, så arma bara när ingen väntar
+        if self._save_pending:
+            return
+        self._save_pending = True
+        self._store.async_delay_save(lambda: self._data_to_save(learner), SAVE_DELAY)
+
+    def _data_to_save(self, learner):
+        self._save_pending = False
+        return learner.as_dict()
+
+    async def async_remove(self):
+        await self._store.async_remove()
@@ -0,0 +1,330 @@
+"""Compact columnar storage for the charge/discharge schedule."""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import count
+import math
+
+ACTION_IDLE = 0
+ACTION_CHARGE = 1
+ACTION_DISCHARGE = 2
+ACTIONS = ("idle", "charge", "discharge")
+ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+
+NO_SOC = math.nan
+
+_versions = count(1)
+
+
+class SlotCalendar:
+    """Epoch-based slot calendar. Slot i covers [bounds[i], bounds[i+1])."""
+
+    __slots__ = ("bounds",)
+
+    def __init__(self, bounds):
+        self.bounds = bounds if isinstance(bounds, array) else array("d", bounds)
+
+    @classmethod
+    def uniform(cls, start_ts, slot_seconds, count):
+        return cls(array("d", [start_ts + i * slot_seconds for i in range(count + 1)]))
+
+    @classmethod
+    def from_price_data(cls, price_data):
+        """Build a calendar from a list of {"start", "end"} ISO entries."""
+        if not price_data:
+            return cls(array("d"))
+        bounds = array("d", [datetime.fromisoformat(e["start"]).timestamp() for e in price_data])
+        bounds.append(datetime.fromisoformat(price_data[-1]["end"]).timestamp())
+        return cls(bounds)
+
+    def __len__(self):
+        return max(len(self.bounds) - 1, 0)
+
+    @property
+    def slot_seconds(self):
+        """Length of one slot in seconds (3600 for hourly, 900 for 15-minute prices)."""
+        if len(self.bounds) < 2:
+            return 3600.0
+        return self.bounds[1] - self.bounds[0]
+
+    @property
+    def slot_hours(self):
+        return self.slot_seconds / 3600
+
+    def start_ts(self, idx):
+        return self.bounds[idx]
+
+    def end_ts(self, idx):
+        return self.bounds[idx + 1]
+
+    def start_iso(self, idx):
+        return datetime.fromtimestamp(self.bounds[idx]).isoformat()
+
+    def end_iso(self, idx):
+        return datetime.fromtimestamp(self.bounds[idx + 1]).isoformat()
+
+    def passed_count(self, now_ts):
+        """Number of leading slots whose end lies before now_ts."""
+        if len(self.bounds) < 2:
+            return 0
+        return bisect_left(self.bounds, now_ts, 1) - 1
+
+    def iso_bounds(self):
+        """Return all slot boundaries as ISO strings (len(self) + 1 items)."""
+        return [datetime.fromtimestamp(ts).isoformat() for ts in self.bounds]
+
+
+class TimeIndex:
+    """
+    Precomputed lookups for one schedule version: timestamp -> slot arithmetically
+    (bisect for irregular calendars), plus next action / next charge / next discharge
+    starts and the list of contiguous charge/discharge periods.
+    """
+
+    __slots__ = ("_bounds", "_t0", "_step", "_uniform", "actions", "next_action", "next_charge", "next_discharge", "periods")
+
+    def __init__(self, schedule):
+        bounds = schedule.calendar.bounds
+        actions = schedule.action
+        n = len(actions)
+        self._bounds = bounds
+        self._t0 = bounds[0] if n else 0.0
+        self._step = schedule.calendar.slot_seconds
+        self._uniform = all(bounds[i + 1] - bounds[i] == self._step for i in range(n))
+        self.actions = actions
+        # Index för nästa icke-idle slot / nästa start av charge- resp. discharge-block efter i (-1 = ingen)
+        self.next_action = array("l", [-1]) * n
+        self.next_charge = array("l", [-1]) * n
+        self.next_discharge = array("l", [-1]) * n
+        nxt_action = nxt_charge = nxt_discharge = -1
+        for i in range(n - 1, -1, -1):
+            self.next_action[i] = nxt_action
+            self.next_charge[i] = nxt_charge
+            self.next_discharge[i] = nxt_discharge
+            action = actions[i]
+            if action != ACTION_IDLE:
+                nxt_action = i
+            block_start = i == 0 or actions[i - 1] != action
+            if action == ACTION_CHARGE and block_start:
+                nxt_charge = i
+            elif action == ACTION_DISCHARGE and block_start:
+                nxt_discharge = i
+        self.periods = []
+        start = None
+        for i in range(n + 1):
+            action = actions[i] if i < n else ACTION_IDLE
+            if start is not None and (i == n or action != actions[start]):
+                self.periods.append((actions[start], start, i - 1))
+                start = None
+            if start is None and action != ACTION_IDLE:
+                start = i
+
+    def slot_of(self, ts):
+        """Slot index containing ts, or None if outside the calendar."""
+        bounds = self._bounds
+        n = len(bounds) - 1
+        if n < 1 or not bounds[0] <= ts < bounds[n]:
+            return None
+        if self._uniform:
+            return min(int((ts - self._t0) // self._step), n - 1)
+        return bisect_right(bounds, ts) - 1
+
+    def action_at(self, ts):
+        idx = self.slot_of(ts)
+        return ACTIONS[self.actions[idx]] if idx is not None else "idle"
+
+    def next_action_after(self, ts):
+        """(action, start_ts) of the next charge/discharge slot after the current one, or (None, None)."""
+        idx = self.slot_of(ts)
+        if idx is None:
+            return None, None
+        nxt = self.next_action[idx]
+        if nxt < 0:
+            return None, None
+        return ACTIONS[self.actions[nxt]], self._bounds[nxt]
+
+    def next_start(self, ts, action):
+        """Start timestamp of the next block of action (charge/discharge) after the current slot."""
+        idx = self.slot_of(ts)
+        if idx is None:
+            return None
+        nxt = (self.next_charge if action == ACTION_CHARGE else self.next_discharge)[idx]
+        return self._bounds[nxt] if nxt >= 0 else None
+
+
+class ScheduleRow:
+    """Read-only, dict-like view of one schedule slot."""
+
+    __slots__ = ("_store", "index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self.index = index
+
+    def get(self, key, default=None):
+        store = self._store
+        i = self.index
+        if key == "action":
+            return ACTIONS[store.action[i]]
+        if key == "price":
+            return store.price[i]
+        if key == "charge":
+            return store.charge[i]
+        if key == "discharge":
+            return store.discharge[i]
+        if key == "window":
+            return store.window[i] or None
+        if key == "estimated_soc":
+            soc = store.estimated_soc[i]
+            return None if math.isnan(soc) else soc
+        if key == "passed":
+            return bool(store.passed[i])
+        if key == "start":
+            return store.calendar.start_iso(i)
+        if key == "end":
+            return store.calendar.end_iso(i)
+        column = store.window_columns.get(key)
+        if column is not None:
+            return column[i]
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in ScheduleStore.FIELDS or key in self._store.window_columns
+
+    def as_dict(self):
+        return {key: self.get(key) for key in ScheduleStore.FIELDS}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class ScheduleStore:
+    """
+    Schedule held as typed arrays, one column per field, over a shared slot calendar.
+    Rows are exposed through ScheduleRow views so old list-of-dict readers keep working.
+    """
+
+    FIELDS = ("start", "end", "price", "action", "charge", "discharge", "window", "estimated_soc", "passed")
+
+    __slots__ = (
+        "calendar", "price", "action", "charge", "discharge",
+        "window", "estimated_soc", "passed", "window_columns",
+        "windows", "moved", "version", "_time_index",
+    )
+
+    def __init__(self, calendar, prices):
+        n = len(calendar)
+        self.calendar = calendar
+        self.price = array("d", prices)
+        if len(self.price) != n:
+            raise ValueError(f"Expected {n} prices, got {len(self.price)}")
+        self.action = array("b", bytes(n))
+        self.charge = array("b", bytes(n))
+        self.discharge = array("b", bytes(n))
+        self.window = array("h", bytes(2 * n))  # 0 = inget window
+        self.estimated_soc = array("d", [NO_SOC]) * n
+        self.passed = array("b", bytes(n))
+        self.window_columns = {}
+        self.windows = []  # Window-sammanfattning, fylls av planeraren (summarize_windows)
+        self.moved = None  # SoC-förändring per slot från planeraren (None = okänd, t.ex. återställt schema)
+        self.version = next(_versions)
+        self._time_index = None
+
+    @property
+    def time_index(self):
+        """TimeIndex for this schedule version, built on first use."""
+        if self._time_index is None:
+            self._time_index = TimeIndex(self)
+        return self._time_index
+
+    def invalidate(self):
+        """Call after mutating columns in place: new version, index rebuilt lazily."""
+        self.version = next(_versions)
+        self._time_index = None
+
+    @classmethod
+    def empty(cls):
+        return cls(SlotCalendar(array("d")), ())
+
+    def __len__(self):
+        return len(self.price)
+
+    def __bool__(self):
+        return len(self.price) > 0
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return ScheduleRow(self, idx)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ScheduleRow(self, i)
+
+    def action_name(self, idx):
+        return ACTIONS[self.action[idx]]
+
+    def soc_at(self, idx):
+        soc = self.estimated_soc[idx]
+        return None if math.isnan(soc) else soc
+
+    def add_column(self, name, typecode="d"):
+        """Add (or reset) an extra per-slot column, e.g. charge_window_1."""
+        fill = [NO_SOC] if typecode in ("d", "f") else [0]
+        column = array(typecode, fill) * len(self)
+        self.window_columns[name] = column
+        return column
+
+    def summarize_windows(self, moved, kwh_per_percent):
+        """
+        Build self.windows in one pass over the window column.
+        moved[i] is the SoC change (percent) the planner applied in slot i.
+        """
+        calendar = self.calendar
+        slot_hours = [calendar.end_ts(i) - calendar.start_ts(i) for i in range(len(self))]
+        summary = {}
+        for i, window_id in enumerate(self.window):
+            if not window_id:
+                continue
+            price = self.price[i]
+            entry = summary.get(window_id)
+            if entry is None:
+                entry = summary[window_id] = {
+                    "window": window_id,
+                    "start_idx": i,
+                    "end_idx": i,
+                    "min_price": price,
+                    "max_price": price,
+                    "charged_kwh": 0.0,
+                    "discharge_hours": 0.0,
+                }
+            entry["end_idx"] = i
+            if price < entry["min_price"]:
+                entry["min_price"] = price
+            elif price > entry["max_price"]:
+                entry["max_price"] = price
+            if self.action[i] == ACTION_CHARGE and moved[i] > 0:
+                entry["charged_kwh"] += moved[i] * kwh_per_percent
+            elif self.action[i] == ACTION_DISCHARGE:
+                entry["discharge_hours"] += slot_hours[i] / 3600
+        self.moved = moved
+        windows = sorted(summary.values(), key=lambda w: w["start_idx"])
+        for entry in windows:
+            entry["start"] = calendar.start_iso(entry["start_idx"])
+            entry["end"] = calendar.end_iso(entry["end_idx"])
+            entry["charged_kwh"] = round(entry["charged_kwh"], 3)
+            entry["discharge_hours"] = round(entry["discharge_hours"], 3)
+        self.windows = windows
+        return windows
+
+    def rows(self):
+        """Return the schedule as a list of plain dicts."""
+        return [row.as_dict() for row in self]
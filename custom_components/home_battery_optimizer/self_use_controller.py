@@ -0,0 +1,184 @@
+"""
+Event-driven self-use control, independent of schedule rebuilds.
+
+Subscribed directly to the solar, consumption and battery power entities. The wanted state
+must hold continuously for a hold time before self use switches (time-based hysteresis),
+and evaluations are rate-limited: events inside the interval are coalesced into one
+deferred evaluation, so the cost does not grow with the sensors' update rate.
+"""
+import logging
+import time
+
+from homeassistant.core import callback
+
+from .schedule_store import ACTION_IDLE
+
+DEFAULT_ACTIVATE_AFTER = 60.0  # Sekunder villkoret måste hålla innan self use slås på
+DEFAULT_DEACTIVATE_AFTER = 120.0  # Sekunder innan det slås av
+DEFAULT_MIN_INTERVAL = 5.0  # Högst en utvärdering per intervall
+SOLAR_THRESHOLD_W = 20  # Alt 2: self use så fort solen ger något
+FULL_FRACTION = 0.97  # Nära max SoC: låt self use vara kvar
+
+_UNAVAILABLE = (None, "", "unknown", "unavailable")
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _float_state(state):
+    if state is None or state.state in _UNAVAILABLE:
+        return None
+    try:
+        return float(state.state)
+    except (TypeError, ValueError):
+        return None
+
+
+class SelfUseController:
+    """Time-based hysteresis for the coordinator's self-use flag."""
+
+    def __init__(self, coordinator, activate_after=DEFAULT_ACTIVATE_AFTER,
+                 deactivate_after=DEFAULT_DEACTIVATE_AFTER, min_interval=DEFAULT_MIN_INTERVAL, clock=time.monotonic):
+        self.coordinator = coordinator
+        self.activate_after = activate_after
+        self.deactivate_after = deactivate_after
+        self.min_interval = min_interval
+        self._clock = clock
+        config = coordinator.config
+        self.entities = {
+            config.get("solar_entity"): "solar",
+            config.get("consumption_entity"): "consumption",
+            config.get("battery_power_entity"): "battery_power",
+        }
+        self.entities.pop(None, None)
+        self.values = {"solar": None, "consumption": None, "battery_power": None}
+        self.active = False
+        self._wanted = None  # Senast utvärderade önskade läge
+        self._wanted_since = None
+        self._last_evaluation = None
+        self._deferred = None
+        self._deferred_at = None  # Klocktid då den fördröjda utvärderingen körs
+        self.events = 0
+        self.evaluations = 0
+        self.switches = 0
+
+    @callback
+    def async_handle_event(self, event):
+        """State change on one of the entities: store the value and evaluate (rate-limited)."""
+        kind = self.entities.get(event.data.get("entity_id"))
+        if kind is None:
+            return
+        self.events += 1
+        self.values[kind] = _float_state(event.data.get("new_state"))
+        if kind == "battery_power":
+            self.coordinator.current_power = self.values[kind]
+        now = self._clock()
+        if self._last_evaluation is not None and now - self._last_evaluation < self.min_interval:
+            # Inom intervallet: en fördröjd utvärdering täcker alla events fram till dess
+            self._schedule(self.min_interval - (now - self._last_evaluation))
+            return
+        self.async_evaluate()
+
+    def _schedule(self, delay):
+        """Evaluate again after delay; a pending evaluation is kept if it runs no later."""
+        hass = self.coordinator.hass
+        if hass is None:
+            return
+        delay = max(delay, 0)
+        due = self._clock() + delay
+        if self._deferred is not None:
+            if self._deferred_at <= due:
+                return
+            # Tidigare deadline vinner, annars kan en lång hålltid skjuta upp rate-limitens utvärdering
+            self._deferred.cancel()
+        self._deferred = hass.loop.call_later(delay, self._async_deferred)
+        self._deferred_at = due
+
+    @callback
+    def _async_deferred(self):
+        self._deferred = None
+        self._deferred_at = None
+        self.async_evaluate()
+
+    @callback
+    def async_read_states(self):
+        """Initial values from the state machine (events only carry changes)."""
+        hass = self.coordinator.hass
+        if hass is None:
+            return
+        for entity_id, kind in self.entities.items():
+            self.values[kind] = _float_state(hass.states.get(entity_id))
+
+    def wanted(self, now_ts=None):
+        """
+        Whether self use should be on now, ignoring the hysteresis.
+        Self use is only allowed in an idle slot. If a charge/discharge comes next, any solar
+        (> 20 W) is enough (Alt 2); otherwise solar must exceed consumption.
+        """
+        coordinator = self.coordinator
+        if not coordinator.self_usage_on:
+            return False
+        schedule = coordinator.schedule
+        if not schedule:
+            return False
+        index = schedule.time_index
+        current_idx = index.slot_of(now_ts if now_ts is not None else time.time())
+        if current_idx is None or schedule.action[current_idx] != ACTION_IDLE:
+            return False
+        solar = self.values["solar"] or 0
+        if index.next_action[current_idx] >= 0:
+            return solar > SOLAR_THRESHOLD_W
+        return solar > (self.values["consumption"] or 0)
+
+    @callback
+    def async_evaluate(self, now_ts=None):
+        """Apply the hysteresis to the wanted state and update the coordinator if it switches."""
+        now = self._clock()
+        self._last_evaluation = now
+        self.evaluations += 1
+        coordinator = self.coordinator
+        wanted = self.wanted(now_ts)
+        if wanted != self._wanted:
+            self._wanted = wanted
+            self._wanted_since = now
+        if wanted == self.active:
+            return
+        # Switch av eller schemat inte idle: slå av direkt, ingen fördröjning
+        blocked = not coordinator.self_usage_on or not self._idle_now(now_ts)
+        if wanted:
+            if now - self._wanted_since < self.activate_after:
+                # Utvärdera igen när hålltiden gått, även om inga fler events kommer
+                self._schedule(self._wanted_since + self.activate_after - now)
+                return
+        elif not blocked:
+            if now - self._wanted_since < self.deactivate_after:
+                self._schedule(self._wanted_since + self.deactivate_after - now)
+                return
+            soc = coordinator.soc if coordinator.soc is not None else 0
+            if soc >= FULL_FRACTION * coordinator.max_battery_soc:
+                return
+        self._set_active(wanted)
+
+    def _idle_now(self, now_ts=None):
+        schedule = self.coordinator.schedule
+        if not schedule:
+            return False
+        idx = schedule.time_index.slot_of(now_ts if now_ts is not None else time.time())
+        return idx is not None and schedule.action[idx] == ACTION_IDLE
+
+    def _set_active(self, active):
+        self.active = active
+        self.switches += 1
+        self.coordinator._self_use_active = active
+        _LOGGER.debug("Self use %s", "on" if active else "off")
+        self.coordinator.async_write_ha_state_all()
+
+    @callback
+    def async_cancel(self):
+        if self._deferred is not None:
+            self._deferred.cancel()
+            self._deferred = None
+            self._deferred_at = None
+
+    @property
+    def stats(self):
+        return {"active": self.active, "events": self.events, "evaluations": self.evaluations, "switches": self.switches}
@@ -1,6 +1,10 @@
-from homeassistant.components.sensor import SensorEntity
-from .const import DOMAIN
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.helpers.entity import EntityDescription
+from .const import ATTRIBUTES_COMPACT, DOMAIN
 from .entity import HBOEntity
+from .instrumentation import STAGE_ATTRIBUTES, STAGE_TOTAL
+from .schedule_store import ACTION_CHARGE, ACTION_DISCHARGE
 from datetime import datetime
 import logging
 
@@ -8,86 +12,233 @@ _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_entry(hass, entry, async_add_entities):
     coordinator = hass.data[DOMAIN][entry.entry_id]
-    async_add_entities([HBOScheduleSensor(coordinator, entry)])
+    async_add_entities([HBOScheduleSensor(coordinator, entry), HBOLatencySensor(coordinator, entry)])
 
 class HBOScheduleSensor(HBOEntity, SensorEntity):
+    # Stora tabeller och diagnostikräknare (ändras vid nästan varje skrivning) sparas inte i recorder-databasen
+    _unrecorded_attributes = frozenset({
+        "data",
+        "charge_windows",
+        "plan_cache",
+        "planner_runs",
+        "fleet",
+        "self_use",
+        "load_profiles",
+        "telemetry",
+        "entity_updates",
+        "options_buffer",
+        "update_scheduler",
+    })
+
     def __init__(self, coordinator, config_entry):
         HBOEntity.__init__(self, coordinator, config_entry, description=None)
         SensorEntity.__init__(self)
         self._attr_name = "Battery Schedule"
         self._attr_unique_id = f"{config_entry.entry_id}_schedule"
+        self._table_cache_key = None
+        self._table_cache = None
 
     @property
     def state(self):
         # Returnera endast action ("idle", "charge", "discharge")
-        schedule = getattr(self.coordinator, 'schedule', [])
+        schedule = getattr(self.coordinator, 'schedule', None)
+        if not schedule:
+            return "idle"
+        return schedule.time_index.action_at(self._now_ts())
+
+    def subscription_value(self):
+        # Det sensorn visar: aktuell slot i schemaversionen, mätvärden och lägen (inte diagnostikräknare)
+        coordinator = self.coordinator
+        schedule = getattr(coordinator, 'schedule', None)
+        slot = schedule.time_index.slot_of(self._now_ts()) if schedule else None
+        return (
+            schedule.version if schedule is not None else None,
+            slot,
+            coordinator.soc,
+            getattr(coordinator, 'target_soc', None),
+            getattr(coordinator, 'current_power', None),
+            getattr(coordinator, '_self_use_active', False),
+            getattr(coordinator, 'stale', False),
+        )
+
+    def _now_ts(self):
         now = self.coordinator.hass.now() if hasattr(self.coordinator.hass, 'now') else datetime.now()
-        for entry in schedule:
-            start = entry.get("start")
-            end = entry.get("end")
-            if start and end:
-                try:
-                    start_dt = datetime.fromisoformat(start)
-                    end_dt = datetime.fromisoformat(end)
-                    if start_dt <= now < end_dt:
-                        return entry.get("action", "idle")
-                except Exception:
-                    continue
-        return "idle"
+        return now.timestamp()
 
     @property
     def extra_state_attributes(self):
+        instrumentation = getattr(self.coordinator, 'instrumentation', None)
+        if instrumentation is None:
+            return self._build_attributes()
+        with instrumentation.stage(STAGE_ATTRIBUTES):
+            return self._build_attributes()
+
+    def _build_attributes(self):
         # Soc, Target soc, Current power
         attrs = {}
         attrs["soc"] = self.coordinator.soc if hasattr(self.coordinator, 'soc') else None
         attrs["target_soc"] = getattr(self.coordinator, 'target_soc', 'Unknown')
         attrs["current_power"] = getattr(self.coordinator, 'current_power', None)
-        # Charge windows
-        attrs["charge_windows"] = self._get_charge_windows()
-        # Data (timrad tabell)
-        attrs["data"] = self._get_data_table()
+        # Plan-cache: hur mycket planeringsarbete som sparas
+        plan_cache = getattr(self.coordinator, 'plan_cache', None)
+        if plan_cache is not None:
+            attrs["plan_cache"] = plan_cache.stats
+        # Vald planeringsmotor och kostnad (samt skillnad mot heuristiken för DP)
+        attrs["planner"] = getattr(self.coordinator, 'planner_report', None)
+        # Schema återställt från disk efter omstart, ännu inte omplanerat på live-data
+        attrs["stale"] = getattr(self.coordinator, 'stale', False)
+        if attrs["stale"]:
+            attrs["restored_at"] = getattr(self.coordinator, 'restored_at', None)
+        # Flottläge: gemensam planering med andra batterier
+        fleet = getattr(self.coordinator, 'fleet', None)
+        if fleet is not None:
+            attrs["fleet"] = fleet.stats
+        attrs["planner_runs"] = {
+            "generation": getattr(self.coordinator, 'plan_generation', 0),
+            "discarded": getattr(self.coordinator, 'plans_discarded', 0),
+        }
+        # Self use styrs av egna events, utanför ombyggnaderna
+        controller = getattr(self.coordinator, 'self_use_controller', None)
+        if controller is not None:
+            attrs["self_use"] = controller.stats
+        # Inlärda förbruknings-/solprofiler
+        profiles = getattr(self.coordinator, 'profiles', None)
+        if profiles is not None:
+            attrs["load_profiles"] = profiles.stats
+        # Inlärda laddnings-/urladdningshastigheter (%/timme per SoC-band)
+        telemetry = getattr(self.coordinator, 'telemetry', None)
+        if telemetry is not None:
+            attrs["telemetry"] = telemetry.stats
+        # Entitetsskrivningar: bara entiteter vars värde ändrats skrivs
+        subscriptions = getattr(self.coordinator, 'subscriptions', None)
+        if subscriptions is not None:
+            attrs["entity_updates"] = subscriptions.stats
+        # Options-skrivningar: ändringar från number/switch sparas samlat
+        options_buffer = getattr(self.coordinator, 'options_buffer', None)
+        if options_buffer is not None:
+            attrs["options_buffer"] = options_buffer.stats
+        # Events mottagna vs ombyggnader som faktiskt körts
+        update_scheduler = getattr(self.coordinator, 'update_scheduler', None)
+        if update_scheduler is not None:
+            attrs["update_scheduler"] = update_scheduler.stats
+        # Nästa planerade action, direkt från tidsindexet (ingen skanning)
+        schedule = getattr(self.coordinator, 'schedule', None)
+        if schedule:
+            now_ts = self._now_ts()
+            index = schedule.time_index
+            next_action, next_start = index.next_action_after(now_ts)
+            attrs["next_action"] = next_action
+            attrs["next_action_start"] = datetime.fromtimestamp(next_start).isoformat() if next_start is not None else None
+            next_charge = index.next_start(now_ts, ACTION_CHARGE)
+            next_discharge = index.next_start(now_ts, ACTION_DISCHARGE)
+            attrs["next_charge_start"] = datetime.fromtimestamp(next_charge).isoformat() if next_charge is not None else None
+            attrs["next_discharge_start"] = datetime.fromtimestamp(next_discharge).isoformat() if next_discharge is not None else None
+        # Charge windows och data-tabell byggs bara om när schemat (versionen) ändrats
+        charge_windows, data = self._get_cached_tables()
+        attrs["charge_windows"] = charge_windows
+        attrs["data"] = data
         return attrs
 
+    def _get_cached_tables(self):
+        schedule = getattr(self.coordinator, 'schedule', None)
+        if not schedule:
+            return [], []
+        mode = getattr(self.coordinator, 'attributes_mode', None)
+        first = 0
+        if getattr(self.coordinator, 'trim_passed_slots', False):
+            first = schedule.calendar.passed_count(self._now_ts())
+        key = (schedule.version, mode, first)
+        if key != self._table_cache_key:
+            if mode == ATTRIBUTES_COMPACT:
+                data = self._get_compact_table(schedule, first)
+            else:
+                data = self._get_data_table(first)
+            self._table_cache = (self._get_charge_windows(), data)
+            self._table_cache_key = key
+        return self._table_cache
+
     def _get_charge_windows(self):
-        # Bygg lista av windows med start, end, min_price, max_price
-        windows = []
-        schedule = getattr(self.coordinator, 'schedule', [])
-        for entry in schedule:
-            window = entry.get("window")
-            if window is not None:
-                # Finns redan denna window?
-                found = next((w for w in windows if w["window"] == window), None)
-                if not found:
-                    # Hitta alla entries för detta window
-                    window_entries = [e for e in schedule if e.get("window") == window]
-                    if window_entries:
-                        start = window_entries[0].get("start")
-                        end = window_entries[-1].get("end")
-                        prices = [e.get("price") for e in window_entries if e.get("price") is not None]
-                        min_price = min(prices) if prices else None
-                        max_price = max(prices) if prices else None
-                        windows.append({
-                            "window": window,
-                            "start": start,
-                            "end": end,
-                            "min_price": min_price,
-                            "max_price": max_price
-                        })
-        return windows
-
-    def _get_data_table(self):
-        # Bygg lista av alla schedule-rader med önskade fält
-        schedule = getattr(self.coordinator, 'schedule', [])
+        # Window-sammanfattningen byggs av planeraren tillsammans med schemat
+        schedule = getattr(self.coordinator, 'schedule', None)
+        if not schedule:
+            return []
+        return [
+            {key: value for key, value in window.items() if key not in ("start_idx", "end_idx")}
+            for window in schedule.windows
+        ]
+
+    def _get_data_table(self, first=0):
+        # Bygg lista av alla schedule-rader direkt från kolumnerna (från slot first)
+        schedule = getattr(self.coordinator, 'schedule', None)
+        if not schedule:
+            return []
+        bounds = schedule.calendar.iso_bounds()
+        estimated_soc = schedule.estimated_soc
         data = []
-        for entry in schedule:
+        for i in range(first, len(schedule)):
+            soc = estimated_soc[i]
             data.append({
-                "start": entry.get("start"),
-                "end": entry.get("end"),
-                "action": entry.get("action"),
-                "price": entry.get("price"),
-                "soc": entry.get("estimated_soc"),  # Korrigera till estimated_soc
-                "charge": entry.get("charge"),
-                "discharge": entry.get("discharge"),
-                "window": entry.get("window")
+                "start": bounds[i],
+                "end": bounds[i + 1],
+                "action": schedule.action_name(i),
+                "price": schedule.price[i],
+                "soc": None if soc != soc else soc,  # NaN = okänd SoC
+                "charge": schedule.charge[i],
+                "discharge": schedule.discharge[i],
+                "window": schedule.window[i] or None
             })
-        return data
\ No newline at end of file
+        return data
+
+    def _get_compact_table(self, schedule, first=0):
+        """
+        Kolumnär kodning: en lista per fält istället för en dict per rad.
+        action är en sträng med en bokstav per slot (i/c/d); charge/discharge följer av action.
+        """
+        calendar = schedule.calendar
+        return {
+            "start": calendar.start_iso(first) if first < len(schedule) else None,
+            "slot_minutes": round(calendar.slot_seconds / 60),
+            "offset": first,
+            "price": [round(p, 3) for p in schedule.price[first:]],
+            "action": "".join("icd"[a] for a in schedule.action[first:]),
+            "soc": [None if soc != soc else soc for soc in schedule.estimated_soc[first:]],
+            "window": list(schedule.window[first:]),
+        }
+
+
+class HBOLatencySensor(HBOEntity, SensorEntity):
+    """Diagnostik: uppdateringskedjans latens (p95 i ms) med p50/p95/max per steg som attribut."""
+
+    def __init__(self, coordinator, config_entry):
+        HBOEntity.__init__(
+            self, coordinator, config_entry,
+            description=EntityDescription(key="update_latency", name="Update Latency"),
+        )
+        SensorEntity.__init__(self)
+
+    @property
+    def entity_category(self):
+        return EntityCategory.DIAGNOSTIC
+
+    @property
+    def native_unit_of_measurement(self):
+        return UnitOfTime.MILLISECONDS
+
+    @property
+    def state_class(self):
+        return SensorStateClass.MEASUREMENT
+
+    @property
+    def icon(self):
+        return "mdi:timer-outline"
+
+    @property
+    def native_value(self):
+        return self.coordinator.instrumentation.summary().get(STAGE_TOTAL, {}).get("p95")
+
+    @property
+    def extra_state_attributes(self):
+        instrumentation = self.coordinator.instrumentation
+        attrs = {"stages": instrumentation.summary()}
+        attrs["histogram"] = instrumentation.histograms[STAGE_TOTAL].buckets
+        return attrs
@@ -0,0 +1,193 @@
+"""
+What-if planning: evaluate a batch of parameter sets against one price vector.
+
+Every parameter set is planned with the pure planner (identical inputs are planned once,
+and the price index is shared by the whole batch). The SoC trajectories of all sets are
+then computed together as a (sets x slots) matrix: cumulative sums of the per-slot moves,
+corrected where they cross min/max SoC, which is the same as clipping slot by slot.
+Nothing here touches coordinator state; the service returns the result as response data.
+"""
+from array import array
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # numpy saknas: samma resultat med en loop per parameteruppsättning
+    np = None
+
+from .planner import plan
+from .price_series import PriceSeries
+from .schedule_store import ACTION_CHARGE, ACTION_DISCHARGE, SlotCalendar
+
+MAX_SCENARIOS = 64  # Övre gräns per anrop, planeringen körs ändå en gång per unik uppsättning
+
+# Parameternamn i servicen (samma som number-entiteterna/backtest) -> fält i PlanInputs
+SCENARIO_FIELDS = {
+    "soc": "soc",
+    "charge_rate": "charge_rate",
+    "discharge_rate": "discharge_rate",
+    "min_battery_soc": "min_soc",
+    "max_battery_soc": "max_soc",
+    "min_profit": "min_profit",
+    "battery_capacity": "capacity_kwh",
+    "planner_engine": "engine",
+    "charging_on": "charging_on",
+    "discharging_on": "discharging_on",
+}
+
+_ACTION_CODES = "icd"  # Samma kodning som snapshot
+_EPSILON = 1e-9
+
+
+def price_override(price_data, prices, now_ts):
+    """
+    PriceSeries for an override price vector: on the current calendar when the length matches,
+    otherwise from the current start (or local midnight) at the current slot length.
+    """
+    if price_data and len(price_data) == len(prices):
+        return PriceSeries(price_data.calendar, prices)
+    if price_data:
+        start, step = price_data.calendar.start_ts(0), price_data.calendar.slot_seconds
+    else:
+        start = datetime.fromtimestamp(now_ts).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        step = 3600
+    return PriceSeries(SlotCalendar.uniform(start, step, len(prices)), prices)
+
+
+def scenario_inputs(base, scenario):
+    """PlanInputs for one parameter set: base with the scenario's keys replaced."""
+    unknown = set(scenario) - set(SCENARIO_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown simulate parameters: {', '.join(sorted(unknown))}")
+    changes = {SCENARIO_FIELDS[key]: value for key, value in scenario.items()}
+    # En ny rate ersätter den inlärda kurvan
+    if "charge_rate" in changes:
+        changes["charge_curve"] = None
+    if "discharge_rate" in changes:
+        changes["discharge_curve"] = None
+    inputs = base._replace(**changes)
+    if inputs.min_soc >= inputs.max_soc:
+        raise ValueError("min_battery_soc must be below max_battery_soc")
+    return inputs
+
+
+def _move_row(schedule, inputs):
+    """
+    SoC change per slot (percent) for following the schedule from current_slot: the planner's
+    own moves, so learned rate curves and net load count as in the plan.
+    """
+    row = array("d", bytes(8 * len(schedule)))
+    actions = schedule.action
+    moved = schedule.moved  # simulate planerar alltid själv, så moved finns
+    for i in range(inputs.current_slot, len(schedule)):
+        # Slots som switcharna nollställt har kvar sin förflyttning i moved, men är idle
+        if actions[i] == ACTION_CHARGE or actions[i] == ACTION_DISCHARGE:
+            row[i] = moved[i]
+    return row
+
+
+def soc_trajectories(start, moves, low, high):
+    """
+    SoC after each slot for every row: start + cumsum(moves), clipped to [low, high] per slot.
+    A step that hits a limit is cut short, so the rest of that row is shifted by the excess;
+    rows are corrected one limit hit at a time, so the cost follows the number of hits.
+    """
+    if np is None:
+        return [_trajectory_python(*row) for row in zip(start, moves, low, high)]
+    moves = np.asarray(moves, dtype=float).reshape(len(start), -1)
+    low = np.asarray(low, dtype=float)[:, None]
+    high = np.asarray(high, dtype=float)[:, None]
+    soc = np.asarray(start, dtype=float)[:, None] + np.cumsum(moves, axis=1)
+    columns = np.arange(moves.shape[1])
+    while True:
+        clipped = np.clip(soc, low, high)
+        outside = np.abs(soc - clipped) > _EPSILON
+        rows = outside.any(axis=1)
+        if not rows.any():
+            return clipped
+        first = outside.argmax(axis=1)
+        excess = np.where(rows, soc[np.arange(len(soc)), first] - clipped[np.arange(len(soc)), first], 0.0)
+        soc -= excess[:, None] * (columns[None, :] >= first[:, None])
+
+
+def _trajectory_python(start, moves, low, high):
+    soc = start
+    result = []
+    for move in moves:
+        soc = min(high, max(low, soc + move))
+        result.append(soc)
+    return result
+
+
+def simulate(base, scenarios):
+    """
+    Plan and evaluate every scenario (dict of SCENARIO_FIELDS keys) on base's prices.
+    Returns one result dict per scenario, in order.
+    """
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f"at most {MAX_SCENARIOS} scenarios per call")
+    all_inputs = [scenario_inputs(base, scenario) for scenario in scenarios]
+    planned = {}
+    schedules = []
+    for inputs in all_inputs:
+        key = inputs.fingerprint()
+        if key not in planned:
+            planned[key] = plan(inputs)
+        schedules.append(planned[key])
+    if not all_inputs:
+        return []
+    current = base.current_slot
+    prices = list(base.price_data.values)
+    terminal_price = min(prices[current:], default=0.0)
+    starts = [inputs.soc for inputs in all_inputs]
+    trajectories = soc_trajectories(
+        starts,
+        [_move_row(schedule, inputs) for (schedule, _), inputs in zip(schedules, all_inputs)],
+        [inputs.min_soc for inputs in all_inputs],
+        [inputs.max_soc for inputs in all_inputs],
+    )
+    totals = _totals(starts, trajectories, prices)
+    results = []
+    for scenario, inputs, (schedule, report), soc, start, (charged, discharged, bought) in zip(
+        scenarios, all_inputs, schedules, trajectories, starts, totals
+    ):
+        kwh_per_percent = inputs.capacity_kwh / 100
+        end_soc = float(soc[-1]) if len(soc) else start
+        # SoC-skillnaden värderas till lägsta priset, som i schedule_cost
+        cost = bought - terminal_price * (end_soc - start)
+        results.append({
+            "params": scenario,
+            "engine": report.get("engine"),
+            "cost": round(cost * kwh_per_percent, 2),
+            "charged_kwh": round(charged * kwh_per_percent, 3),
+            "discharged_kwh": round(discharged * kwh_per_percent, 3),
+            "end_soc": round(end_soc, 2),
+            "actions": "".join(_ACTION_CODES[a] for a in schedule.action),
+            "soc": [round(float(after), 2) for after in soc],
+            "windows": schedule.windows,
+        })
+    return results
+
+
+def _totals(starts, trajectories, prices):
+    """(charged, discharged, price-weighted SoC change) per row, in percent of capacity."""
+    if np is None:
+        totals = []
+        for start, soc in zip(starts, trajectories):
+            charged = discharged = value = 0.0
+            previous = start
+            for price, after in zip(prices, soc):
+                moved = after - previous
+                previous = after
+                if moved > 0:
+                    charged += moved
+                else:
+                    discharged -= moved
+                value += price * moved
+            totals.append((charged, discharged, value))
+        return totals
+    moved = np.diff(trajectories, axis=1, prepend=np.asarray(starts, dtype=float)[:, None])
+    charged = np.clip(moved, 0, None).sum(axis=1)
+    discharged = -np.clip(moved, None, 0).sum(axis=1)
+    value = moved @ np.asarray(prices, dtype=float)
+    return [(float(c), float(d), float(v)) for c, d, v in zip(charged, discharged, value)]
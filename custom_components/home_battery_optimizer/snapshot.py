@@ -0,0 +1,118 @@
+"""
+Persisted price series and schedule, so a restart starts from the last plan instead of an empty one.
+
+The snapshot is stored through Home Assistant's Store helper in a compact, versioned
+format: a uniform calendar as start + step, the actions as one "icd" character per
+slot, and the SoC and window columns as plain lists.
+"""
+from array import array
+from datetime import datetime
+import logging
+
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+from .price_series import PriceSeries
+from .schedule_store import ACTION_CHARGE, ACTION_DISCHARGE, NO_SOC, ScheduleStore, SlotCalendar
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 10  # Sekunder; flera snabba omplaneringar ger en skrivning
+
+_ACTION_CODES = "icd"  # Samma ordning som schedule_store.ACTIONS
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _encode_calendar(calendar):
+    bounds = calendar.bounds
+    step = calendar.slot_seconds
+    if all(bounds[i + 1] - bounds[i] == step for i in range(len(bounds) - 1)):
+        return {"start": bounds[0] if len(bounds) else None, "step": step, "count": len(calendar)}
+    return {"bounds": list(bounds)}
+
+
+def _decode_calendar(data):
+    if "bounds" in data:
+        return SlotCalendar(array("d", data["bounds"]))
+    if data.get("start") is None:
+        return SlotCalendar(array("d"))
+    return SlotCalendar.uniform(data["start"], data["step"], data["count"])
+
+
+def encode_snapshot(price_data, schedule, planner_report=None, saved_at=None):
+    """JSON-serializable snapshot of the price series and the schedule planned on it."""
+    if not price_data:
+        return None
+    data = {
+        "saved_at": saved_at if saved_at is not None else datetime.now().timestamp(),
+        "calendar": _encode_calendar(price_data.calendar),
+        "prices": list(price_data.values),
+        "schedule": None,
+        "planner": planner_report or {},
+    }
+    # Schemat sparas bara om det är planerat på just den här prisserien
+    if schedule and list(schedule.calendar.bounds) == list(price_data.calendar.bounds):
+        data["schedule"] = {
+            "action": "".join(_ACTION_CODES[a] for a in schedule.action),
+            "soc": [None if soc != soc else soc for soc in schedule.estimated_soc],
+            "window": list(schedule.window),
+            "windows": schedule.windows,
+        }
+    return data
+
+
+def decode_snapshot(data, now_ts=None):
+    """
+    Return (price_data, schedule, planner_report, saved_at), or None when the snapshot is
+    missing, malformed or entirely in the past. schedule is None if only prices were saved.
+    """
+    if not data:
+        return None
+    try:
+        calendar = _decode_calendar(data["calendar"])
+        price_data = PriceSeries(calendar, array("d", data["prices"]))
+        if len(price_data) != len(calendar):
+            return None
+        now_ts = now_ts if now_ts is not None else datetime.now().timestamp()
+        if not price_data or calendar.bounds[-1] <= now_ts:
+            return None
+        schedule = None
+        saved = data.get("schedule")
+        if saved:
+            schedule = ScheduleStore(calendar, price_data.values)
+            for i, code in enumerate(saved["action"]):
+                action = _ACTION_CODES.index(code)
+                schedule.action[i] = action
+                schedule.charge[i] = action == ACTION_CHARGE
+                schedule.discharge[i] = action == ACTION_DISCHARGE
+                soc = saved["soc"][i]
+                schedule.estimated_soc[i] = NO_SOC if soc is None else soc
+                schedule.window[i] = saved["window"][i]
+            for i in range(calendar.passed_count(now_ts)):
+                schedule.passed[i] = 1
+            schedule.windows = list(saved.get("windows") or [])
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        _LOGGER.warning("Ignoring unreadable schedule snapshot: %s", e)
+        return None
+    return price_data, schedule, data.get("planner") or {}, data.get("saved_at")
+
+
+class ScheduleSnapshot:
+    """Store-backed snapshot for one config entry, written behind with a delay."""
+
+    def __init__(self, hass, entry_id):
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.snapshot.{entry_id}")
+
+    async def async_load(self):
+        return decode_snapshot(await self._store.async_load())
+
+    def async_schedule_save(self, coordinator):
+        """Save the coordinator's current prices and schedule after SAVE_DELAY seconds."""
+        self._store.async_delay_save(
+            lambda: encode_snapshot(coordinator.price_data, coordinator.schedule, coordinator.planner_report),
+            SAVE_DELAY,
+        )
+
+    async def async_remove(self):
+        await self._store.async_remove()
+
@@ -0,0 +1,86 @@
+"""
+Change-aware entity notification.
+
+Each entity registers exactly once, with a value function that returns what it exposes
+(state plus whatever attributes matter). async_notify compares every entity's current value
+with the one it last wrote and only calls async_write_ha_state for the entities whose value
+changed; each change bumps that entity's version. Callbacks run directly in the event loop,
+no task per callback.
+"""
+import logging
+
+from homeassistant.core import callback
+
+_UNSET = object()
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _Subscription:
+    __slots__ = ("value_fn", "write", "value", "version")
+
+    def __init__(self, value_fn, write, value):
+        self.value_fn = value_fn
+        self.write = write
+        self.value = value
+        self.version = 0
+
+
+class EntitySubscriptions:
+    """Per-entity subscriptions keyed by the entity, with value versions."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self.notifies = 0
+        self.writes = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    @callback
+    def async_add(self, entity, value_fn, write):
+        """
+        Register entity (replacing an earlier registration of the same entity). The current
+        value counts as written, since Home Assistant writes the state when the entity is added.
+        Returns a function that removes the registration.
+        """
+        try:
+            value = value_fn()
+        except Exception:  # Entiteten kan sakna data ännu; skriv vid första notify
+            value = _UNSET
+        self._subscriptions[entity] = _Subscription(value_fn, write, value)
+
+        @callback
+        def remove():
+            self._subscriptions.pop(entity, None)
+        return remove
+
+    def version(self, entity):
+        """Number of value changes written for entity (None when not registered)."""
+        subscription = self._subscriptions.get(entity)
+        return subscription.version if subscription is not None else None
+
+    @callback
+    def async_notify(self):
+        """Write state for every entity whose value changed since its last write; returns the count."""
+        self.notifies += 1
+        written = 0
+        for entity, subscription in list(self._subscriptions.items()):
+            try:
+                value = subscription.value_fn()
+                if value == subscription.value:
+                    self.skipped += 1
+                    continue
+                subscription.value = value
+                subscription.version += 1
+                subscription.write()
+                written += 1
+            except Exception as e:
+                _LOGGER.error("Error updating %s: %s", getattr(entity, "entity_id", entity), e)
+        self.writes += written
+        return written
+
+    @property
+    def stats(self):
+        return {"entities": len(self), "notifies": self.notifies, "writes": self.writes, "skipped": self.skipped}
@@ -0,0 +1,149 @@
+"""
+Parameter sweep: rank min_profit, rates and SoC limits by backtested savings.
+
+    python -m custom_components.home_battery_optimizer.sweep prices.csv [--samples 200] [--workers 8]
+
+The parsed price history is placed once in shared memory; worker processes attach to it
+read-only, so each task only carries its parameter dict.
+"""
+import argparse
+import itertools
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from .backtest import DEFAULT_PARAMS, backtest_days, iter_days, read_prices
+
+# Standardrutnät, motsvarar intervallen på number-entiteterna
+DEFAULT_GRID = {
+    "min_profit": [5.0, 10.0, 20.0, 30.0],
+    "charge_rate": [15.0, 25.0, 50.0],
+    "discharge_rate": [15.0, 25.0, 50.0],
+    "min_battery_soc": [0.0, 10.0, 20.0],
+    "max_battery_soc": [80.0, 90.0, 100.0],
+}
+
+_FLOAT_SIZE = 8
+
+# Sätts i varje workerprocess av _init_worker
+_shared = None
+_days = None
+
+
+def param_grid(grid=None):
+    """Every combination of the grid values (dict of lists)."""
+    grid = grid or DEFAULT_GRID
+    keys = list(grid)
+    for values in itertools.product(*(grid[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def param_samples(count, grid=None, seed=0):
+    """count random parameter sets, uniform within each grid key's min..max."""
+    grid = grid or DEFAULT_GRID
+    rnd = random.Random(seed)
+    for _ in range(count):
+        yield {key: round(rnd.uniform(min(values), max(values)), 1) for key, values in grid.items()}
+
+
+def is_valid(params):
+    return params.get("min_battery_soc", 0) < params.get("max_battery_soc", 100)
+
+
+class SharedPrices:
+    """Day-split price history in one shared-memory block of doubles (bounds, then prices)."""
+
+    def __init__(self, shm, table, owner):
+        self.shm = shm
+        self.table = table  # [(date_iso, bounds_offset, prices_offset, slots), ...]
+        self.owner = owner
+
+    @classmethod
+    def create(cls, days):
+        days = list(days)
+        n_bounds = sum(len(bounds) for _, bounds, _ in days)
+        n_prices = sum(len(prices) for _, _, prices in days)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, (n_bounds + n_prices) * _FLOAT_SIZE))
+        values = shm.buf.cast("d")
+        table = []
+        b_off = 0
+        p_off = n_bounds
+        for date, bounds, prices in days:
+            values[b_off:b_off + len(bounds)] = bounds
+            values[p_off:p_off + len(prices)] = prices
+            table.append((date, b_off, p_off, len(prices)))
+            b_off += len(bounds)
+            p_off += len(prices)
+        values.release()
+        return cls(shm, table, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor):
+        name, table = descriptor
+        return cls(shared_memory.SharedMemory(name=name), table, owner=False)
+
+    @property
+    def descriptor(self):
+        return self.shm.name, self.table
+
+    def days(self):
+        """Days as (date_iso, bounds, prices) memoryviews straight into the shared block."""
+        values = self.shm.buf.cast("d")
+        return [
+            (date, values[b_off:b_off + slots + 1], values[p_off:p_off + slots])
+            for date, b_off, p_off, slots in self.table
+        ]
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _init_worker(descriptor):
+    global _shared, _days
+    _shared = SharedPrices.attach(descriptor)
+    _days = _shared.days()
+
+
+def _evaluate(params):
+    result = backtest_days(_days, params)
+    return {"params": params, **{key: result[key] for key in ("savings", "cost", "cycles", "charged_kwh", "discharged_kwh")}}
+
+
+def run_sweep(path, candidates, base_params=None, workers=None):
+    """Backtest every candidate parameter set in parallel; return results ranked by savings."""
+    base = {**DEFAULT_PARAMS, **(base_params or {})}
+    candidates = [{**base, **params} for params in candidates]
+    candidates = [params for params in candidates if is_valid(params)]
+    shared = SharedPrices.create(iter_days(read_prices(path)))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared.descriptor,)) as pool:
+            results = list(pool.map(_evaluate, candidates, chunksize=max(1, len(candidates) // 64)))
+    finally:
+        shared.close()
+    results.sort(key=lambda r: r["savings"], reverse=True)
+    for rank, result in enumerate(results, start=1):
+        result["rank"] = rank
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank planner parameters by backtested savings.")
+    parser.add_argument("path", help="CSV (start[,end],price) or JSON price file")
+    parser.add_argument("--samples", type=int, default=0, help="random samples instead of the full grid")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", dest="planner_engine", default=DEFAULT_PARAMS["planner_engine"])
+    parser.add_argument("--capacity", dest="battery_capacity", type=float, default=DEFAULT_PARAMS["battery_capacity"])
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+    candidates = param_samples(args.samples, seed=args.seed) if args.samples else param_grid()
+    base = {"planner_engine": args.planner_engine, "battery_capacity": args.battery_capacity}
+    results = run_sweep(args.path, candidates, base, args.workers)
+    print(json.dumps(results[:args.top], indent=2))
+
+
+if __name__ == "__main__":
+    main()
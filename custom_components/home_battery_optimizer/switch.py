@@ -52,7 +52,6 @@ class BatteryOptimizerSwitch(HBOEntity, SwitchEntity):
             await self.coordinator.async_set_discharging(True)
         elif key == "self_usage":
             await self.coordinator.async_set_self_usage(True)
-        self.async_write_ha_state()
 
     async def async_turn_off(self, **kwargs):
         key = self._key
@@ -61,5 +60,4 @@ class BatteryOptimizerSwitch(HBOEntity, SwitchEntity):
         elif key == "discharging":
             await self.coordinator.async_set_discharging(False)
         elif key == "self_usage":
-            await self.coordinator.async_set_self_usage(False)
-        self.async_write_ha_state()
\ No newline at end of file
+            await self.coordinator.async_set_self_usage(False)
\ No newline at end of file
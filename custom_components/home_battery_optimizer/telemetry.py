@@ -0,0 +1,195 @@
+"""
+Learned effective charge/discharge rates from battery power and SoC telemetry.
+
+Every SoC or battery power change closes an interval since the previous sample; the interval
+(SoC band, power direction, hours, SoC change) goes into a fixed-size ring buffer. Per band and
+direction the model keeps running sums of hours and SoC change over the intervals in the
+buffer: adding a new interval and subtracting the one it overwrites is O(1), and memory is
+bounded by RING_SIZE. The effective rate of a band is its SoC change per hour, which captures
+that real chargers taper near full.
+"""
+from array import array
+import logging
+
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+RING_SIZE = 2048  # Antal intervall som rates räknas över
+BANDS = 10  # SoC-band om 10 %
+MIN_POWER_W = 100  # Under detta står batteriet still och intervallet räknas inte
+MAX_INTERVAL_SECONDS = 900  # Längre tid utan sampel: hoppa över intervallet
+MIN_BAND_HOURS = 0.25  # Ett band behöver så här mycket data innan dess rate används
+RATE_QUANTUM = 1.0  # %/timme; avrundning så att små ändringar inte slår ut plancachen
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 300
+
+CHARGE = "charge"
+DISCHARGE = "discharge"
+
+_POSITIVE = 0  # Intervall med positiv effekt
+_NEGATIVE = 1  # Intervall med negativ effekt
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def soc_band(soc):
+    return min(BANDS - 1, max(0, int(soc * BANDS // 100)))
+
+
+class RateModel:
+    """Sliding-window SoC change per hour, per SoC band and power direction."""
+
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        # Ringbuffer, en rad per intervall: band*2+riktning, timmar, SoC-förändring
+        self._key = array("b", [-1]) * size
+        self._hours = array("d", [0.0]) * size
+        self._delta = array("d", [0.0]) * size
+        self._head = 0
+        self.count = 0
+        # Summor över intervallen i bufferten, index band*2+riktning
+        self._sum_hours = array("d", [0.0]) * (2 * BANDS)
+        self._sum_delta = array("d", [0.0]) * (2 * BANDS)
+        self._last_ts = None
+        self._last_soc = None
+        self._last_power = None
+        self.samples = 0
+
+    def observe(self, ts, soc=None, power=None):
+        """
+        Sample at ts; soc/power None keep the last known value. Closes the interval since the
+        previous sample when the battery was moving at its start.
+        """
+        if self._last_ts is not None and ts < self._last_ts:
+            return
+        self.samples += 1
+        if soc is None:
+            soc = self._last_soc
+        if power is None:
+            power = self._last_power
+        last_soc = self._last_soc
+        last_power = self._last_power
+        seconds = ts - self._last_ts if self._last_ts is not None else 0
+        if (
+            last_soc is not None and soc is not None and last_power is not None
+            and 0 < seconds <= MAX_INTERVAL_SECONDS and abs(last_power) >= MIN_POWER_W
+        ):
+            direction = _POSITIVE if last_power > 0 else _NEGATIVE
+            self._push(soc_band(last_soc) * 2 + direction, seconds / 3600, soc - last_soc)
+        self._last_ts = ts
+        self._last_soc = soc
+        self._last_power = power
+
+    def _push(self, key, hours, delta):
+        head = self._head
+        old = self._key[head]
+        if old >= 0:
+            # Äldsta intervallet skrivs över: ta bort dess bidrag
+            self._sum_hours[old] -= self._hours[head]
+            self._sum_delta[old] -= self._delta[head]
+        else:
+            self.count += 1
+        self._key[head] = key
+        self._hours[head] = hours
+        self._delta[head] = delta
+        self._sum_hours[key] += hours
+        self._sum_delta[key] += delta
+        self._head = (head + 1) % self.size
+
+    def _charge_direction(self):
+        # Batterieffektens tecken varierar mellan integrationer: laddning är den riktning där SoC ökat
+        rise = [sum(self._sum_delta[direction::2]) for direction in (_POSITIVE, _NEGATIVE)]
+        return _NEGATIVE if rise[_NEGATIVE] > rise[_POSITIVE] else _POSITIVE
+
+    def band_rates(self, kind):
+        """Learned %/hour per SoC band for CHARGE or DISCHARGE; None for bands without enough data."""
+        direction = self._charge_direction()
+        if kind == DISCHARGE:
+            direction = 1 - direction
+        sign = 1 if kind == CHARGE else -1
+        rates = []
+        for band in range(BANDS):
+            key = band * 2 + direction
+            hours = self._sum_hours[key]
+            if hours < MIN_BAND_HOURS:
+                rates.append(None)
+            else:
+                rates.append(max(0.0, sign * self._sum_delta[key] / hours))
+        return rates
+
+    def curve(self, kind, default_rate):
+        """
+        Rate curve for the planner: %/hour per SoC band, bands without data at default_rate.
+        None until any band is learned, so the planner keeps its constant rate.
+        """
+        rates = self.band_rates(kind)
+        if all(rate is None for rate in rates):
+            return None
+        return tuple(
+            float(default_rate) if rate is None else round(rate / RATE_QUANTUM) * RATE_QUANTUM
+            for rate in rates
+        )
+
+    def as_dict(self):
+        # Intervallen i tidsordning; summorna räknas fram igen vid load
+        order = [(self._head + i) % self.size for i in range(self.size)]
+        rows = [i for i in order if self._key[i] >= 0]
+        return {
+            "key": [self._key[i] for i in rows],
+            "hours": [round(self._hours[i], 5) for i in rows],
+            "delta": [round(self._delta[i], 3) for i in rows],
+        }
+
+    def load(self, data):
+        keys, hours, deltas = data.get("key", ()), data.get("hours", ()), data.get("delta", ())
+        if not len(keys) == len(hours) == len(deltas):
+            raise ValueError("telemetry columns must have the same length")
+        for key in keys:
+            if not 0 <= key < 2 * BANDS:
+                raise ValueError(f"invalid band key {key}")
+        for key, h, delta in zip(keys, hours, deltas):
+            self._push(key, float(h), float(delta))
+
+    @property
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "intervals": self.count,
+            "charge": [None if rate is None else round(rate, 1) for rate in self.band_rates(CHARGE)],
+            "discharge": [None if rate is None else round(rate, 1) for rate in self.band_rates(DISCHARGE)],
+        }
+
+
+class RateStore:
+    """Store-backed persistence of the telemetry intervals for one config entry."""
+
+    def __init__(self, hass, entry_id):
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.telemetry.{entry_id}")
+        self._save_pending = False
+
+    async def async_load_into(self, model):
+        data = await self._store.async_load()
+        if not data:
+            return False
+        try:
+            model.load(data)
+        except (TypeError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable battery telemetry: %s", e)
+            return False
+        return True
+
+    def async_schedule_save(self, model):
+        # Som ProfileStore: arma bara när ingen sparning väntar, annars flyttar varje effekt-event fram den
+        if self._save_pending:
+            return
+        self._save_pending = True
+        self._store.async_delay_save(lambda: self._data_to_save(model), SAVE_DELAY)
+
+    def _data_to_save(self, model):
+        self._save_pending = False
+        return model.as_dict()
+
+    async def async_remove(self):
+        await self._store.async_remove()
@@ -1,8 +1,14 @@
+import math
 from datetime import datetime, timedelta
 
 def get_next_hour():
-    now = datetime.now()
-    return now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return get_next_slot(60)
+
+def get_next_slot(slot_minutes=60, now=None):
+    now = now or datetime.now()
+    start = now.replace(minute=0, second=0, microsecond=0)
+    passed = (now - start) // timedelta(minutes=slot_minutes)
+    return start + timedelta(minutes=slot_minutes) * (passed + 1)
 
 def format_time(hour):
     return hour.strftime("%H:%M")
@@ -17,4 +23,13 @@ def is_time_in_range(start_time, end_time, check_time):
         return check_time >= start_time or check_time <= end_time
     
 def get_schedule_hours(start_hour, duration):
-    return [start_hour + timedelta(hours=i) for i in range(duration)]
\ No newline at end of file
+    return get_schedule_slots(start_hour, duration, 60)
+
+def get_schedule_slots(start, count, slot_minutes=60):
+    return [start + timedelta(minutes=slot_minutes * i) for i in range(count)]
+
+def slots_needed(soc_delta, step):
+    """Slots needed to move soc_delta percent at step percent per slot (1% tolerance)."""
+    if step <= 0:
+        return 0
+    return max(0, math.floor((soc_delta - 1) / step) + 1)
\ No newline at end of file
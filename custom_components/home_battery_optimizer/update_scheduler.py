@@ -0,0 +1,116 @@
+"""Coalescing, single-flight scheduler for coordinator updates."""
+import asyncio
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class UpdateScheduler:
+    """
+    Runs the coordinator update at most once at a time, with at most one run queued behind it.
+    State-change events are first filtered by a per-entity deadband and then coalesced
+    within a debounce window, so a burst of sensor updates gives a single rebuild.
+    """
+
+    def __init__(self, update_method, debounce_seconds=5.0, deadbands=None, hass=None):
+        self._update_method = update_method
+        self.debounce_seconds = debounce_seconds
+        self.deadbands = {entity_id: band for entity_id, band in (deadbands or {}).items() if entity_id}
+        self._hass = hass
+        self._last_values = {}
+        self._timer = None
+        self._running = None  # Tasken som kör uppdateringen just nu
+        self._queued = None  # Future för körningen som väntar bakom den pågående
+        self.events_received = 0
+        self.events_dropped = 0
+        self.rebuilds = 0
+
+    @property
+    def stats(self):
+        return {
+            "events_received": self.events_received,
+            "events_dropped": self.events_dropped,
+            "rebuilds": self.rebuilds,
+            "collapse_ratio": round(self.events_received / self.rebuilds, 2) if self.rebuilds else None,
+        }
+
+    def is_significant(self, entity_id, new_state):
+        """False when a numeric state moved less than the entity's deadband since the last accepted value."""
+        band = self.deadbands.get(entity_id)
+        if band is None or new_state is None:
+            return True
+        try:
+            value = float(new_state.state)
+        except (TypeError, ValueError):
+            # unknown/unavailable: släpp igenom, men bara en gång
+            value = new_state.state
+            if self._last_values.get(entity_id) == value:
+                return False
+            self._last_values[entity_id] = value
+            return True
+        last = self._last_values.get(entity_id)
+        if isinstance(last, float) and abs(value - last) < band:
+            return False
+        self._last_values[entity_id] = value
+        return True
+
+    def async_handle_event(self, event):
+        """State-change listener: count, filter and debounce."""
+        self.events_received += 1
+        data = event.data
+        if not self.is_significant(data.get("entity_id"), data.get("new_state")):
+            self.events_dropped += 1
+            return
+        self.async_request()
+
+    def async_request(self):
+        """Debounced run: joins the pending debounce window, or opens one."""
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.debounce_seconds, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        if self._hass is not None:
+            self._hass.async_create_task(self.async_run())
+        else:
+            asyncio.ensure_future(self.async_run())
+
+    async def async_run(self):
+        """Run the update now. If one is running, join (or queue) the single run behind it."""
+        if self._timer is not None:
+            # Körningen täcker även väntande events
+            self._timer.cancel()
+            self._timer = None
+        if self._running is not None:
+            if self._queued is None:
+                self._queued = asyncio.get_running_loop().create_future()
+            # Anrop inifrån pågående uppdatering: köa bara, att vänta här skulle låsa
+            if asyncio.current_task() is not self._running:
+                await asyncio.shield(self._queued)
+            return
+        self._running = asyncio.current_task()
+        waiting = None
+        try:
+            while True:
+                self.rebuilds += 1
+                try:
+                    await self._update_method()
+                except Exception as e:
+                    _LOGGER.error("Error in scheduled update: %s", e)
+                if waiting is not None:
+                    waiting.set_result(None)
+                waiting, self._queued = self._queued, None
+                if waiting is None:
+                    break
+        finally:
+            self._running = None
+            # Avbruten körning: släpp väntare istället för att låta dem hänga
+            for future in (waiting, self._queued):
+                if future is not None and not future.done():
+                    future.set_result(None)
+            self._queued = None
+
+    def async_cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
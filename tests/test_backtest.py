@@ -0,0 +1,92 @@
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from custom_components.home_battery_optimizer.backtest import (
+    BatteryModel,
+    backtest_days,
+    iter_days,
+    read_prices,
+    run_backtest,
+)
+from custom_components.home_battery_optimizer.schedule_store import ACTION_CHARGE, ACTION_DISCHARGE
+
+
+def write_csv(path, start, hours):
+    with open(path, "w") as f:
+        f.write("start,price\n")
+        for h in range(hours):
+            t = start + timedelta(hours=h)
+            f.write(f"{t.isoformat()},{50 + 40 * math.sin(math.pi * (t.hour - 6) / 12):.2f}\n")
+
+
+class TestBacktest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tmp.name, "prices.csv")
+        write_csv(self.csv, datetime(2024, 1, 29), 24 * 6)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_days_are_streamed_per_calendar_day(self):
+        days = list(iter_days(read_prices(self.csv)))
+        self.assertEqual([d[0] for d in days][:4], ["2024-01-29", "2024-01-30", "2024-01-31", "2024-02-01"])
+        self.assertTrue(all(len(d[2]) == 24 and len(d[1]) == 25 for d in days))
+
+    def test_month_shards_in_pool_match_serial_run(self):
+        serial = run_backtest(self.csv, {"soc": 20}, workers=1)
+        pooled = run_backtest(self.csv, {"soc": 20}, workers=2)
+        self.assertEqual(serial, pooled)
+        self.assertEqual([m["first_day"] for m in serial["months"]], ["2024-01-29", "2024-02-01"])
+        self.assertEqual(serial["days"], 6)
+        self.assertAlmostEqual(serial["cost"], sum(m["cost"] for m in serial["months"]), places=2)
+        self.assertGreater(serial["discharged_kwh"], 0)
+        self.assertGreater(serial["savings"], 0)
+
+    def test_json_input(self):
+        path = os.path.join(self.tmp.name, "prices.json")
+        t0 = datetime(2024, 3, 1)
+        items = [
+            {"start": (t0 + timedelta(hours=h)).isoformat(), "end": (t0 + timedelta(hours=h + 1)).isoformat(), "value": v}
+            for h, v in enumerate([10] * 6 + [100] * 6 + [10] * 6 + [100] * 6)
+        ]
+        with open(path, "w") as f:
+            json.dump(items, f)
+        days = list(iter_days(read_prices(path)))
+        result = backtest_days(days, {"soc": 0})
+        self.assertEqual(result["days"], 1)
+        self.assertGreater(result["cycles"], 0)
+
+    def test_battery_model_clips_to_limits(self):
+        battery = BatteryModel(10, 90, 10, 100, 25, 50)
+        battery.apply(ACTION_CHARGE, 1.0, 1)
+        self.assertEqual(battery.soc, 100)
+        self.assertAlmostEqual(battery.charged_kwh, 1.0)
+        battery.apply(ACTION_DISCHARGE, 2.0, 2)
+        self.assertEqual(battery.soc, 10)
+        self.assertAlmostEqual(battery.cost, 1.0 - 18.0)
+
+
+
+class TestOfflineImport(unittest.TestCase):
+
+    def test_cli_modules_import_without_home_assistant(self):
+        # homeassistant/voluptuous = None i sys.modules: varje import av dem misslyckas
+        code = (
+            "import sys; sys.modules['homeassistant'] = None; sys.modules['voluptuous'] = None; "
+            "import custom_components.home_battery_optimizer.backtest, custom_components.home_battery_optimizer.sweep"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import random
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.price_series import parse_nordpool
+from custom_components.home_battery_optimizer.schedule_store import ACTION_CHARGE, ACTION_DISCHARGE
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+
+# Planer från baseline-koden (före slot-refaktoreringen) på indata där den blev klar: (priser, soc, rate, min_profit, actions)
+BASELINE_PLANS = [
+    ([125.89, 112.48, 60.19, 35.13, 74.25, 57.76, 116.49, 42.01, 68.87, 85.42, 135.76, 73.23, 38.68, 112.15, 90.85, 33.83, 136.01, 147.33, 120.58, 134.84, 43.07, 108.12, 134.32, 101.02], 80, 40, 5, "iiicdddddcdddddcddddcddd"),
+    ([31.88, 79.36, 52.34, 88.61, 91.99, 5.16, -2.96, 124.81, 35.2, 31.32, 149.32, 67.89, 124.65, 68.83, 94.06, 18.35, 93.4, 129.55, 76.09, 109.89, 99.07, 4.92, 112.53, 86.62], 50, 10, 10, "cciiddddddddddddddcddddd"),
+    ([144.61, -3.19, 109.08, 19.49, 147.88, -2.38, 131.32, 100.61, 127.89, 149.97, 32.16, 47.4, 104.77, 38.49, 35.81, 30.43, 127.96, 130.55, 118.63, 29.63, 138.35, 74.26, 30.86, 65.61], 80, 25, 5, "icddddddddccdiccidddddcd"),
+    ([101.06, 9.85, 20.87, 88.79, 45.85, 136.77, 117.15, 129.03, 59.25, 123.47, 82.89, 123.75, 44.79, 79.97, 63.24, 58.89, 55.78, 59.22, 17.82, 17.08, 43.06, 102.52, 97.44, 112.03], 20, 10, 5, "ddddddddddddcdcddddddddd"),
+    ([52.44, 135.68, 56.38, 26.94, 121.76, 112.61, 103.23, -1.62, 58.12, 43.75, 34.54, 47.55, 37.77, 73.17, -3.25, 84.37, 147.06, 69.92, 44.26, 101.75, 48.72, 135.8, 131.59, 118.86], 50, 10, 5, "dddddddcddcdccidddcdcddd"),
+    ([86.46, 106.04, 144.91, 68.0, 77.92, 123.54, 6.19, 36.02, 23.85, 49.67, 50.03, 92.97, 56.48, 128.06, 83.73, 118.35, 126.18, 66.29, 15.21, 26.15, 106.11, 126.43, 97.45, 2.51], 0, 25, 10, "ddddddcdcccddddddcccdddi"),
+]
+
+
+def make_coordinator(raw_today, raw_tomorrow=(), soc=20.0, **config):
+    config.setdefault("charging_on", True)
+    config.setdefault("discharging_on", True)
+    coordinator = HomeBatteryOptimizerCoordinator(None, config)
+    base_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    coordinator.price_data = parse_nordpool(list(raw_today), list(raw_tomorrow), base_time)
+    coordinator.soc = soc
+    return coordinator
+
+
+class TestCoordinatorWindow(unittest.TestCase):
+
+    def test_quarter_hour_slots_scale_rates(self):
+        hourly = make_coordinator([{"value": v} for v in HOURLY])
+        quarter = make_coordinator([{"value": v} for v in HOURLY for _ in range(4)])
+        hourly_schedule = hourly.build_full_schedule(force_all_unpassed=True)
+        quarter_schedule = quarter.build_full_schedule(force_all_unpassed=True)
+        self.assertEqual(len(quarter_schedule), 96)
+        self.assertEqual(quarter_schedule.calendar.slot_seconds, 900)
+        # Samma energi per timme oavsett upplösning: 4 kvartar laddar lika mycket som 1 timme
+        self.assertEqual(sum(quarter_schedule.charge), 4 * sum(hourly_schedule.charge))
+        self.assertEqual(max(quarter_schedule.estimated_soc), max(hourly_schedule.estimated_soc))
+
+    def test_item_start_end_define_slots(self):
+        items = [
+            {"start": "2024-05-01T00:00:00", "end": "2024-05-01T00:15:00", "value": 1.0},
+            {"start": "2024-05-01T00:15:00", "end": "2024-05-01T00:30:00", "value": 2.0},
+        ]
+        coordinator = make_coordinator(items)
+        self.assertEqual(coordinator.price_data.calendar.slot_seconds, 900)
+        self.assertEqual(coordinator._slot_steps(), (25 * 0.25, 25 * 0.25))
+
+    def test_window_pass_always_terminates(self):
+        for seed in range(50):
+            rnd = random.Random(seed)
+            prices = [{"value": rnd.uniform(-5, 150)} for _ in range(96)]
+            coordinator = make_coordinator(prices, prices, soc=rnd.uniform(0, 100))
+            schedule = coordinator.build_full_schedule()
+            self.assertEqual(len(schedule), 192)
+
+    def test_plan_matches_baseline_where_baseline_finished(self):
+        for prices, soc, rate, min_profit, expected in BASELINE_PLANS:
+            coordinator = make_coordinator(
+                [{"value": v} for v in prices], soc=soc,
+                charge_rate=rate, discharge_rate=rate, min_profit=min_profit,
+            )
+            schedule = coordinator.build_full_schedule(force_all_unpassed=True)
+            self.assertEqual("".join("icd"[a] for a in schedule.action), expected)
+
+    def test_next_window_does_not_overwrite_planned_discharge(self):
+        prices, soc, rate, min_profit, _ = BASELINE_PLANS[3]
+        coordinator = make_coordinator(
+            [{"value": v} for v in prices], soc=soc,
+            charge_rate=rate, discharge_rate=rate, min_profit=min_profit,
+        )
+        schedule = coordinator.build_full_schedule(force_all_unpassed=True)
+        # Nästa window får inte börja inne i det förra och skriva över planerad urladdning med laddning
+        self.assertEqual(schedule.action[11], ACTION_DISCHARGE)
+        self.assertNotIn(ACTION_CHARGE, list(schedule.action[15:21]))
+
+    def test_executor_plan_matches_sync_plan(self):
+        coordinator = make_coordinator([{"value": v} for v in HOURLY])
+        schedule = asyncio.run(coordinator.async_build_schedule(force_all_unpassed=True))
+        self.assertEqual(list(schedule.action), list(make_coordinator([{"value": v} for v in HOURLY]).build_full_schedule(True).action))
+
+    def test_superseded_executor_plan_is_discarded(self):
+        coordinator = make_coordinator([{"value": v} for v in HOURLY])
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            coordinator.hass = SimpleNamespace(async_add_executor_job=lambda func, *args: loop.run_in_executor(None, func, *args))
+            task = asyncio.ensure_future(coordinator.async_build_schedule(force_all_unpassed=True))
+            await asyncio.sleep(0)
+            # En nyare plan (annan SoC) byggs medan executor-planen fortfarande körs
+            coordinator.soc = 90.0
+            newer = coordinator.build_full_schedule(force_all_unpassed=True)
+            return await task, newer
+
+        stale, newer = asyncio.run(scenario())
+        self.assertIsNone(stale)
+        self.assertIs(coordinator.schedule, newer)
+        self.assertEqual(coordinator.plans_discarded, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
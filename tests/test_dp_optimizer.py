@@ -0,0 +1,113 @@
+import itertools
+import random
+import unittest
+from datetime import datetime
+
+from custom_components.home_battery_optimizer.const import PLANNER_DP
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.dp_optimizer import SocGrid, plan_dp, schedule_cost, solve
+from custom_components.home_battery_optimizer.price_series import parse_nordpool
+from custom_components.home_battery_optimizer.schedule_store import (
+    ACTION_CHARGE,
+    ACTION_DISCHARGE,
+    ACTION_IDLE,
+    SlotCalendar,
+)
+
+
+def follow_cost(prices, soc, actions, grid, min_profit, terminal_price):
+    """Cost of following actions from soc with the grid's exact steps; None if an action is not allowed."""
+    start = soc
+    cost = 0.0
+    for price, action in zip(prices, actions):
+        step = grid.transition(soc, action)
+        if step is None:
+            return None
+        soc, kwh = step
+        if action == ACTION_CHARGE:
+            cost += price * kwh
+        elif action == ACTION_DISCHARGE:
+            cost -= (price - min_profit) * kwh
+    return cost - terminal_price * (soc - start) * grid.kwh_per_percent
+
+
+def brute_force_cost(prices, soc, grid, min_profit, terminal_price):
+    costs = (
+        follow_cost(prices, soc, actions, grid, min_profit, terminal_price)
+        for actions in itertools.product((ACTION_IDLE, ACTION_CHARGE, ACTION_DISCHARGE), repeat=len(prices))
+    )
+    return min(cost for cost in costs if cost is not None)
+
+
+class TestDpOptimizer(unittest.TestCase):
+
+    def test_simple_arbitrage(self):
+        grid = SocGrid(50, 50, 0, 100)
+        actions, soc_after = solve([10, 10, 100, 100], 0, grid, min_profit=5)
+        self.assertEqual(actions, [ACTION_CHARGE, ACTION_CHARGE, ACTION_DISCHARGE, ACTION_DISCHARGE])
+        self.assertEqual(soc_after, [50, 100, 50, 0])
+
+    def test_min_profit_blocks_small_spread(self):
+        grid = SocGrid(50, 50, 0, 100)
+        actions, _ = solve([10, 10, 15, 15], 0, grid, min_profit=10)
+        self.assertEqual(actions, [ACTION_IDLE] * 4)
+
+    def test_respects_soc_limits(self):
+        grid = SocGrid(30, 30, 20, 80)
+        _, soc_after = solve([1, 1, 1, 90, 90, 90, 1, 90], 50, grid)
+        self.assertTrue(all(20 <= soc <= 80 for soc in soc_after))
+
+    def test_matches_brute_force(self):
+        for seed in range(20):
+            rnd = random.Random(seed)
+            prices = [rnd.uniform(-10, 100) for _ in range(6)]
+            grid = SocGrid(20, 30, 10, 90, resolution=10)
+            soc = rnd.choice([10, 40, 90])
+            actions, _ = solve(prices, soc, grid, min_profit=5, terminal_price=min(prices))
+            cost = follow_cost(prices, soc, actions, grid, 5, min(prices))
+            self.assertAlmostEqual(cost, brute_force_cost(prices, soc, grid, 5, min(prices)), places=6)
+
+    def test_rate_off_the_grid_is_planned_with_exact_steps(self):
+        # 7 %/h i kvartsslots = 1.75 % per slot, inte en multipel av 1 %-griden
+        calendar = SlotCalendar.uniform(datetime(2024, 5, 1).timestamp(), 900, 16)
+        prices = [10] * 8 + [100] * 8
+        schedule = plan_dp(calendar, prices, 10.3, 0, 1.75, 1.75, 10, 95.5, 5)
+        soc = 10.3
+        for i in range(len(schedule)):
+            if schedule.action[i] == ACTION_CHARGE:
+                soc = min(soc + 1.75, 95.5)
+            elif schedule.action[i] == ACTION_DISCHARGE:
+                soc = max(soc - 1.75, 10)
+            self.assertAlmostEqual(schedule.estimated_soc[i], round(soc, 2))
+        self.assertEqual(list(schedule.action), [ACTION_CHARGE] * 8 + [ACTION_DISCHARGE] * 8)
+        self.assertAlmostEqual(schedule.estimated_soc[7], 24.3)
+        # Kostnaden planen rapporteras med är samma batteri som den planerades för
+        grid = SocGrid(1.75, 1.75, 10, 95.5)
+        expected = follow_cost(prices, 10.3, list(schedule.action), grid, 0, min(prices))
+        self.assertAlmostEqual(schedule_cost(schedule, 10.3, 0, 1.75, 1.75, 10, 95.5), round(expected, 2))
+
+    def test_plan_dp_fills_schedule(self):
+        calendar = SlotCalendar.uniform(datetime(2024, 5, 1).timestamp(), 3600, 6)
+        schedule = plan_dp(calendar, [50, 10, 10, 90, 90, 20], 0, 1, 50, 50, 0, 100, 5)
+        self.assertTrue(schedule.passed[0])
+        self.assertEqual(schedule.action_name(0), "idle")
+        self.assertEqual([schedule.action_name(i) for i in range(1, 5)], ["charge", "charge", "discharge", "discharge"])
+        self.assertEqual(list(schedule.window[1:5]), [1, 1, 1, 1])
+        self.assertEqual(len(schedule.windows), 1)
+        self.assertEqual(schedule.windows[0]["charged_kwh"], 10.0)
+        self.assertEqual(schedule.windows[0]["discharge_hours"], 2.0)
+
+    def test_coordinator_reports_savings(self):
+        base_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        coordinator = HomeBatteryOptimizerCoordinator(None, {"planner_engine": PLANNER_DP, "charging_on": True, "discharging_on": True})
+        coordinator.price_data = parse_nordpool([{"value": v} for v in [50, 40, 30, 20, 30, 60, 90, 100] * 3], [], base_time)
+        coordinator.soc = 20.0
+        coordinator.build_full_schedule(force_all_unpassed=True)
+        report = coordinator.planner_report
+        self.assertEqual(report["engine"], PLANNER_DP)
+        self.assertIn("heuristic_cost", report)
+        self.assertEqual(report["savings_vs_heuristic"], round(report["heuristic_cost"] - report["cost"], 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import asyncio
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.fleet import Fleet, aggregate_inputs, plan_fleet
+from custom_components.home_battery_optimizer.price_series import parse_nordpool
+from custom_components.home_battery_optimizer.price_service import PriceService
+from custom_components.home_battery_optimizer.schedule_store import ACTION_CHARGE
+from custom_components.home_battery_optimizer.update_scheduler import UpdateScheduler
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+
+
+def make_coordinator(price_data, soc, **config):
+    config.setdefault("charging_on", True)
+    config.setdefault("discharging_on", True)
+    coordinator = HomeBatteryOptimizerCoordinator(None, config)
+    coordinator.price_data = price_data
+    coordinator.soc = soc
+    return coordinator
+
+
+def price_data():
+    base_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return parse_nordpool([{"value": v} for v in HOURLY], [], base_time)
+
+
+class TestFleet(unittest.TestCase):
+
+    def test_aggregate_weights_by_capacity(self):
+        prices = price_data()
+        small = make_coordinator(prices, 20.0, battery_capacity=5.0, charge_rate=40).plan_inputs()
+        large = make_coordinator(prices, 80.0, battery_capacity=15.0, charge_rate=20).plan_inputs()
+        fleet = aggregate_inputs([small, large])
+        self.assertEqual(fleet.capacity_kwh, 20.0)
+        self.assertAlmostEqual(fleet.soc, 65.0)
+        # 2 kW + 3 kW av 20 kWh = 25 %/h
+        self.assertAlmostEqual(fleet.charge_rate, 25.0)
+
+    def test_aggregate_weights_learned_curves_by_capacity(self):
+        prices = price_data()
+        small = make_coordinator(prices, 20.0, battery_capacity=5.0, charge_rate=40).plan_inputs()._replace(
+            charge_curve=(40.0,) * 5 + (20.0,) * 5,
+        )
+        large = make_coordinator(prices, 80.0, battery_capacity=15.0, charge_rate=20).plan_inputs()._replace(
+            charge_curve=(20.0,) * 8 + (4.0,) * 2,
+        )
+        fleet = aggregate_inputs([small, large])
+        # Band 0: 2 kW + 3 kW, band 9: 1 kW + 0.6 kW av 20 kWh
+        self.assertAlmostEqual(fleet.charge_curve[0], 25.0)
+        self.assertAlmostEqual(fleet.charge_curve[9], 8.0)
+        self.assertIsNone(fleet.discharge_curve)
+        # Utan kurva räknas medlemmens konstanta rate in i alla band
+        fleet = aggregate_inputs([small, large._replace(charge_curve=None)])
+        self.assertAlmostEqual(fleet.charge_curve[9], (20.0 * 5 + 20.0 * 15) / 20)
+
+    def test_aggregate_sums_member_net_load(self):
+        prices = price_data()
+        first = make_coordinator(prices, 20.0, battery_capacity=5.0).plan_inputs()._replace(net_load=(0.5,) * 24)
+        second = make_coordinator(prices, 80.0, battery_capacity=15.0).plan_inputs()._replace(net_load=(-1.0,) * 12 + (0.25,) * 12)
+        third = make_coordinator(prices, 50.0, battery_capacity=10.0).plan_inputs()
+        fleet = aggregate_inputs([first, second, third])
+        self.assertEqual(fleet.net_load[0], -0.5)
+        self.assertEqual(fleet.net_load[23], 0.75)
+        self.assertIsNone(aggregate_inputs([third]).net_load)
+
+    def test_members_follow_joint_actions_within_own_limits(self):
+        prices = price_data()
+        members = [
+            make_coordinator(prices, 10.0, battery_capacity=5.0, max_battery_soc=90).plan_inputs(),
+            make_coordinator(prices, 50.0, battery_capacity=10.0, charging_on=False).plan_inputs(),
+        ]
+        (first, report), (second, _) = plan_fleet(members)
+        self.assertEqual(report["fleet"]["members"], 2)
+        self.assertLessEqual(max(first.estimated_soc), 90)
+        self.assertNotIn(ACTION_CHARGE, list(second.action))
+        for i, action in enumerate(first.action):
+            if action:
+                self.assertIn(second.action[i], (0, action))
+
+    def test_joint_plan_is_made_once_for_all_members(self):
+        prices = price_data()
+        fleet = Fleet()
+        a = make_coordinator(prices, 20.0, fleet_mode=True)
+        b = make_coordinator(prices, 60.0, fleet_mode=True)
+        fleet.add(a)
+        fleet.add(b)
+        schedule_a = asyncio.run(a.async_build_schedule(force_all_unpassed=True))
+        schedule_b = b.build_full_schedule(force_all_unpassed=True)
+        self.assertEqual(fleet.plans, 1)
+        self.assertIn("fleet", a.planner_report)
+        self.assertEqual(list(schedule_a.window), list(schedule_b.window))
+        fleet.remove(b)
+        self.assertFalse(a.fleet_active)
+        self.assertIsNone(b.fleet)
+
+
+    def test_fleet_miss_rebuilds_each_member_at_most_once(self):
+        prices = price_data()
+        fleet = Fleet()
+        members = [make_coordinator(prices, soc, fleet_mode=True) for soc in (20.0, 40.0, 60.0)]
+        rebuilds = {id(member): 0 for member in members}
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            hass = SimpleNamespace(
+                async_add_executor_job=lambda func, *args: loop.run_in_executor(None, func, *args),
+                async_create_task=loop.create_task,
+            )
+            for member in members:
+                def rebuild(member=member):
+                    rebuilds[id(member)] += 1
+                    # SoC har hunnit ändras, så varje ombyggnad missar den gemensamma cachen
+                    member.soc += 3
+                    return member.async_build_schedule(force_all_unpassed=True)
+                member.hass = hass
+                member.update_scheduler = UpdateScheduler(rebuild, debounce_seconds=0.01, hass=hass)
+                fleet.add(member)
+            await members[0].update_scheduler.async_run()
+            await asyncio.sleep(0.2)
+
+        asyncio.run(scenario())
+        self.assertEqual(list(rebuilds.values()), [1, 1, 1])
+        self.assertEqual(fleet.plans, 3)
+
+class TestPriceService(unittest.TestCase):
+
+    def test_entity_is_parsed_once_for_all_entries(self):
+        attributes = {"raw_today": [{"value": v} for v in HOURLY], "raw_tomorrow": []}
+        hass = SimpleNamespace(states=SimpleNamespace(get=lambda entity_id: SimpleNamespace(attributes=attributes)))
+        service = PriceService(hass)
+        base_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        first = service.get("sensor.nordpool", base_time)
+        self.assertIs(service.get("sensor.nordpool", base_time), first)
+        self.assertEqual(service.stats["sensor.nordpool"]["parses"], 1)
+        self.assertEqual(service.stats["sensor.nordpool"]["reuses"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
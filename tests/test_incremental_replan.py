@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime
+
+from custom_components.home_battery_optimizer.const import PLANNER_DP
+from custom_components.home_battery_optimizer.planner import PlanInputs, frozen_fingerprint, plan, plan_incremental
+from custom_components.home_battery_optimizer.price_series import PriceSeries
+from custom_components.home_battery_optimizer.schedule_store import SlotCalendar
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+TOMORROW = [28, 25, 22, 20, 24, 45, 80, 95, 85, 60, 45, 35, 30, 32, 40, 65, 100, 115, 95, 70, 55, 45, 40, 35]
+
+
+def series(prices):
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    return PriceSeries(SlotCalendar.uniform(start, 3600, len(prices)), prices)
+
+
+class TestIncrementalReplan(unittest.TestCase):
+
+    def test_without_history_it_is_a_full_plan(self):
+        inputs = PlanInputs(series(HOURLY), 20.0)
+        full, _ = plan(inputs)
+        schedule, report = plan_incremental(inputs, None)
+        self.assertEqual(list(schedule.action), list(full.action))
+        self.assertNotIn("frozen_slots", report)
+
+    def test_passed_slots_are_frozen(self):
+        previous, _ = plan(PlanInputs(series(HOURLY), 20.0))
+        # Klockan 10: SoC avviker från prognosen, bara framtiden får ändras
+        inputs = PlanInputs(series(HOURLY), 35.0, current_slot=10)
+        schedule, report = plan_incremental(inputs, previous)
+        self.assertEqual(report["frozen_slots"], 10)
+        for column in ("action", "window", "estimated_soc"):
+            self.assertEqual(list(getattr(schedule, column))[:10], list(getattr(previous, column))[:10])
+        self.assertEqual(list(schedule.passed[:10]), [1] * 10)
+        self.assertEqual(sum(schedule.passed[10:]), 0)
+        # Framtiden är planerad från aktuell SoC
+        future, _ = plan(PlanInputs(series(HOURLY[10:]), 35.0))
+        self.assertEqual(list(schedule.action[10:]), list(future.action))
+        self.assertEqual(len(schedule.windows), len({w for w in schedule.window if w}))
+
+    def test_soc_update_keeps_later_window_boundaries(self):
+        prices = series(HOURLY + TOMORROW)
+        previous, _ = plan(PlanInputs(prices, 20.0))
+        # Klockan 10 är SoC 35 i stället för prognosens 25; window 2 urladdar ändå till botten
+        schedule, _ = plan_incremental(PlanInputs(prices, 35.0, current_slot=10), previous)
+        self.assertNotEqual(list(schedule.action[10:19]), list(previous.action[10:19]))
+        later = [(w["window"], w["start"], w["end"]) for w in previous.windows if w["window"] > 2]
+        self.assertTrue(later)
+        self.assertEqual([(w["window"], w["start"], w["end"]) for w in schedule.windows if w["window"] > 2], later)
+        self.assertEqual(list(schedule.action[19:]), list(previous.action[19:]))
+
+    def test_tomorrow_extends_the_horizon(self):
+        previous, _ = plan(PlanInputs(series(HOURLY), 20.0))
+        inputs = PlanInputs(series(HOURLY + TOMORROW), 60.0, current_slot=13)
+        schedule, _ = plan_incremental(inputs, previous)
+        self.assertEqual(len(schedule), 48)
+        self.assertEqual(list(schedule.action[:13]), list(previous.action[:13]))
+        self.assertIsNotNone(frozen_fingerprint(previous, inputs))
+
+    def test_new_day_is_planned_in_full(self):
+        previous, _ = plan(PlanInputs(series(HOURLY), 20.0))
+        inputs = PlanInputs(series(TOMORROW), 20.0, current_slot=5, engine=PLANNER_DP)
+        self.assertIsNone(frozen_fingerprint(previous, inputs))
+        schedule, report = plan_incremental(inputs, previous)
+        self.assertEqual(report["engine"], PLANNER_DP)
+        self.assertNotIn("frozen_slots", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.instrumentation import (
+    STAGE_EXECUTOR_WAIT,
+    STAGE_PLAN,
+    STAGE_SCHEDULE_BUILD,
+    STAGE_TOTAL,
+    Instrumentation,
+    LatencyHistogram,
+)
+from custom_components.home_battery_optimizer.sensor import HBOLatencySensor
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_percentiles_over_rolling_window(self):
+        histogram = LatencyHistogram(window=10)
+        for ms in range(1, 101):
+            histogram.add(float(ms))
+        summary = histogram.summary()
+        # Bara de 10 senaste (91..100) finns kvar i fönstret
+        self.assertEqual(summary["p50"], 95.0)
+        self.assertEqual(summary["p95"], 100.0)
+        self.assertEqual(summary["max"], 100.0)
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(sum(histogram.buckets.values()), 10)
+        self.assertEqual(histogram.buckets["<=100ms"], 10)
+
+    def test_stage_context_records_even_on_error(self):
+        instrumentation = Instrumentation()
+        with instrumentation.stage(STAGE_SCHEDULE_BUILD):
+            pass
+        with self.assertRaises(ValueError):
+            with instrumentation.stage(STAGE_SCHEDULE_BUILD):
+                raise ValueError()
+        self.assertEqual(instrumentation.summary()[STAGE_SCHEDULE_BUILD]["count"], 2)
+        self.assertNotIn(STAGE_TOTAL, instrumentation.summary())
+
+    def test_executor_queue_wait_is_not_counted_as_plan_time(self):
+        async def async_add_executor_job(func, *args):
+            await asyncio.sleep(0.05)  # Upptagen executor: jobbet står i kö
+            return func(*args)
+
+        hass = SimpleNamespace(async_add_executor_job=async_add_executor_job)
+        instrumentation = Instrumentation()
+        result = asyncio.run(instrumentation.async_run_in_executor(hass, lambda x: time.sleep(0.01) or x * 2, 21))
+        self.assertEqual(result, 42)
+        summary = instrumentation.summary()
+        self.assertGreaterEqual(summary[STAGE_EXECUTOR_WAIT]["last"], 45)
+        self.assertLess(summary[STAGE_PLAN]["last"], 45)
+        self.assertGreaterEqual(summary[STAGE_PLAN]["last"], 9)
+
+        def fail():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            asyncio.run(instrumentation.async_run_in_executor(hass, fail))
+        self.assertEqual(instrumentation.summary()[STAGE_PLAN]["count"], 2)
+
+    def test_latency_sensor_reports_total_p95(self):
+        coordinator = HomeBatteryOptimizerCoordinator(None, {})
+        sensor = HBOLatencySensor(coordinator, SimpleNamespace(entry_id="test", title="Test"))
+        self.assertIsNone(sensor.native_value)
+        for ms in (1.0, 2.0, 30.0):
+            coordinator.instrumentation.record(STAGE_TOTAL, ms)
+        self.assertEqual(sensor.native_value, 30.0)
+        self.assertEqual(sensor.extra_state_attributes["stages"][STAGE_TOTAL]["p50"], 2.0)
+        self.assertEqual(sensor.unique_id, "test_update_latency")
+
+
+if __name__ == '__main__':
+    unittest.main()
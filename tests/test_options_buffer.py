@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.number import NUMBER_DESCRIPTIONS, BatteryOptimizerNumber
+from custom_components.home_battery_optimizer.options_buffer import OptionsBuffer
+
+
+class FakeConfigEntries:
+    def __init__(self):
+        self.updates = []
+
+    def async_update_entry(self, entry, options):
+        self.updates.append(options)
+        entry.options = options
+
+
+class FakeHass:
+    def __init__(self):
+        self.config_entries = FakeConfigEntries()
+
+    def async_create_task(self, coro):
+        return asyncio.ensure_future(coro)
+
+
+class TestOptionsBuffer(unittest.TestCase):
+
+    def run_burst(self, changes, delay=0.02, max_delay=1.0, pause=0.0):
+        hass = FakeHass()
+        entry = SimpleNamespace(options={"min_profit": 10, "fleet_mode": True})
+        replans = []
+
+        async def replan():
+            replans.append(dict(entry.options))
+
+        async def scenario():
+            buffer = OptionsBuffer(hass, entry, on_flush=replan, delay=delay, max_delay=max_delay)
+            for key, value in changes:
+                buffer.async_set(key, value)
+                await asyncio.sleep(pause)
+            await asyncio.sleep(delay * 5)
+            return buffer
+
+        buffer = asyncio.run(scenario())
+        return hass.config_entries.updates, replans, buffer
+
+    def test_burst_gives_one_write_and_one_replan(self):
+        changes = [("min_profit", v) for v in range(11, 31)] + [("charging_on", True)]
+        updates, replans, buffer = self.run_burst(changes)
+        self.assertEqual(updates, [{"min_profit": 30, "fleet_mode": True, "charging_on": True}])
+        self.assertEqual(len(replans), 1)
+        self.assertEqual(replans[0]["min_profit"], 30)
+        self.assertEqual(buffer.stats, {"changes": 21, "flushes": 1, "writes": 1, "pending": 0})
+
+    def test_continuous_burst_is_flushed_by_max_delay(self):
+        changes = [("min_profit", v) for v in range(12)]
+        updates, replans, _ = self.run_burst(changes, delay=0.03, max_delay=0.05, pause=0.01)
+        self.assertGreaterEqual(len(updates), 2)
+        self.assertEqual(updates[-1]["min_profit"], 11)
+        self.assertEqual(len(replans), len(updates))
+
+    def test_unchanged_options_are_not_written(self):
+        updates, replans, buffer = self.run_burst([("min_profit", 20), ("min_profit", 10)])
+        self.assertEqual(updates, [])
+        self.assertEqual(len(replans), 1)
+        self.assertEqual(buffer.stats["flushes"], 1)
+
+
+class TestCoordinatorSetters(unittest.TestCase):
+
+    def test_number_applies_now_and_replans_once(self):
+        coordinator = HomeBatteryOptimizerCoordinator(None, {})
+        coordinator.options_buffer.delay = 0.02
+        rebuilds = []
+
+        async def rebuild():
+            rebuilds.append(coordinator.min_profit)
+        coordinator.update_scheduler._update_method = rebuild
+        entry = SimpleNamespace(entry_id="test", title="Test", options={})
+        numbers = {d.key: BatteryOptimizerNumber(coordinator, entry, d) for d in NUMBER_DESCRIPTIONS}
+
+        async def scenario():
+            for value in (12, 14, 16):
+                await numbers["min_profit"].async_set_native_value(value)
+            await numbers["max_battery_soc"].async_set_native_value(90)
+            await coordinator.async_set_charging(True)
+            self.assertEqual(rebuilds, [])
+            await asyncio.sleep(0.1)
+
+        asyncio.run(scenario())
+        self.assertEqual((coordinator.min_profit, coordinator.max_battery_soc, coordinator.charging_on), (16, 90, True))
+        self.assertEqual(coordinator.config["min_profit"], 16)
+        self.assertEqual(rebuilds, [16])
+        with self.assertRaises(ValueError):
+            coordinator.async_set_option("nordpool_entity", "sensor.other")
+
+
+    def test_only_options_flow_changes_need_reload(self):
+        entry = SimpleNamespace(data={"battery_entity": "sensor.soc"}, options={"planner_engine": "heuristic", "min_profit": 10})
+        coordinator = HomeBatteryOptimizerCoordinator(None, {**entry.data, **entry.options})
+        self.assertFalse(coordinator.needs_reload(entry))
+        # Setter-skrivning via options-bufferten: redan tillämpad, ingen omladdning
+        entry.options = {**entry.options, "min_profit": 25}
+        self.assertFalse(coordinator.needs_reload(entry))
+        entry.options = {**entry.options, "planner_engine": "dp"}
+        self.assertTrue(coordinator.needs_reload(entry))
+
+
+if __name__ == '__main__':
+    unittest.main()
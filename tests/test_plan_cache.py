@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.plan_cache import PlanCache, quantize_soc
+from custom_components.home_battery_optimizer.price_series import parse_nordpool
+
+
+def make_price_data(values):
+    t0 = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return parse_nordpool([{"value": v} for v in values], [], t0)
+
+
+class TestPlanCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = PlanCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)  # "b" är äldst och kastas
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats["hits"], 2)
+        self.assertEqual(cache.stats["misses"], 1)
+
+    def test_quantize_soc(self):
+        self.assertEqual(quantize_soc(50.1), quantize_soc(49.9))
+        self.assertNotEqual(quantize_soc(50.0), quantize_soc(51.0))
+
+    def test_coordinator_reuses_schedule(self):
+        coordinator = HomeBatteryOptimizerCoordinator(None, {"charging_on": True, "discharging_on": True})
+        coordinator.price_data = make_price_data([50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30])
+        coordinator.soc = 20.0
+        first = coordinator.build_full_schedule(force_all_unpassed=True)
+        coordinator.soc = 20.1
+        second = coordinator.build_full_schedule(force_all_unpassed=True)
+        self.assertIs(first, second)
+        self.assertEqual(coordinator.plan_cache.hits, 1)
+        coordinator.min_profit = 30
+        third = coordinator.build_full_schedule(force_all_unpassed=True)
+        self.assertIsNot(first, third)
+        self.assertEqual(coordinator.plan_cache.misses, 2)
+
+    def test_unknown_soc_is_not_planned(self):
+        coordinator = HomeBatteryOptimizerCoordinator(None, {"charging_on": True, "discharging_on": True})
+        coordinator.price_data = make_price_data([50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30])
+        self.assertIsNone(coordinator.build_full_schedule(force_all_unpassed=True))
+        self.assertEqual(len(coordinator.schedule), 0)
+        self.assertEqual(coordinator.plan_cache.stats["entries"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+"""
+Planner benchmarks over generated and recorded price corpora.
+
+Run as a test for the regression gate, or directly for a report:
+    python -m tests.test_planner_benchmark [--update-baseline]
+"""
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+import unittest
+from datetime import datetime
+
+from custom_components.home_battery_optimizer.const import PLANNER_DP, PLANNER_HEURISTIC
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.planner import build_heuristic_schedule
+from custom_components.home_battery_optimizer.price_series import PriceSeries
+from custom_components.home_battery_optimizer.schedule_store import SlotCalendar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+RECORDED_FILE = os.path.join(ROOT, "data", "price_data.json")
+
+SIZES = (24, 48, 96, 192, 672)
+SLOT_SECONDS = 900  # Alla korpusar i kvartsupplösning, så storleken är det enda som varierar
+# Tillåten ökning av skalningsexponenten innan gaten fäller (tidsmätning är brusig)
+TIME_TOLERANCE = 0.5
+ALLOC_TOLERANCE = 0.25
+MIN_SAMPLE_SECONDS = 0.002
+ALLOC_FLOOR = 1024  # Allokeringar under 1 kB är fasta kostnader/brus, räknas som 1 kB
+
+
+def _hour_of(i):
+    return (i * SLOT_SECONDS / 3600) % 24
+
+
+def flat_prices(n, rnd):
+    return [50 + rnd.uniform(-3, 3) for _ in range(n)]
+
+
+def spiky_prices(n, rnd):
+    return [300 + rnd.uniform(0, 200) if rnd.random() < 0.05 else 40 + rnd.uniform(-10, 10) for _ in range(n)]
+
+
+def negative_prices(n, rnd):
+    # Solöverskott mitt på dagen trycker priset under noll
+    return [60 - 80 * max(0.0, math.sin(math.pi * (_hour_of(i) - 8) / 8)) + rnd.uniform(-5, 5) for i in range(n)]
+
+
+def double_peak_prices(n, rnd):
+    def peak(hour, center):
+        return math.exp(-((hour - center) ** 2) / 3)
+    return [30 + 100 * peak(_hour_of(i), 8) + 120 * peak(_hour_of(i), 19) + rnd.uniform(-5, 5) for i in range(n)]
+
+
+def recorded_prices(n, rnd):
+    # data/price_data.json (kr/kWh per timme) upprepad, i öre och med lite brus
+    with open(RECORDED_FILE) as f:
+        hourly = [item["price"] * 100 for item in json.load(f)["hourly_prices"]]
+    return [hourly[int(_hour_of(i))] + rnd.uniform(-1, 1) for i in range(n)]
+
+
+CORPORA = {
+    "flat": flat_prices,
+    "spiky": spiky_prices,
+    "negative": negative_prices,
+    "double_peak": double_peak_prices,
+    "recorded": recorded_prices,
+}
+
+
+def make_coordinator(prices, engine=PLANNER_HEURISTIC):
+    coordinator = HomeBatteryOptimizerCoordinator(None, {
+        "charging_on": True,
+        "discharging_on": True,
+        "planner_engine": engine,
+    })
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    coordinator.price_data = PriceSeries(SlotCalendar.uniform(start, SLOT_SECONDS, len(prices)), prices)
+    coordinator.soc = 20.0
+    return coordinator
+
+
+def _build(coordinator):
+    coordinator.plan_cache.clear()
+    coordinator.build_full_schedule(force_all_unpassed=True)
+
+
+def _heuristic(coordinator):
+    # Bara stepwise-heuristiken, utan plan-cache, kostnadsberäkning och SoC-koll runt omkring
+    inputs = coordinator.plan_inputs()
+    build_heuristic_schedule(inputs, *inputs.slot_steps())
+
+
+CASES = {
+    # namn: (förberedelse, mätt funktion)
+    "build_full_schedule[heuristic]": (make_coordinator, _build),
+    "build_full_schedule[dp]": (lambda prices: make_coordinator(prices, PLANNER_DP), _build),
+    "build_heuristic_schedule": (make_coordinator, _heuristic),
+}
+
+
+def measure(setup, func, prices, repeat):
+    """Return (best wall time in seconds, peak traced allocation in bytes)."""
+    coordinator = setup(prices)
+    # Som timeit: kör snabba fall flera gånger per mätning så att klockans upplösning inte dominerar
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func(coordinator)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(coordinator)
+        best = min(best, (time.perf_counter() - start) / number)
+    tracemalloc.start()
+    try:
+        func(coordinator)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def scaling_exponent(sizes, values):
+    """Least-squares slope of log(value) against log(size)."""
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(max(v, 1e-9)) for v in values]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    num = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    den = sum((x - mean_x) ** 2 for x in xs)
+    return num / den
+
+
+def run_benchmarks(sizes=SIZES, repeat=3, seed=0):
+    """Return {case: {corpus: {"time": [...], "alloc": [...], "time_exp", "alloc_exp"}}}."""
+    results = {}
+    for case, (setup, func) in CASES.items():
+        per_corpus = results[case] = {}
+        for corpus, generate in CORPORA.items():
+            times = []
+            allocs = []
+            for n in sizes:
+                prices = generate(n, random.Random(seed))
+                elapsed, peak = measure(setup, func, prices, repeat)
+                times.append(elapsed)
+                allocs.append(max(peak, ALLOC_FLOOR))
+            per_corpus[corpus] = {
+                "time": times,
+                "alloc": allocs,
+                "time_exp": round(scaling_exponent(sizes, times), 3),
+                "alloc_exp": round(scaling_exponent(sizes, allocs), 3),
+            }
+    return results
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return None
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+
+def write_baseline(results):
+    baseline = {
+        case: {corpus: {"time_exp": r["time_exp"], "alloc_exp": r["alloc_exp"]} for corpus, r in per_corpus.items()}
+        for case, per_corpus in results.items()
+    }
+    with open(BASELINE_FILE, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def regressions(results, baseline):
+    """Cases whose scaling exponent grew beyond the tolerance compared to the baseline."""
+    found = []
+    for case, per_corpus in results.items():
+        for corpus, r in per_corpus.items():
+            base = baseline.get(case, {}).get(corpus)
+            if base is None:
+                continue
+            if r["time_exp"] > base["time_exp"] + TIME_TOLERANCE:
+                found.append(f"{case}/{corpus}: time exponent {r['time_exp']} > {base['time_exp']}")
+            if r["alloc_exp"] > base["alloc_exp"] + ALLOC_TOLERANCE:
+                found.append(f"{case}/{corpus}: alloc exponent {r['alloc_exp']} > {base['alloc_exp']}")
+    return found
+
+
+def format_report(results, sizes=SIZES):
+    lines = [f"{'case':34} {'corpus':12} " + " ".join(f"{n:>9}" for n in sizes) + "   t-exp  a-exp  peak-kB"]
+    for case, per_corpus in results.items():
+        for corpus, r in per_corpus.items():
+            times = " ".join(f"{t * 1000:8.2f}m" for t in r["time"])
+            lines.append(f"{case:34} {corpus:12} {times}   {r['time_exp']:5.2f}  {r['alloc_exp']:5.2f}  {r['alloc'][-1] / 1024:7.1f}")
+    return "\n".join(lines)
+
+
+class TestPlannerBenchmark(unittest.TestCase):
+
+    def test_no_asymptotic_regression(self):
+        baseline = load_baseline()
+        if baseline is None:
+            self.skipTest("No benchmark baseline recorded")
+        results = run_benchmarks()
+        found = regressions(results, baseline)
+        self.assertFalse(found, "\n".join(found) + "\n\n" + format_report(results))
+
+    def test_scaling_exponent(self):
+        self.assertAlmostEqual(scaling_exponent([10, 100, 1000], [1, 100, 10000]), 2.0)
+
+
+if __name__ == '__main__':
+    if "--update-baseline" in sys.argv:
+        results = run_benchmarks(repeat=5)
+        write_baseline(results)
+    else:
+        results = run_benchmarks()
+    print(format_report(results))
@@ -0,0 +1,42 @@
+import random
+import unittest
+from array import array
+
+from custom_components.home_battery_optimizer.price_index import PriceIndex
+
+
+class TestPriceIndex(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(1)
+        # Få distinkta värden så att lika priser (tie-break) testas
+        self.values = array("d", [rnd.choice([10.0, 20.0, 20.0, 35.5, -4.0, 50.0]) for _ in range(37)])
+        self.index = PriceIndex(self.values)
+
+    def test_argmin_argmax_match_first_extreme(self):
+        values = self.values
+        for lo in range(len(values)):
+            for hi in range(lo, len(values)):
+                span = range(lo, hi + 1)
+                self.assertEqual(self.index.argmax(lo, hi), max(span, key=lambda i: values[i]))
+                self.assertEqual(self.index.argmin(lo, hi), min(span, key=lambda i: values[i]))
+
+    def test_k_selection_matches_stable_sort(self):
+        values = self.values
+        for lo, hi in [(0, 36), (3, 17), (20, 20), (10, 30)]:
+            span = list(range(lo, hi + 1))
+            for k in (0, 1, 3, len(span), len(span) + 5):
+                cheapest = sorted(span, key=lambda i: values[i])[:k]
+                dearest = sorted(span, key=lambda i: values[i], reverse=True)[:k]
+                self.assertEqual(self.index.k_smallest(lo, hi, k), cheapest)
+                self.assertEqual(self.index.k_largest(lo, hi, k), dearest)
+
+    def test_empty_and_single(self):
+        self.assertEqual(len(PriceIndex(array("d"))), 0)
+        single = PriceIndex(array("d", [7.0]))
+        self.assertEqual(single.argmax(0, 0), 0)
+        self.assertEqual(single.k_smallest(0, 0, 4), [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from datetime import datetime
+
+from custom_components.home_battery_optimizer.price_series import PriceSeriesCache, parse_nordpool
+
+
+class TestPriceSeries(unittest.TestCase):
+
+    def setUp(self):
+        self.base_time = datetime(2024, 5, 1)
+        self.attributes = {
+            "raw_today": [{"value": 10.0}, {"value": 20.0}],
+            "raw_tomorrow": [{"value": "30.5"}],
+        }
+
+    def test_parse(self):
+        series = parse_nordpool(self.attributes["raw_today"], self.attributes["raw_tomorrow"], self.base_time)
+        self.assertEqual(list(series.values), [10.0, 20.0, 30.5])
+        self.assertEqual(series.calendar.start_ts(0), self.base_time.timestamp())
+        self.assertEqual(series[2]["end"], "2024-05-01T03:00:00")
+
+    def test_cache_reuses_until_source_changes(self):
+        cache = PriceSeriesCache()
+        first = cache.get(self.attributes, self.base_time)
+        self.assertIs(cache.get(self.attributes, self.base_time), first)
+        # Nytt attribut-objekt men samma innehåll: ingen ny parse
+        self.assertIs(cache.get(dict(self.attributes), self.base_time), first)
+        self.assertEqual(cache.parses, 1)
+        changed = dict(self.attributes, raw_tomorrow=[{"value": 99.0}])
+        second = cache.get(changed, self.base_time)
+        self.assertIsNot(second, first)
+        self.assertNotEqual(second.digest, first.digest)
+        self.assertEqual(cache.parses, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
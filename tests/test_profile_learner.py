@@ -0,0 +1,130 @@
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from custom_components.home_battery_optimizer.planner import PlanInputs, plan
+from custom_components.home_battery_optimizer.price_series import PriceSeries
+from custom_components.home_battery_optimizer.profile_learner import (
+    CONSUMPTION,
+    SOLAR,
+    HourOfWeekProfile,
+    ProfileLearner,
+    ProfileStore,
+    hour_of_week,
+    local_hour,
+)
+from custom_components.home_battery_optimizer.schedule_store import SlotCalendar
+from homeassistant.util import dt as dt_util
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+MONDAY = datetime(2024, 5, 6).timestamp()
+
+
+class TestHourOfWeekProfile(unittest.TestCase):
+
+    def test_time_weighted_hour_mean(self):
+        profile = HourOfWeekProfile()
+        profile.observe(MONDAY, 1000)
+        profile.observe(MONDAY + 900, 3000)  # 15 min på 1000 W, sedan 45 min på 3000 W
+        profile.observe(MONDAY + 3600, 0)
+        self.assertAlmostEqual(profile.expected(MONDAY), 2500)
+        self.assertIsNone(profile.expected(MONDAY + 2 * 3600))
+
+    def test_ewma_over_weeks(self):
+        profile = HourOfWeekProfile(alpha=0.5)
+        week = 7 * 24 * 3600
+        for n, value in enumerate((1000, 2000)):
+            start = MONDAY + n * week
+            profile.observe(start, value)
+            profile.observe(start + 3600, value)
+        self.assertAlmostEqual(profile.expected(MONDAY), 1500)
+        self.assertEqual(profile.samples[hour_of_week(MONDAY)], 2)
+
+    def test_buckets_on_local_hour_and_weekday(self):
+        self.addCleanup(dt_util.set_default_time_zone, dt_util.DEFAULT_TIME_ZONE)
+        sunday_late_utc = datetime(2024, 5, 5, 23, 30, tzinfo=timezone.utc).timestamp()
+        dt_util.set_default_time_zone(dt_util.get_time_zone("Europe/Stockholm"))
+        # 23:30 UTC en söndag är 01:30 måndag i Stockholm (sommartid)
+        self.assertEqual(local_hour(sunday_late_utc), (1, sunday_late_utc - 1800))
+        dt_util.set_default_time_zone(dt_util.get_time_zone("Asia/Kolkata"))
+        # 05:00 måndag i Kolkata (UTC+5:30): timmen slutar 06:00 lokal tid, inte vid hel UTC-timme
+        profile = HourOfWeekProfile()
+        profile.observe(sunday_late_utc, 1000)
+        profile.observe(sunday_late_utc + 1800, 3000)
+        profile.observe(sunday_late_utc + 3600, 0)
+        self.assertEqual(hour_of_week(sunday_late_utc), 5)
+        self.assertAlmostEqual(profile.expected(sunday_late_utc), 2000)
+        self.assertEqual(profile.samples[5], 1)
+
+    def test_long_gap_does_not_hold_stale_value(self):
+        profile = HourOfWeekProfile()
+        profile.observe(MONDAY, 500)
+        profile.observe(MONDAY + 10 * 3600, 800)
+        self.assertAlmostEqual(profile.expected(MONDAY), 500)
+        # Timmarna däremellan fick inget värde
+        self.assertIsNone(profile.expected(MONDAY + 5 * 3600))
+
+
+class TestProfileLearner(unittest.TestCase):
+
+    def learned(self):
+        learner = ProfileLearner()
+        day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=7)
+        for hour in range(25):
+            ts = (day + timedelta(hours=hour)).timestamp()
+            learner.observe(CONSUMPTION, ts, 500)
+            learner.observe(SOLAR, ts, 4000 if 10 <= hour < 15 else 0)
+        return learner
+
+    def test_net_load_per_slot_and_persistence(self):
+        learner = self.learned()
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        calendar = SlotCalendar.uniform(start, 3600, 24)
+        net_load = learner.net_load(calendar)
+        self.assertEqual(net_load[0], 0.5)
+        self.assertEqual(net_load[12], -3.5)
+        restored = ProfileLearner()
+        restored.load(json.loads(json.dumps(learner.as_dict())))
+        self.assertEqual(restored.net_load(calendar), net_load)
+        self.assertIsNone(ProfileLearner().net_load(calendar))
+
+    def test_net_load_shrinks_charge_and_discharge(self):
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        prices = PriceSeries(SlotCalendar.uniform(start, 3600, 24), HOURLY)
+        inputs = PlanInputs(prices, 20.0)
+        plain, _ = plan(inputs)
+        # Litet hus (0,2 kWh/h) och solöverskott på förmiddagen
+        net_load = tuple(-2.0 if 8 <= i < 12 else 0.2 for i in range(24))
+        sized, _ = plan(inputs._replace(net_load=net_load))
+        self.assertLess(sum(sized.charge), sum(plain.charge))
+        self.assertLess(sum(sized.discharge), sum(plain.discharge))
+
+
+
+class FakeStore:
+
+    def __init__(self):
+        self.delayed = []
+
+    def async_delay_save(self, data_func, delay):
+        self.delayed.append(data_func)
+
+
+class TestProfileStore(unittest.TestCase):
+
+    def test_frequent_events_arm_one_save(self):
+        store = ProfileStore(None, "entry")
+        store._store = FakeStore()
+        learner = ProfileLearner()
+        for i in range(10):
+            learner.observe(CONSUMPTION, MONDAY + 5 * i, 1000)
+            store.async_schedule_save(learner)
+        # Timern startas inte om av varje event, så sparningen hinner köras
+        self.assertEqual(len(store._store.delayed), 1)
+        self.assertEqual(store._store.delayed[0](), learner.as_dict())
+        store.async_schedule_save(learner)
+        self.assertEqual(len(store._store.delayed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import math
+import unittest
+from datetime import datetime, timedelta
+
+from custom_components.home_battery_optimizer.schedule_store import (
+    ACTION_CHARGE,
+    ACTION_DISCHARGE,
+    ScheduleStore,
+    SlotCalendar,
+)
+
+
+class TestScheduleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.t0 = datetime(2024, 5, 1)
+        self.calendar = SlotCalendar.uniform(self.t0.timestamp(), 3600, 4)
+        self.store = ScheduleStore(self.calendar, [10.0, 5.0, 20.0, 30.0])
+
+    def test_defaults(self):
+        self.assertEqual(len(self.store), 4)
+        row = self.store[0]
+        self.assertEqual(row["action"], "idle")
+        self.assertIsNone(row["window"])
+        self.assertIsNone(row["estimated_soc"])
+        self.assertFalse(row["passed"])
+
+    def test_row_view_reads_columns(self):
+        self.store.action[1] = ACTION_CHARGE
+        self.store.charge[1] = 1
+        self.store.window[1] = 2
+        self.store.estimated_soc[1] = 55.5
+        row = self.store[1]
+        self.assertEqual(row.get("action"), "charge")
+        self.assertEqual(row.get("charge"), 1)
+        self.assertEqual(row.get("window"), 2)
+        self.assertEqual(row.get("estimated_soc"), 55.5)
+        self.assertEqual(row.get("start"), (self.t0 + timedelta(hours=1)).isoformat())
+        self.assertEqual(row.get("end"), (self.t0 + timedelta(hours=2)).isoformat())
+        self.assertEqual(row.get("missing", "x"), "x")
+
+    def test_calendar_from_price_data(self):
+        price_data = [
+            {"start": (self.t0 + timedelta(hours=i)).isoformat(), "end": (self.t0 + timedelta(hours=i + 1)).isoformat(), "value": 1.0}
+            for i in range(3)
+        ]
+        calendar = SlotCalendar.from_price_data(price_data)
+        self.assertEqual(len(calendar), 3)
+        self.assertEqual(calendar.end_ts(2) - calendar.start_ts(0), 3 * 3600)
+
+    def test_extra_columns(self):
+        column = self.store.add_column("charge_window_1", "b")
+        column[3] = 1
+        self.assertEqual(self.store[3]["charge_window_1"], 1)
+        self.assertTrue(math.isnan(self.store.add_column("estimated_soc_window_1")[0]))
+
+    def test_summarize_windows(self):
+        for i, (action, window) in enumerate([(ACTION_CHARGE, 1), (ACTION_CHARGE, 1), (ACTION_DISCHARGE, 1), (ACTION_DISCHARGE, 2)]):
+            self.store.action[i] = action
+            self.store.window[i] = window
+        windows = self.store.summarize_windows([50.0, 25.0, -40.0, -30.0], 0.1)
+        self.assertEqual([w["window"] for w in windows], [1, 2])
+        self.assertEqual((windows[0]["min_price"], windows[0]["max_price"]), (5.0, 20.0))
+        self.assertEqual(windows[0]["charged_kwh"], 7.5)
+        self.assertEqual(windows[0]["discharge_hours"], 1.0)
+        self.assertEqual(windows[0]["end"], (self.t0 + timedelta(hours=3)).isoformat())
+        self.assertIs(self.store.windows, windows)
+
+    def test_rows_and_empty(self):
+        self.assertEqual(len(self.store.rows()), 4)
+        self.assertFalse(ScheduleStore.empty())
+        with self.assertRaises(ValueError):
+            ScheduleStore(self.calendar, [1.0])
+
+
+class TestTimeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.t0 = datetime(2024, 5, 1).timestamp()
+        self.store = ScheduleStore(SlotCalendar.uniform(self.t0, 900, 8), [1.0] * 8)
+        for i, action in enumerate([0, 1, 1, 0, 2, 2, 0, 1]):
+            self.store.action[i] = action
+
+    def test_slot_lookup(self):
+        index = self.store.time_index
+        self.assertEqual(index.slot_of(self.t0), 0)
+        self.assertEqual(index.slot_of(self.t0 + 899), 0)
+        self.assertEqual(index.slot_of(self.t0 + 900 * 7 + 1), 7)
+        self.assertIsNone(index.slot_of(self.t0 - 1))
+        self.assertIsNone(index.slot_of(self.t0 + 900 * 8))
+        self.assertEqual(index.action_at(self.t0 + 900 * 4), "discharge")
+
+    def test_irregular_calendar_uses_bisect(self):
+        store = ScheduleStore(SlotCalendar([0, 3600, 4500, 9000]), [1.0, 2.0, 3.0])
+        self.assertEqual(store.time_index.slot_of(4499), 1)
+        self.assertEqual(store.time_index.slot_of(4500), 2)
+
+    def test_next_actions_and_periods(self):
+        index = self.store.time_index
+        self.assertEqual(index.next_action_after(self.t0), ("charge", self.t0 + 900))
+        self.assertEqual(index.next_start(self.t0 + 900, ACTION_DISCHARGE), self.t0 + 900 * 4)
+        self.assertEqual(index.next_start(self.t0 + 900, ACTION_CHARGE), self.t0 + 900 * 7)
+        self.assertEqual(index.next_action_after(self.t0 + 900 * 7), (None, None))
+        self.assertEqual(index.periods, [(ACTION_CHARGE, 1, 2), (ACTION_DISCHARGE, 4, 5), (ACTION_CHARGE, 7, 7)])
+
+    def test_index_cached_per_version(self):
+        index = self.store.time_index
+        self.assertIs(self.store.time_index, index)
+        version = self.store.version
+        self.store.invalidate()
+        self.assertNotEqual(self.store.version, version)
+        self.assertIsNot(self.store.time_index, index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.schedule_store import ACTION_CHARGE, ScheduleStore, SlotCalendar
+from custom_components.home_battery_optimizer.self_use_controller import SelfUseController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeLoop:
+    def __init__(self):
+        self.handles = []
+
+    def call_later(self, delay, callback):
+        handle = SimpleNamespace(delay=delay, callback=callback, cancelled=False)
+        handle.cancel = lambda: setattr(handle, "cancelled", True)
+        self.handles.append(handle)
+        return handle
+
+
+def state_event(entity_id, state):
+    return SimpleNamespace(data={"entity_id": entity_id, "new_state": SimpleNamespace(state=state)})
+
+
+def make_controller(next_charge=False):
+    coordinator = HomeBatteryOptimizerCoordinator(None, {
+        "self_usage_on": True,
+        "solar_entity": "sensor.solar",
+        "consumption_entity": "sensor.load",
+        "battery_power_entity": "sensor.battery_power",
+    })
+    coordinator.soc = 50.0
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    schedule = ScheduleStore(SlotCalendar.uniform(start, 3600, 48), [1.0] * 48)
+    if next_charge:
+        schedule.action[47] = ACTION_CHARGE
+    coordinator.schedule = schedule
+    writes = []
+    coordinator.async_write_ha_state_all = lambda: writes.append(coordinator._self_use_active)
+    clock = FakeClock()
+    controller = SelfUseController(coordinator, activate_after=60, deactivate_after=120, min_interval=5, clock=clock)
+    return controller, clock, writes
+
+
+class TestSelfUseController(unittest.TestCase):
+
+    def test_activates_only_after_condition_held(self):
+        controller, clock, writes = make_controller()
+        controller.async_handle_event(state_event("sensor.load", "300"))
+        clock.now += 5
+        controller.async_handle_event(state_event("sensor.solar", "800"))
+        self.assertFalse(controller.active)
+        clock.now += 30
+        controller.async_evaluate()
+        self.assertFalse(controller.active)
+        clock.now += 31
+        controller.async_evaluate()
+        self.assertTrue(controller.active)
+        self.assertEqual(writes, [True])
+
+    def test_flapping_sensor_does_not_toggle(self):
+        controller, clock, writes = make_controller()
+        controller.async_handle_event(state_event("sensor.load", "300"))
+        for step in range(20):
+            clock.now += 10
+            controller.async_handle_event(state_event("sensor.solar", "800" if step % 2 else "100"))
+        self.assertFalse(controller.active)
+        self.assertEqual(writes, [])
+
+    def test_events_within_interval_are_rate_limited(self):
+        controller, clock, _ = make_controller()
+        for _ in range(50):
+            clock.now += 0.1
+            controller.async_handle_event(state_event("sensor.battery_power", "1500"))
+        self.assertEqual(controller.events, 50)
+        self.assertEqual(controller.evaluations, 1)
+        self.assertEqual(controller.coordinator.current_power, 1500.0)
+
+    def test_switch_off_deactivates_immediately(self):
+        controller, clock, writes = make_controller(next_charge=True)
+        controller.async_handle_event(state_event("sensor.solar", "50"))
+        clock.now += 61
+        controller.async_evaluate()
+        self.assertTrue(controller.active)
+        controller.coordinator.self_usage_on = False
+        clock.now += 1
+        controller.async_evaluate()
+        self.assertFalse(controller.active)
+        self.assertEqual(writes, [True, False])
+
+    def test_earlier_deadline_replaces_pending_evaluation(self):
+        controller, clock, _ = make_controller()
+        loop = FakeLoop()
+        controller.coordinator.hass = SimpleNamespace(loop=loop)
+        controller._schedule(60)
+        clock.now += 1
+        controller._schedule(4)
+        self.assertTrue(loop.handles[0].cancelled)
+        self.assertEqual(loop.handles[1].delay, 4)
+        # En senare deadline lämnar den tidigare väntande utvärderingen kvar
+        controller._schedule(30)
+        self.assertEqual(len(loop.handles), 2)
+        self.assertFalse(loop.handles[1].cancelled)
+        loop.handles[1].callback()
+        self.assertIsNone(controller._deferred)
+        self.assertEqual(controller.evaluations, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
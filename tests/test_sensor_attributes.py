@@ -0,0 +1,74 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.const import ATTRIBUTES_COMPACT
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.price_series import parse_nordpool
+from custom_components.home_battery_optimizer.sensor import HBOScheduleSensor
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+
+
+def make_sensor(**config):
+    config.setdefault("charging_on", True)
+    config.setdefault("discharging_on", True)
+    coordinator = HomeBatteryOptimizerCoordinator(None, config)
+    base_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    coordinator.price_data = parse_nordpool([{"value": v} for v in HOURLY], [], base_time)
+    coordinator.soc = 20.0
+    coordinator.build_full_schedule(force_all_unpassed=True)
+    return coordinator, HBOScheduleSensor(coordinator, SimpleNamespace(entry_id="test", title="Test"))
+
+
+class TestSensorAttributes(unittest.TestCase):
+
+    def test_full_table_cached_per_schedule_version(self):
+        coordinator, sensor = make_sensor()
+        data = sensor.extra_state_attributes["data"]
+        self.assertEqual(len(data), 24)
+        self.assertIs(sensor.extra_state_attributes["data"], data)
+        coordinator.schedule.invalidate()
+        self.assertIsNot(sensor.extra_state_attributes["data"], data)
+
+    def test_compact_table_matches_full(self):
+        coordinator, sensor = make_sensor(attributes_mode=ATTRIBUTES_COMPACT)
+        compact = sensor.extra_state_attributes["data"]
+        full = sensor._get_data_table()
+        self.assertEqual(compact["slot_minutes"], 60)
+        self.assertEqual(compact["start"], full[0]["start"])
+        self.assertEqual([row["action"][0] for row in full], list(compact["action"]))
+        self.assertEqual([row["soc"] for row in full], compact["soc"])
+        self.assertEqual([row["window"] or 0 for row in full], compact["window"])
+
+    def test_charge_windows_from_planner_summary(self):
+        coordinator, sensor = make_sensor()
+        windows = sensor.extra_state_attributes["charge_windows"]
+        self.assertTrue(windows)
+        schedule = coordinator.schedule
+        for window in windows:
+            idxs = [i for i in range(len(schedule)) if schedule.window[i] == window["window"]]
+            self.assertEqual(window["start"], schedule[idxs[0]]["start"])
+            self.assertEqual(window["end"], schedule[idxs[-1]]["end"])
+            self.assertEqual(window["min_price"], min(schedule.price[i] for i in idxs))
+            self.assertEqual(window["max_price"], max(schedule.price[i] for i in idxs))
+        self.assertGreater(sum(w["charged_kwh"] for w in windows), 0)
+
+    def test_trim_passed_slots(self):
+        coordinator, sensor = make_sensor(trim_passed_slots=True)
+        data = sensor.extra_state_attributes["data"]
+        self.assertEqual(len(data), 24 - coordinator.schedule.calendar.passed_count(datetime.now().timestamp()))
+        self.assertIn("data", HBOScheduleSensor._unrecorded_attributes)
+
+    def test_diagnostic_counters_are_not_recorded(self):
+        _, sensor = make_sensor()
+        attrs = sensor.extra_state_attributes
+        for key in ("plan_cache", "planner_runs", "self_use", "load_profiles", "telemetry", "update_scheduler"):
+            self.assertIn(key, attrs)
+            self.assertIn(key, HBOScheduleSensor._unrecorded_attributes)
+        self.assertIn("soc", attrs)
+        self.assertNotIn("soc", HBOScheduleSensor._unrecorded_attributes)
+
+
+if __name__ == '__main__':
+    unittest.main()
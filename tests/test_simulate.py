@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from custom_components.home_battery_optimizer import simulate as simulate_module
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.dp_optimizer import schedule_cost
+from custom_components.home_battery_optimizer.planner import PlanInputs, plan
+from custom_components.home_battery_optimizer.price_series import PriceSeries
+from custom_components.home_battery_optimizer.schedule_store import ACTION_CHARGE, SlotCalendar
+from custom_components.home_battery_optimizer.simulate import (
+    _trajectory_python,
+    simulate,
+    soc_trajectories,
+)
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+
+
+def series(prices):
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    return PriceSeries(SlotCalendar.uniform(start, 3600, len(prices)), prices)
+
+
+class TestSocTrajectories(unittest.TestCase):
+
+    def test_matches_clipping_slot_by_slot(self):
+        starts = [90.0, 10.0, 50.0]
+        moves = [
+            [25, -25, -25, 25, 25, 25, -50],
+            [-25, -25, 25, 0, 25, 25, 25],
+            [10, 10, -5, 0, 0, 0, 0],
+        ]
+        lows, highs = [0.0, 5.0, 0.0], [100.0, 80.0, 100.0]
+        expected = [_trajectory_python(*row) for row in zip(starts, moves, lows, highs)]
+        result = soc_trajectories(starts, moves, lows, highs)
+        for row, want in zip(result, expected):
+            self.assertEqual([round(float(v), 6) for v in row], [round(v, 6) for v in want])
+
+    def test_without_numpy(self):
+        with mock.patch.object(simulate_module, "np", None):
+            rows = soc_trajectories([90.0], [[25, -25]], [0.0], [100.0])
+        self.assertEqual(rows, [[100.0, 75.0]])
+
+
+class TestSimulate(unittest.TestCase):
+
+    def test_batch_matches_single_plans(self):
+        base = PlanInputs(series(HOURLY), 20.0)
+        scenarios = [{}, {"min_profit": 40}, {"max_battery_soc": 80, "charge_rate": 50}, {}]
+        results = simulate(base, scenarios)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]["params"], {})
+        for scenario, result in zip(scenarios, results):
+            inputs = base._replace(**{simulate_module.SCENARIO_FIELDS[k]: v for k, v in scenario.items()})
+            schedule, _ = plan(inputs)
+            charge_step, discharge_step = inputs.slot_steps()
+            self.assertEqual(result["actions"], "".join("icd"[a] for a in schedule.action))
+            self.assertAlmostEqual(
+                result["cost"],
+                schedule_cost(schedule, inputs.soc, 0, charge_step, discharge_step, inputs.min_soc, inputs.max_soc, inputs.capacity_kwh),
+                places=1,
+            )
+        self.assertEqual(results[0], results[3])
+        self.assertLessEqual(max(results[2]["soc"]), 80)
+
+    def test_final_soc_matches_plan_with_learned_rates_and_net_load(self):
+        base = PlanInputs(
+            series(HOURLY), 20.0,
+            charge_curve=(40,) * 5 + (10,) * 5,
+            discharge_curve=(10,) * 5 + (30,) * 5,
+            net_load=(0.5,) * 8 + (-1.0,) * 6 + (1.0,) * 10,
+        )
+        schedule, _ = plan(base)
+        result = simulate(base, [{}])[0]
+        self.assertAlmostEqual(result["end_soc"], base.soc + sum(schedule.moved), places=2)
+        for i, action in enumerate(schedule.action):
+            if action == ACTION_CHARGE:  # estimated_soc är SoC efter laddslotten
+                self.assertAlmostEqual(result["soc"][i], schedule.estimated_soc[i], places=2)
+        # Med konstant steg hade de två första slotsen bara flyttat 25 % var
+        self.assertEqual(result["soc"][:2], [60.0, 70.0])
+
+    def test_invalid_scenarios(self):
+        base = PlanInputs(series(HOURLY), 20.0)
+        with self.assertRaises(ValueError):
+            simulate(base, [{"bogus": 1}])
+        with self.assertRaises(ValueError):
+            simulate(base, [{"min_battery_soc": 90, "max_battery_soc": 80}])
+        self.assertEqual(simulate(base, []), [])
+
+    def test_coordinator_state_is_untouched(self):
+        coordinator = HomeBatteryOptimizerCoordinator(None, {"min_profit": 10})
+        coordinator.soc = 30.0
+        coordinator.price_data = series(HOURLY)
+        coordinator.build_full_schedule(force_all_unpassed=True)
+        schedule, version = coordinator.schedule, coordinator.schedule.version
+        cached = len(coordinator.plan_cache)
+        results = asyncio.run(coordinator.async_simulate([{"min_profit": 5}], prices=[10, 200] * 12))
+        self.assertIn("c", results[0]["actions"])
+        self.assertIs(coordinator.schedule, schedule)
+        self.assertEqual(coordinator.schedule.version, version)
+        self.assertEqual(coordinator.min_profit, 10)
+        self.assertEqual(len(coordinator.plan_cache), cached)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.price_series import PriceSeries
+from custom_components.home_battery_optimizer.schedule_store import SlotCalendar
+from custom_components.home_battery_optimizer.snapshot import decode_snapshot, encode_snapshot
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+
+
+def planned_coordinator():
+    coordinator = HomeBatteryOptimizerCoordinator(None, {"charging_on": True, "discharging_on": True})
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    coordinator.price_data = PriceSeries(SlotCalendar.uniform(start, 3600, 24), HOURLY)
+    coordinator.soc = 20.0
+    coordinator.build_full_schedule(force_all_unpassed=True)
+    return coordinator
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.data = data
+
+    async def async_load(self):
+        return decode_snapshot(self.data)
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_round_trip_through_json(self):
+        coordinator = planned_coordinator()
+        data = json.loads(json.dumps(encode_snapshot(coordinator.price_data, coordinator.schedule, coordinator.planner_report)))
+        # Jämn kalender sparas som start + steg
+        self.assertEqual(set(data["calendar"]), {"start", "step", "count"})
+        price_data, schedule, report, _ = decode_snapshot(data)
+        self.assertEqual(price_data.digest, coordinator.price_data.digest)
+        self.assertEqual(list(schedule.action), list(coordinator.schedule.action))
+        self.assertEqual(list(schedule.charge), list(coordinator.schedule.charge))
+        self.assertEqual(list(schedule.window), list(coordinator.schedule.window))
+        self.assertEqual(schedule.windows, coordinator.schedule.windows)
+        self.assertEqual(report, coordinator.planner_report)
+
+    def test_expired_or_broken_snapshot_is_ignored(self):
+        coordinator = planned_coordinator()
+        data = encode_snapshot(coordinator.price_data, coordinator.schedule)
+        self.assertIsNone(decode_snapshot(data, now_ts=coordinator.price_data.calendar.bounds[-1]))
+        self.assertIsNone(decode_snapshot({"calendar": {"bounds": [0, 1]}, "prices": [1.0, 2.0]}))
+        self.assertIsNone(decode_snapshot(None))
+
+    def test_restore_marks_schedule_stale(self):
+        saved = planned_coordinator()
+        coordinator = HomeBatteryOptimizerCoordinator(None, {})
+        coordinator.snapshot = FakeSnapshot(encode_snapshot(saved.price_data, saved.schedule, saved.planner_report))
+        self.assertTrue(asyncio.run(coordinator.async_restore()))
+        self.assertTrue(coordinator.stale)
+        self.assertEqual(list(coordinator.schedule.action), list(saved.schedule.action))
+        self.assertEqual(len(coordinator.charge_periods), len(saved.schedule.time_index.periods) - len(coordinator.discharge_periods))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.coordinator import HomeBatteryOptimizerCoordinator
+from custom_components.home_battery_optimizer.number import NUMBER_DESCRIPTIONS, BatteryOptimizerNumber
+from custom_components.home_battery_optimizer.price_series import PriceSeries
+from custom_components.home_battery_optimizer.schedule_store import SlotCalendar
+from custom_components.home_battery_optimizer.sensor import HBOScheduleSensor
+from custom_components.home_battery_optimizer.subscriptions import EntitySubscriptions
+from custom_components.home_battery_optimizer.switch import SWITCH_DESCRIPTIONS, BatteryOptimizerSwitch
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+ENTRY = SimpleNamespace(entry_id="test", title="Test", options={})
+
+
+class FakeEntity:
+    def __init__(self, value):
+        self.value = value
+        self.writes = 0
+
+    def write(self):
+        self.writes += 1
+
+
+class TestEntitySubscriptions(unittest.TestCase):
+
+    def test_only_changed_values_are_written(self):
+        subscriptions = EntitySubscriptions()
+        a, b = FakeEntity(1), FakeEntity("on")
+        subscriptions.async_add(a, lambda: a.value, a.write)
+        subscriptions.async_add(b, lambda: b.value, b.write)
+        self.assertEqual(subscriptions.async_notify(), 0)
+        a.value = 2
+        self.assertEqual(subscriptions.async_notify(), 1)
+        self.assertEqual((a.writes, b.writes), (1, 0))
+        self.assertEqual((subscriptions.version(a), subscriptions.version(b)), (1, 0))
+        self.assertEqual(subscriptions.stats["skipped"], 3)
+
+    def test_one_registration_per_entity(self):
+        subscriptions = EntitySubscriptions()
+        entity = FakeEntity(1)
+        subscriptions.async_add(entity, lambda: entity.value, entity.write)
+        remove = subscriptions.async_add(entity, lambda: entity.value, entity.write)
+        self.assertEqual(len(subscriptions), 1)
+        entity.value = 2
+        subscriptions.async_notify()
+        self.assertEqual(entity.writes, 1)
+        remove()
+        self.assertEqual(len(subscriptions), 0)
+        self.assertIsNone(subscriptions.version(entity))
+
+    def test_failing_entity_does_not_stop_others(self):
+        subscriptions = EntitySubscriptions()
+        good = FakeEntity(1)
+        subscriptions.async_add("broken", lambda: 1 / 0, lambda: None)
+        subscriptions.async_add(good, lambda: good.value, good.write)
+        good.value = 2
+        with self.assertLogs("custom_components.home_battery_optimizer.subscriptions", "ERROR"):
+            self.assertEqual(subscriptions.async_notify(), 1)
+
+
+class TestCoordinatorNotification(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = HomeBatteryOptimizerCoordinator(None, {})
+        self.coordinator.soc = 20.0
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        self.coordinator.price_data = PriceSeries(SlotCalendar.uniform(start, 3600, 24), HOURLY)
+        self.coordinator.build_full_schedule(force_all_unpassed=True)
+        self.written = []
+        entities = [BatteryOptimizerNumber(self.coordinator, ENTRY, d) for d in NUMBER_DESCRIPTIONS]
+        entities += [BatteryOptimizerSwitch(self.coordinator, ENTRY, d) for d in SWITCH_DESCRIPTIONS]
+        entities.append(HBOScheduleSensor(self.coordinator, ENTRY))
+        self.entities = entities
+        # Ingen registrering i __init__
+        self.assertEqual(len(self.coordinator.subscriptions), 0)
+        for entity in entities:
+            entity.async_write_ha_state = lambda entity=entity: self.written.append(entity)
+            asyncio.run(entity.async_added_to_hass())
+
+    def test_each_entity_registered_once(self):
+        self.assertEqual(len(self.coordinator.subscriptions), len(self.entities))
+        asyncio.run(self.entities[0].async_added_to_hass())
+        self.assertEqual(len(self.coordinator.subscriptions), len(self.entities))
+
+    def test_rebuild_without_changes_writes_nothing(self):
+        self.assertEqual(self.coordinator.async_update_listeners(), 0)
+        self.assertEqual(self.written, [])
+
+    def test_only_the_changed_number_is_written(self):
+        self.coordinator.min_profit = 25
+        self.coordinator.async_update_listeners()
+        self.assertEqual([entity.name for entity in self.written], ["Min Profit"])
+
+    def test_self_use_writes_only_the_sensor(self):
+        self.coordinator._self_use_active = True
+        self.coordinator.async_write_ha_state_all()
+        self.assertEqual([type(entity) for entity in self.written], [HBOScheduleSensor])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import math
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from custom_components.home_battery_optimizer.backtest import DEFAULT_PARAMS, backtest_days, iter_days, read_prices
+from custom_components.home_battery_optimizer.sweep import (
+    DEFAULT_GRID,
+    SharedPrices,
+    param_grid,
+    param_samples,
+    run_sweep,
+)
+
+
+def write_csv(path, start, hours):
+    with open(path, "w") as f:
+        f.write("start,price\n")
+        for h in range(hours):
+            t = start + timedelta(hours=h)
+            f.write(f"{t.isoformat()},{50 + 40 * math.sin(math.pi * (t.hour - 6) / 12):.2f}\n")
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tmp.name, "prices.csv")
+        write_csv(self.csv, datetime(2024, 1, 30), 24 * 4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_grid_and_samples(self):
+        self.assertEqual(len(list(param_grid({"a": [1, 2], "b": [3, 4, 5]}))), 6)
+        for params in param_samples(20):
+            for key, values in DEFAULT_GRID.items():
+                self.assertTrue(min(values) <= params[key] <= max(values))
+
+    def test_shared_prices_roundtrip(self):
+        days = list(iter_days(read_prices(self.csv)))
+        shared = SharedPrices.create(days)
+        try:
+            attached = SharedPrices.attach(shared.descriptor)
+            shared_days = attached.days()
+            for (date, bounds, prices), (s_date, s_bounds, s_prices) in zip(days, shared_days):
+                self.assertEqual(date, s_date)
+                self.assertEqual(list(bounds), list(s_bounds))
+                self.assertEqual(list(prices), list(s_prices))
+            self.assertEqual(backtest_days(days), backtest_days(shared_days))
+            # Vyerna måste släppas innan blocket kan stängas
+            del shared_days, s_bounds, s_prices
+            attached.close()
+        finally:
+            shared.close()
+
+    def test_sweep_ranks_by_savings(self):
+        candidates = [
+            {"min_profit": 5.0},
+            {"min_profit": 200.0},
+            {"min_battery_soc": 50.0, "max_battery_soc": 40.0},  # ogiltig, hoppas över
+        ]
+        results = run_sweep(self.csv, candidates, {"soc": 20.0}, workers=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual([r["rank"] for r in results], [1, 2])
+        self.assertGreaterEqual(results[0]["savings"], results[1]["savings"])
+        self.assertEqual(results[0]["params"]["min_profit"], 5.0)
+        days = list(iter_days(read_prices(self.csv)))
+        expected = backtest_days(days, {**DEFAULT_PARAMS, "soc": 20.0, "min_profit": 5.0})
+        self.assertEqual(results[0]["savings"], expected["savings"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import unittest
+from datetime import datetime
+
+from custom_components.home_battery_optimizer.planner import PlanInputs, RateCurve, plan
+from custom_components.home_battery_optimizer.price_series import PriceSeries
+from custom_components.home_battery_optimizer.schedule_store import SlotCalendar
+from custom_components.home_battery_optimizer.telemetry import BANDS, CHARGE, DISCHARGE, RateModel, RateStore
+
+HOURLY = [50, 40, 30, 20, 30, 60, 90, 100, 80, 60, 40, 30, 20, 25, 40, 70, 110, 120, 90, 60, 50, 40, 35, 30]
+
+
+def charge_session(model, ts, soc, power, rate_at, until, step=60):
+    """Simulate charging (power W, rate_at(soc) %/hour) with one sample per step seconds."""
+    model.observe(ts, soc=soc, power=power)
+    while soc < until:
+        ts += step
+        soc += rate_at(soc) * step / 3600
+        model.observe(ts, soc=soc)
+    return ts, soc
+
+
+def tapering(soc):
+    return 20.0 if soc < 80 else 5.0
+
+
+class TestRateModel(unittest.TestCase):
+
+    def test_learns_tapering_charge_rate_per_band(self):
+        model = RateModel()
+        charge_session(model, 0, 10.0, 3000, tapering, 99)
+        rates = model.band_rates(CHARGE)
+        self.assertAlmostEqual(rates[5], 20.0, places=1)
+        self.assertAlmostEqual(rates[9], 5.0, places=1)
+        self.assertIsNone(rates[0])
+        self.assertTrue(all(rate is None for rate in model.band_rates(DISCHARGE)))
+        curve = model.curve(CHARGE, 25)
+        self.assertEqual(len(curve), BANDS)
+        self.assertEqual((curve[0], curve[5], curve[9]), (25.0, 20.0, 5.0))
+        self.assertIsNone(RateModel().curve(CHARGE, 25))
+
+    def test_power_sign_is_detected_from_soc_change(self):
+        model = RateModel()
+        # Negativ effekt = laddning i den här integrationen
+        ts, soc = charge_session(model, 0, 20.0, -2500, tapering, 60)
+        model.observe(ts + 60, power=1500)
+        for n in range(60):
+            soc -= 0.5
+            model.observe(ts + 120 + 60 * n, soc=soc)
+        self.assertAlmostEqual(model.band_rates(CHARGE)[3], 20.0, places=1)
+        self.assertAlmostEqual(model.band_rates(DISCHARGE)[4], 30.0, places=0)
+
+    def test_ring_buffer_is_bounded_and_forgets(self):
+        model = RateModel(size=100)
+        ts, _ = charge_session(model, 0, 10.0, 3000, lambda soc: 20.0, 50)
+        self.assertEqual(model.count, 100)
+        # Nya data med annan rate tar över när de gamla intervallen skrivits över
+        charge_session(model, ts + 3600, 10.0, 3000, lambda soc: 10.0, 40)
+        self.assertAlmostEqual(model.band_rates(CHARGE)[2], 10.0, places=1)
+        self.assertEqual(model.count, 100)
+
+    def test_idle_and_gaps_are_ignored(self):
+        model = RateModel()
+        model.observe(0, soc=50.0, power=20)
+        model.observe(600, soc=50.0)
+        model.observe(700, power=3000)
+        model.observe(7000, soc=80.0)
+        self.assertEqual(model.count, 0)
+
+    def test_persistence_round_trip(self):
+        model = RateModel(size=50)
+        charge_session(model, 0, 10.0, 3000, tapering, 99)
+        restored = RateModel(size=50)
+        restored.load(json.loads(json.dumps(model.as_dict())))
+        self.assertEqual(restored.curve(CHARGE, 25), model.curve(CHARGE, 25))
+        with self.assertRaises(ValueError):
+            RateModel().load({"key": [99], "hours": [0.1], "delta": [1.0]})
+
+
+class TestRateCurve(unittest.TestCase):
+
+    def test_constant_matches_slots_needed(self):
+        curve = RateCurve(25.0)
+        self.assertEqual(curve.at(95), 25.0)
+        self.assertEqual(curve.slots(20, 80), 4)
+
+    def test_tapering_needs_more_slots(self):
+        curve = RateCurve(25.0, (40.0,) * 8 + (10.0, 10.0))
+        self.assertEqual(curve.at(85), 10.0)
+        # 40 -> 80 i en slot, sedan bara 10 % per slot upp till 100
+        self.assertEqual(curve.slots(40, 60), 3)
+        self.assertEqual(RateCurve(40.0).slots(40, 60), 2)
+        # Urladdning från 90: två långsamma slots innan bandet under 80
+        self.assertEqual(curve.slots(90, 40, -1), 3)
+
+    def test_planner_uses_curve(self):
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        prices = PriceSeries(SlotCalendar.uniform(start, 3600, 24), HOURLY)
+        inputs = PlanInputs(prices, 20.0)
+        constant, _ = plan(inputs)
+        tapered, _ = plan(inputs._replace(charge_curve=(25.0,) * 6 + (5.0,) * 4))
+        self.assertEqual(plan(inputs._replace(charge_curve=(25.0,) * BANDS))[0].action, constant.action)
+        self.assertGreater(sum(tapered.charge), sum(constant.charge))
+        self.assertNotEqual(inputs.fingerprint(), inputs._replace(charge_curve=(25.0,) * BANDS).fingerprint())
+
+
+
+class FakeStore:
+
+    def __init__(self):
+        self.delayed = []
+
+    def async_delay_save(self, data_func, delay):
+        self.delayed.append(data_func)
+
+
+class TestRateStore(unittest.TestCase):
+
+    def test_frequent_events_arm_one_save(self):
+        store = RateStore(None, "entry")
+        store._store = FakeStore()
+        model = RateModel()
+        for i in range(10):
+            model.observe(datetime(2024, 5, 6).timestamp() + 5 * i, soc=50 + i, power=1000)
+            store.async_schedule_save(model)
+        self.assertEqual(len(store._store.delayed), 1)
+        self.assertEqual(store._store.delayed[0](), model.as_dict())
+        store.async_schedule_save(model)
+        self.assertEqual(len(store._store.delayed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
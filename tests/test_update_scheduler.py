@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from custom_components.home_battery_optimizer.update_scheduler import UpdateScheduler
+
+
+def state_event(entity_id, state):
+    return SimpleNamespace(data={"entity_id": entity_id, "new_state": SimpleNamespace(state=state)})
+
+
+class TestUpdateScheduler(unittest.TestCase):
+
+    def test_burst_is_coalesced_and_deadband_drops_noise(self):
+        calls = []
+
+        async def update():
+            calls.append(1)
+
+        async def scenario():
+            scheduler = UpdateScheduler(update, debounce_seconds=0.01, deadbands={"sensor.soc": 0.5})
+            for value in ["50", "50.2", "50.4", "51", "51.1", "60"]:
+                scheduler.async_handle_event(state_event("sensor.soc", value))
+            scheduler.async_handle_event(state_event("sensor.price", "1.0"))
+            await asyncio.sleep(0.05)
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(scheduler.stats["events_received"], 7)
+        self.assertEqual(scheduler.stats["events_dropped"], 3)
+        self.assertEqual(scheduler.stats["collapse_ratio"], 7.0)
+
+    def test_single_flight_with_one_queued_run(self):
+        running = []
+        max_running = []
+
+        async def update():
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        async def scenario():
+            scheduler = UpdateScheduler(update)
+            await asyncio.gather(*(scheduler.async_run() for _ in range(5)))
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        # En körning + en köad som täcker de fyra anropen som kom under tiden
+        self.assertEqual(scheduler.rebuilds, 2)
+        self.assertEqual(max(max_running), 1)
+
+    def test_reentrant_call_queues_instead_of_deadlocking(self):
+        calls = []
+
+        async def update():
+            calls.append(1)
+            if len(calls) == 1:
+                await scheduler.async_run()
+
+        scheduler = UpdateScheduler(update)
+        asyncio.run(asyncio.wait_for(scheduler.async_run(), 1))
+        self.assertEqual(len(calls), 2)
+
+    def test_failing_update_does_not_block_waiters(self):
+        async def update():
+            raise RuntimeError("boom")
+
+        async def scenario():
+            scheduler = UpdateScheduler(update)
+            await asyncio.wait_for(asyncio.gather(scheduler.async_run(), scheduler.async_run()), 1)
+            return scheduler
+
+        self.assertEqual(asyncio.run(scenario()).rebuilds, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()